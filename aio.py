@@ -0,0 +1,178 @@
+import asyncio
+import os
+import weakref
+from collections import namedtuple
+from contextlib import asynccontextmanager
+
+from sqlalchemy import event, select
+from sqlalchemy.pool import StaticPool
+
+from cache import identity_cache
+from database import DATABASE_URL, _apply_pragmas, _is_memory
+
+#upper bound on connections (and so on concurrent queries) for the async api
+MAX_CONNECTIONS = int(os.environ.get("CRIME_ASYNC_MAX_CONNECTIONS", 10))
+
+#where configure() points the async api; each event loop builds its own engine from this on first use
+_settings = {"url": None, "max_connections": MAX_CONNECTIONS}
+#aiosqlite connections and asyncio semaphores belong to the loop that created them, so every loop (each
+#asyncio.run(), say) gets its own engine, sessionmaker and semaphore. the engine is disposed when the
+#loop shuts down (see _dispose_at_shutdown): each aiosqlite connection holds a thread that would
+#otherwise keep the interpreter from exiting
+_LoopState = namedtuple("_LoopState", ["engine", "sessionmaker", "semaphore", "finalizer"])
+_loops = weakref.WeakKeyDictionary()
+#disposals scheduled by configure(), kept referenced until they finish
+_disposing = set()
+
+
+def async_url(url):
+    #sqlite:///crime.db -> sqlite+aiosqlite:///crime.db
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    return url
+
+
+def make_async_engine(url=None, max_connections=MAX_CONNECTIONS):
+    #imported here so the sync app never needs aiosqlite installed
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = url or DATABASE_URL
+    kwargs = {}
+    if _is_memory(url):
+        kwargs["poolclass"] = StaticPool
+    else:
+        kwargs["pool_size"] = max_connections
+        kwargs["max_overflow"] = 0
+    new_engine = create_async_engine(async_url(url), **kwargs)
+    event.listen(new_engine.sync_engine, "connect", _apply_pragmas)
+    return new_engine
+
+
+def _dispose_later(loop, engine):
+    #engines can only be closed on their own loop: this one's gets a task, another thread's loop gets the
+    #coroutine handed over, and a closed loop has already disposed its engine at shutdown
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if loop is running:
+        task = loop.create_task(engine.dispose())
+        _disposing.add(task)
+        task.add_done_callback(_disposing.discard)
+    elif not loop.is_closed():
+        asyncio.run_coroutine_threadsafe(engine.dispose(), loop)
+
+
+def configure(url=None, max_connections=MAX_CONNECTIONS):
+    #points the async api at another database or connection cap; every loop builds a new engine on next
+    #use, and the engines it replaces are disposed
+    _settings.update(url=url, max_connections=max_connections)
+    for loop, state in list(_loops.items()):
+        _dispose_later(loop, state.engine)
+    _loops.clear()
+
+
+async def _dispose_at_shutdown(loop, engine):
+    #an async generator left suspended: the loop closes every such generator when it shuts down
+    #(asyncio.run() does, via shutdown_asyncgens), which runs the finally
+    try:
+        yield
+    finally:
+        state = _loops.get(loop)
+        if state is not None and state.engine is engine:
+            del _loops[loop]
+        await engine.dispose()
+
+
+def _loop_state():
+    loop = asyncio.get_running_loop()
+    state = _loops.get(loop)
+    if state is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        engine = make_async_engine(_settings["url"], _settings["max_connections"])
+        finalizer = _dispose_at_shutdown(loop, engine)
+        #first step registers the generator with the loop (it stops at the yield)
+        loop.create_task(finalizer.asend(None))
+        state = _LoopState(engine, async_sessionmaker(engine, expire_on_commit=False),
+                           asyncio.Semaphore(_settings["max_connections"]), finalizer)
+        _loops[loop] = state
+    return state
+
+
+def get_engine():
+    #the running loop's async engine
+    return _loop_state().engine
+
+
+async def dispose():
+    #closes the running loop's connections now rather than at loop shutdown
+    state = _loops.pop(asyncio.get_running_loop(), None)
+    if state is not None:
+        await state.engine.dispose()
+
+
+#async unit of work: waits for a free connection slot, commits on success, rolls back on error
+@asynccontextmanager
+async def session_scope():
+    state = _loop_state()
+    async with state.semaphore:
+        async with state.sessionmaker() as session:
+            try:
+                yield session
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+
+
+@asynccontextmanager
+async def use_session(session=None):
+    if session is not None:
+        yield session
+    else:
+        async with session_scope() as own:
+            yield own
+
+
+async def add(model, session=None, **fields):
+    async with use_session(session) as s:
+        obj = model(**fields)
+        s.add(obj)
+        await s.flush()
+    identity_cache.invalidate(model, obj.id)
+    return obj
+
+
+async def get_all(model, session=None):
+    async with use_session(session) as s:
+        return (await s.scalars(select(model))).all()
+
+
+async def _get_archived(model, obj_id):
+    #archive lookups are synchronous sqlite work, so they run in a worker thread
+    return await asyncio.get_running_loop().run_in_executor(None, model._get_archived, obj_id)
+
+
+async def find_by_id(model, obj_id, session=None):
+    #like ModelMixin._get: a caller's session reads through, then the cache, then the archive
+    if session is not None:
+        return await session.get(model, obj_id) or await _get_archived(model, obj_id)
+    obj = identity_cache.get(model, obj_id)
+    if obj is None:
+        async with session_scope() as s:
+            obj = await s.get(model, obj_id)
+        if obj is None:
+            obj = await _get_archived(model, obj_id)
+        identity_cache.put(model, obj_id, obj)
+    return obj
+
+
+async def delete(model, obj_id, session=None):
+    async with use_session(session) as s:
+        obj = await s.get(model, obj_id)
+        if obj is None:
+            return False
+        await s.delete(obj)
+    identity_cache.invalidate(model, obj_id)
+    return True
@@ -0,0 +1,190 @@
+import os
+
+from sqlalchemy import Column, Index, MetaData, Table
+
+from cache import identity_cache
+from database import Session, engine
+from models import Case, Suspect, Evidence, CriminalRecord, Detective, detective_case
+
+#closed cases past the retention threshold live in a second sqlite file, attached under this name
+SCHEMA = "archive"
+BATCH_SIZE = 1000
+
+#a case moves as a unit: its row, suspects, their records, evidence and detective links.
+#table -> rows belonging to the cases in {ids}, in {db}; listed parents first
+UNITS = [
+    ("cases", "id IN ({ids})"),
+    ("suspects", "case_id IN ({ids})"),
+    ("criminal_records", "suspect_id IN (SELECT id FROM {db}.suspects WHERE case_id IN ({ids}))"),
+    ("evidence", "case_id IN ({ids})"),
+    ("detective_case", "case_id IN ({ids})"),
+]
+SOURCE_TABLES = {t.name: t for t in (Case.__table__, Suspect.__table__, CriminalRecord.__table__,
+                                     Evidence.__table__, detective_case)}
+COLUMNS = {name: [c.name for c in table.columns] for name, table in SOURCE_TABLES.items()}
+KEYS = {name: [c.name for c in table.primary_key.columns] for name, table in SOURCE_TABLES.items()}
+#tables whose ids the hot database must never reuse (they autoincrement)
+ID_TABLES = [name for name in COLUMNS if KEYS[name] == ["id"]]
+
+#the archive copies columns and indexes but no foreign keys: detectives stay in the hot database,
+#and rows only ever arrive or leave as whole cases
+archive_metadata = MetaData(schema=SCHEMA)
+for _table in SOURCE_TABLES.values():
+    _archived_table = Table(_table.name, archive_metadata,
+                            *[Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable) for c in _table.columns])
+    for _index in _table.indexes:
+        Index(_index.name, *[_archived_table.c[c.name] for c in _index.columns])
+
+
+def archive_path(bind=None):
+    #CRIME_ARCHIVE_PATH, else "<database>_archive.db" next to a file database; None for in-memory ones
+    if os.environ.get("CRIME_ARCHIVE_PATH"):
+        return os.environ["CRIME_ARCHIVE_PATH"]
+    database = (bind or engine).url.database
+    if not database or database == ":memory:":
+        return None
+    root, ext = os.path.splitext(database)
+    return f"{root}_archive{ext or '.db'}"
+
+
+def attach(conn, path=None):
+    #attaches the archive to this connection (creating its tables the first time); sqlite only allows
+    #ATTACH outside a transaction, so call this before conn.begin()
+    path = path or archive_path(conn.engine)
+    if path is None:
+        raise ValueError("No archive for an in-memory database; set CRIME_ARCHIVE_PATH")
+    attached = {row[1] for row in conn.exec_driver_sql("PRAGMA database_list")}
+    if SCHEMA not in attached:
+        conn.exec_driver_sql(f"ATTACH DATABASE ? AS {SCHEMA}", (path,))
+        conn.exec_driver_sql(f"PRAGMA {SCHEMA}.journal_mode=WAL")
+        archive_metadata.create_all(conn)
+        #columns added to the hot tables since the archive file was created
+        for table in archive_metadata.sorted_tables:
+            present = {row[1] for row in conn.exec_driver_sql(f"PRAGMA {SCHEMA}.table_info({table.name})")}
+            for column in table.columns:
+                if column.name not in present:
+                    conn.exec_driver_sql(f"ALTER TABLE {SCHEMA}.{table.name} ADD COLUMN {column.name} "
+                                         f"{column.type.compile(conn.dialect)}")
+        _reserve_archived_ids(conn)
+    conn.commit()
+
+
+def _reserve_archived_ids(conn):
+    #archived ids count as used: the hot tables' AUTOINCREMENT counters are moved past them, which matters
+    #for archives that hold rows from before the tables autoincremented
+    if not conn.exec_driver_sql("SELECT 1 FROM main.sqlite_master WHERE name = 'sqlite_sequence'").first():
+        return
+    for name in ID_TABLES:
+        highest = conn.exec_driver_sql(f"SELECT max(id) FROM {SCHEMA}.{name}").scalar()
+        if highest is None:
+            continue
+        conn.exec_driver_sql("INSERT INTO main.sqlite_sequence (name, seq) SELECT ?, 0 WHERE NOT EXISTS "
+                             "(SELECT 1 FROM main.sqlite_sequence WHERE name = ?)", (name, name))
+        conn.exec_driver_sql("UPDATE main.sqlite_sequence SET seq = ? WHERE name = ? AND seq < ?",
+                             (highest, name, highest))
+
+
+def _copy(conn, source, target, ids):
+    #plain INSERTs. a row whose key is already in the target is only skipped when it is identical there:
+    #with WAL the two files commit separately, so an interrupted move leaves exact copies behind to be
+    #copied again. any other clash is a different row under the same id, and the move stops
+    marks = ", ".join("?" * len(ids))
+    for name, where in UNITS:
+        columns = ", ".join(COLUMNS[name])
+        condition = where.format(db=source, ids=marks)
+        if target == "main" and name == "detective_case":
+            #a detective deleted while the case was archived loses the link
+            condition += " AND detective_id IN (SELECT id FROM main.detectives)"
+        params = tuple(ids) * where.count("{ids}")
+        same_key = " AND ".join(f"t.{c} = s.{c}" for c in KEYS[name])
+        same_row = " AND ".join(f"t.{c} IS s.{c}" for c in COLUMNS[name])
+        clash = conn.exec_driver_sql(
+            f"SELECT {', '.join(KEYS[name])} FROM {source}.{name} s WHERE {condition} "
+            f"AND EXISTS (SELECT 1 FROM {target}.{name} t WHERE {same_key}) "
+            f"AND NOT EXISTS (SELECT 1 FROM {target}.{name} t WHERE {same_row}) LIMIT 1", params).first()
+        if clash is not None:
+            key = ", ".join(f"{c} {v}" for c, v in zip(KEYS[name], clash))
+            place = "the archive" if target == SCHEMA else "the hot database"
+            raise ValueError(f"{name} row ({key}) already exists in {place} with different contents; "
+                             f"nothing was moved")
+        conn.exec_driver_sql(f"INSERT INTO {target}.{name} ({columns}) SELECT {columns} FROM {source}.{name} s "
+                             f"WHERE {condition} AND NOT EXISTS (SELECT 1 FROM {target}.{name} t WHERE {same_key})",
+                             params)
+
+
+def _delete(conn, source, ids):
+    #children first; returns {table: rows deleted}
+    marks = ", ".join("?" * len(ids))
+    counts = {}
+    for name, where in reversed(UNITS):
+        result = conn.exec_driver_sql(f"DELETE FROM {source}.{name} WHERE {where.format(db=source, ids=marks)}",
+                                      tuple(ids) * where.count("{ids}"))
+        counts[name] = result.rowcount
+    return counts
+
+
+def archive_cases(before, status="Closed", batch_size=BATCH_SIZE, bind=None, progress=None):
+    #moves cases with this status dated before `before` into the archive, batch_size cases per
+    #transaction; returns {table: rows moved}. ValueError if an id is already archived with other contents
+    bind = bind or engine
+    totals = {name: 0 for name, _ in UNITS}
+    with bind.connect() as conn:
+        attach(conn)
+        while True:
+            with conn.begin():
+                #moved rows leave the hot table, so every batch is simply the first matches on the index
+                ids = [row[0] for row in conn.exec_driver_sql(
+                    "SELECT id FROM main.cases WHERE status = ? AND date < ? ORDER BY date, id LIMIT ?",
+                    (status, str(before), batch_size))]
+                if not ids:
+                    break
+                _copy(conn, "main", SCHEMA, ids)
+                #the hot-side delete goes through Case.purge so the cache is invalidated the usual way
+                with Session(bind=conn) as session:
+                    counts = Case.purge(case_ids=ids, session=session)
+            for name, count in counts.items():
+                totals[name] += count
+            if progress:
+                progress(totals)
+    return totals
+
+
+def restore(case_ids, bind=None):
+    #moves archived cases (with everything archived alongside them) back into the hot database;
+    #returns {table: rows restored}. ValueError if one of their ids is in use in the hot database
+    bind = bind or engine
+    ids = list(case_ids)
+    if not ids:
+        return {}
+    with bind.connect() as conn:
+        attach(conn)
+        with conn.begin():
+            _copy(conn, SCHEMA, "main", ids)
+            counts = _delete(conn, SCHEMA, ids)
+    for model in (Case, Suspect, Evidence, CriminalRecord, Detective):
+        identity_cache.invalidate_model(model)
+    return counts
+
+
+def find_by_id(model, obj_id, bind=None):
+    #loads an archived row as a detached model object (None if it is not there)
+    bind = bind or engine
+    path = archive_path(bind)
+    if path is None or not os.path.exists(path):
+        return None
+    with bind.connect() as conn:
+        attach(conn, path)
+        #the same mapped classes, reading the archive's copies of their tables
+        with Session(bind=conn.execution_options(schema_translate_map={None: SCHEMA})) as session:
+            return session.get(model, obj_id)
+
+
+def counts(bind=None):
+    #{table: rows} in the archive
+    bind = bind or engine
+    path = archive_path(bind)
+    if path is None or not os.path.exists(path):
+        return {name: 0 for name, _ in UNITS}
+    with bind.connect() as conn:
+        attach(conn, path)
+        return {name: conn.exec_driver_sql(f"SELECT count(*) FROM {SCHEMA}.{name}").scalar() for name, _ in UNITS}
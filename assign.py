@@ -0,0 +1,114 @@
+import heapq
+from collections import Counter
+
+from sqlalchemy import exists, select
+
+from cache import identity_cache
+from database import engine
+from models import Case, Detective, detective_case
+from stats import CLOSED_STATUS
+
+#how many open cases each rank carries relative to a junior
+RANK_WEIGHTS = {"Junior": 1.0, "Senior": 1.25, "Inspector": 1.5, "Chief": 1.5}
+#solved cases add experience on top of rank: +100% capacity at this many solved cases
+SOLVED_SCALE = 50
+CHUNK_SIZE = 5000
+
+
+def capacity(rank, solved_cases):
+    #relative share of the open caseload a detective should carry
+    return RANK_WEIGHTS.get(rank, 1.0) * (1 + (solved_cases or 0) / SOLVED_SCALE)
+
+
+class LoadBalancer:
+    #min-heap of detectives keyed by the load they would have after one more case (open cases / capacity)
+    def __init__(self, detectives):
+        #detectives: iterable of (id, rank, solved_cases, open_cases)
+        self.open_cases = {}
+        self.capacity = {}
+        self._heap = []
+        for detective_id, rank, solved_cases, open_cases in detectives:
+            self.open_cases[detective_id] = open_cases or 0
+            self.capacity[detective_id] = capacity(rank, solved_cases)
+            self._heap.append(self._entry(detective_id))
+        heapq.heapify(self._heap)
+
+    def _entry(self, detective_id):
+        return ((self.open_cases[detective_id] + 1) / self.capacity[detective_id], detective_id)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def take(self, count=1):
+        #the `count` least-loaded detectives, each charged one more open case
+        chosen = [heapq.heappop(self._heap)[1] for _ in range(min(count, len(self._heap)))]
+        for detective_id in chosen:
+            self.open_cases[detective_id] += 1
+            heapq.heappush(self._heap, self._entry(detective_id))
+        return chosen
+
+
+def load_detectives(conn):
+    #every detective with their current open caseload (from the detective_open_cases summary)
+    rows = conn.exec_driver_sql(
+        "SELECT d.id, d.rank, d.solved_cases, COALESCE(o.open_cases, 0) FROM detectives d "
+        "LEFT JOIN detective_open_cases o ON o.detective_id = d.id")
+    return LoadBalancer(rows)
+
+
+def unassigned_cases(conn, after_id=0, limit=CHUNK_SIZE, case_ids=None):
+    #ids of open cases nobody is assigned to, in id order (only among case_ids, if given)
+    cases = Case.__table__
+    stmt = (select(cases.c.id)
+            .where(cases.c.id > after_id, cases.c.status.is_distinct_from(CLOSED_STATUS),
+                   ~exists().where(detective_case.c.case_id == cases.c.id))
+            .order_by(cases.c.id).limit(limit))
+    if case_ids is not None:
+        stmt = stmt.where(cases.c.id.in_(case_ids))
+    return conn.execute(stmt).scalars().all()
+
+
+def assign(per_case=1, case_ids=None, limit=None, chunk_size=CHUNK_SIZE, dry_run=False, bind=None):
+    #spreads unassigned open cases (all of them, or those among case_ids) over the detectives, per_case
+    #detectives each, with one transaction and one bulk insert per chunk; returns {detective id: cases assigned}
+    bind = bind or engine
+    assigned = Counter()
+    remaining = limit
+    with bind.connect() as conn:
+        balancer = load_detectives(conn)
+    if not len(balancer):
+        return assigned
+
+    pending = sorted(set(case_ids)) if case_ids is not None else None
+    last_id = 0
+    while remaining is None or remaining > 0:
+        size = chunk_size if remaining is None else min(chunk_size, remaining)
+        with bind.begin() as conn:
+            if pending is not None:
+                #explicit ids are checked a slice at a time; ones already assigned or closed drop out
+                if not pending:
+                    break
+                chunk = unassigned_cases(conn, case_ids=pending[:size], limit=size)
+                pending = pending[size:]
+            else:
+                chunk = unassigned_cases(conn, last_id, size)
+                if not chunk:
+                    break
+            links = []
+            for case_id in chunk:
+                for detective_id in balancer.take(per_case):
+                    links.append({"detective_id": detective_id, "case_id": case_id})
+                    assigned[detective_id] += 1
+            if not dry_run:
+                if links:
+                    conn.execute(detective_case.insert(), links)
+        if chunk:
+            last_id = chunk[-1]
+        if remaining is not None:
+            remaining -= len(chunk)
+
+    if assigned and not dry_run:
+        #cached cases and detectives may hold stale relationship collections
+        identity_cache.invalidate_model(Case)
+        identity_cache.invalidate_model(Detective)
+    return assigned
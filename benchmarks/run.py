@@ -0,0 +1,201 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_SIZES = [10000]
+#operations timed per benchmark at scale 1.0
+OPS = {
+    "create": 1000,
+    "find_by_id": 2000,
+    "get_all": 3,
+    "delete": 200,
+    "page": 500,
+    "stream": 1,
+    "report": 200,
+}
+
+
+def summarize(timings):
+    #throughput and latency percentiles (ms) for a list of per-operation timings in seconds
+    ordered = sorted(timings)
+    total = sum(ordered)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "ops": len(ordered),
+        "total_s": total,
+        "ops_per_s": len(ordered) / total if total else 0.0,
+        "p50_ms": percentile(50),
+        "p99_ms": percentile(99),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+    }
+
+
+def timed(fn, args_list):
+    timings = []
+    #the model classmethods print a confirmation per call; keep that out of the measurement
+    with contextlib.redirect_stdout(io.StringIO()):
+        for args in args_list:
+            started = time.perf_counter()
+            fn(*args)
+            timings.append(time.perf_counter() - started)
+    return timings
+
+
+def run_size(size, scale=1.0, seed=42, sql_stats=False):
+    #runs in a worker process whose CRIME_DB_URL points at a fresh temp database
+    import seed as seeder
+    import reports
+    from database import engine
+    from instrument import profiler
+    from models import Case, Detective, init_db
+
+    ops = {name: max(1, int(count * scale)) for name, count in OPS.items()}
+    rng = random.Random(seed)
+    results = {}
+
+    init_db()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        counts = seeder.seed(size, seed=seed)
+    results["build"] = {"seconds": time.perf_counter() - started, "rows": counts}
+
+    if sql_stats:
+        profiler.enable(engine)
+
+    def bench(name, fn, args_list):
+        profiler.reset()
+        results[name] = summarize(timed(fn, args_list))
+        if sql_stats:
+            #per-operation averages of what the instrumentation layer saw
+            totals = profiler.totals()
+            ops_run = len(args_list)
+            results[name]["sql"] = {
+                "statements_per_op": totals["statements"] / ops_run,
+                "rows_per_op": totals["rows"] / ops_run,
+                "sql_ms_per_op": totals["sql_ms"] / ops_run,
+                "checkout_ms_per_op": totals["checkout_ms"] / ops_run,
+            }
+
+    ids = [rng.randint(1, size) for _ in range(max(ops["find_by_id"], ops["page"], ops["report"]))]
+
+    bench("find_by_id", Case.find_by_id, [(i,) for i in ids[:ops["find_by_id"]]])
+    bench("page", lambda after: Case.page(after_id=after), [(i,) for i in ids[:ops["page"]]])
+    bench("get_all_detectives", Detective.get_all, [()] * ops["get_all"])
+    bench("get_all_cases", Case.get_all, [()] * ops["get_all"])
+    bench("stream_cases", lambda: sum(1 for _ in Case.stream()), [()] * ops["stream"])
+    results["stream_cases"]["rows_per_s"] = size / results["stream_cases"]["mean_ms"] * 1000
+    bench("report", reports.load_case, [(i,) for i in ids[:ops["report"]]])
+    bench("create", Case.create, [("Fraud", "Open", "1 Benchmark Way", "2024-01-01")] * ops["create"])
+    #each delete cascades to the case's suspects, evidence, records and detective links
+    victims = rng.sample(range(1, size + 1), min(size, ops["delete"]))
+    bench("delete", Case.delete, [(i,) for i in victims])
+    return results
+
+
+def run_worker(size, scale, seed, out_path, sql_stats=False):
+    with open(out_path, "w") as out:
+        json.dump(run_size(size, scale, seed, sql_stats), out)
+
+
+def run_all(sizes, scale=1.0, seed=42, sql_stats=False):
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sizes:
+            db_path = os.path.join(workdir, f"bench_{size}.db")
+            out_path = os.path.join(workdir, f"bench_{size}.json")
+            env = dict(os.environ, CRIME_DB_URL=f"sqlite:///{db_path}")
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", "--sizes", str(size),
+                            "--scale", str(scale), "--seed", str(seed), "--output", out_path]
+                           + (["--sql-stats"] if sql_stats else []),
+                           env=env, check=True)
+            with open(out_path) as f:
+                results[str(size)] = json.load(f)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "scale": scale,
+            "seed": seed,
+            "sql_stats": sql_stats,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=0.2):
+    #returns (size, benchmark, old p50, new p50) for every benchmark whose p50 grew by more than threshold
+    regressions = []
+    for size, benchmarks in current["results"].items():
+        old = baseline.get("results", {}).get(size, {})
+        for name, stats in benchmarks.items():
+            if "p50_ms" not in stats or "p50_ms" not in old.get(name, {}):
+                continue
+            if stats["p50_ms"] > old[name]["p50_ms"] * (1 + threshold):
+                regressions.append((size, name, old[name]["p50_ms"], stats["p50_ms"]))
+    return regressions
+
+
+def print_table(report):
+    for size, benchmarks in report["results"].items():
+        print(f"\n== {int(size):,} cases (built in {benchmarks['build']['seconds']:.1f}s) ==")
+        print(f"{'benchmark':<20}{'ops':>7}{'ops/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+        for name, stats in benchmarks.items():
+            if name == "build":
+                continue
+            print(f"{name:<20}{stats['ops']:>7}{stats['ops_per_s']:>12.1f}{stats['p50_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CRUD, listing and reporting benchmarks at scale.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated case counts, e.g. 10000,100000,1000000")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply the number of timed operations")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_results.json", help="where to write the json results")
+    parser.add_argument("--compare", help="baseline json to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p50 slowdown before flagging (0.2 = 20%%)")
+    parser.add_argument("--sql-stats", action="store_true",
+                        help="also record statements, rows and sql time per operation (adds some overhead)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    if args.worker:
+        run_worker(sizes[0], args.scale, args.seed, args.output, args.sql_stats)
+        return 0
+
+    report = run_all(sizes, args.scale, args.seed, args.sql_stats)
+    with open(args.output, "w") as out:
+        json.dump(report, out, indent=2)
+    print_table(report)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for size, name, old, new in regressions:
+            print(f"REGRESSION {name} @ {size}: p50 {old:.2f} ms -> {new:.2f} ms")
+        if regressions:
+            return 1
+        print("No regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#cold-start wall time of one-shot cli commands, each in a fresh interpreter
+COMMANDS = [
+    ["cases", "get", "1"],
+    ["cases", "list", "--limit", "5"],
+    ["--help"],
+]
+
+
+def measure(command, runs=10):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(ROOT, "cli.py")] + command, cwd=ROOT,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - started)
+    return {"min": min(timings), "median": statistics.median(timings), "max": max(timings)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cli.py cold-start time.")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    for command in COMMANDS:
+        result = measure(command, args.runs)
+        print(f"{' '.join(command):<28} min {result['min'] * 1000:7.1f} ms   "
+              f"median {result['median'] * 1000:7.1f} ms   max {result['max'] * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+
+
+#bounded LRU of detached model objects keyed by (model name, id), with an optional ttl
+class IdentityCache:
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.enabled = maxsize > 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize=None, ttl=None):
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+                self.enabled = maxsize > 0
+            self.ttl = ttl
+            self._entries.clear()
+
+    def get(self, model, obj_id):
+        #returns the cached object or None
+        if not self.enabled:
+            return None
+        key = (model.__name__, obj_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                obj, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return obj
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, model, obj_id, obj):
+        if not self.enabled or obj is None:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[(model.__name__, obj_id)] = (obj, expires)
+            self._entries.move_to_end((model.__name__, obj_id))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, model, obj_id):
+        with self._lock:
+            self._entries.pop((model.__name__, obj_id), None)
+
+    def invalidate_model(self, model):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == model.__name__]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def reset_stats(self):
+        self.hits = self.misses = self.evictions = 0
+
+
+#off unless CRIME_CACHE_SIZE is set (or configure() is called), e.g. CRIME_CACHE_SIZE=10000 CRIME_CACHE_TTL=60
+identity_cache = IdentityCache(
+    maxsize=int(os.environ.get("CRIME_CACHE_SIZE", 0)),
+    ttl=float(os.environ["CRIME_CACHE_TTL"]) if os.environ.get("CRIME_CACHE_TTL") else None,
+)
+
+
+#any session that changes a row drops that row from the cache once the change commits,
+#so writes that bypass the model classmethods are covered too
+@event.listens_for(OrmSession, "after_flush")
+def _collect_changes(session, flush_context):
+    changed = session.info.setdefault("cache_invalidate", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        obj_id = getattr(obj, "id", None)
+        if obj_id is not None:
+            changed.add((type(obj), obj_id))
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _invalidate_on_commit(session):
+    for model, obj_id in session.info.pop("cache_invalidate", ()):
+        identity_cache.invalidate(model, obj_id)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop("cache_invalidate", None)
@@ -1,14 +1,29 @@
-from models import Case, Suspect, Evidence, Detective, CriminalRecord
-from database import Session
-from colorama import Fore, Style, init
-from tabulate import tabulate
-import time
+import sys
 import random
-from datetime import datetime
-from sqlalchemy.sql.expression import func
-from faker import Faker 
-# Initialize Faker
-fake = Faker()
+import functools
+import itertools
+from datetime import date
+from colorama import Fore, Style, init
+from models import Case, Suspect, Evidence, Detective, CriminalRecord, init_db
+from database import Session
+from search import search
+import tables
+from instrument import profiled, profiler
+
+#faker and tabulate are slow to import and only some commands need them, so they load on first use
+_faker = None
+
+def fake():
+    global _faker
+    if _faker is None:
+        from faker import Faker
+        _faker = Faker()
+    return _faker
+
+
+def tabulate(*args, **kwargs):
+    from tabulate import tabulate as _tabulate
+    return _tabulate(*args, **kwargs)
 
 init(autoreset=True)  # Initialize colorama for colored output
 
@@ -19,6 +34,31 @@ def print_header(title):
     print("=" * 50 + "\n" + Style.RESET_ALL)
 
 
+#"View All": every row, streamed through a pager (or a screenful at a time) instead of one big table
+@profiled()
+def browse(model, headers, to_row, empty_message):
+    rows = (to_row(item) for item in model.stream(page_size=1000))
+    try:
+        first = next(rows, None)
+        if first is None:
+            print(Fore.RED + empty_message)
+            return
+        with tables.pager() as out:
+            tables.write_table(itertools.chain([first], rows), headers, out=out, widths={"ID": _id_width(model)})
+    finally:
+        rows.close()
+
+
+def _id_width(model):
+    #ids only grow, so the largest one fixes the column however few of them the sample saw
+    from sqlalchemy import func
+    session = Session()
+    try:
+        return len(str(session.query(func.max(model.id)).scalar() or ""))
+    finally:
+        session.close()
+
+
 #main menu section
 def main():
     while True:
@@ -28,6 +68,8 @@ def main():
         print(Fore.YELLOW + "3️⃣ Manage Evidence")
         print(Fore.YELLOW + "4️⃣ Manage Detectives")
         print(Fore.YELLOW + "5️⃣ Manage Criminal Records")
+        print(Fore.YELLOW + "6️⃣ Search Records")
+        print(Fore.YELLOW + "7️⃣ Generate Reports")
         print(Fore.RED + "0️⃣ Exit")
         
         choice = input(Fore.GREEN + "Enter your choice: ")
@@ -42,6 +84,10 @@ def main():
             detective_menu()
         elif choice == "5":
             criminal_record_menu()
+        elif choice == "6":
+            search_menu()
+        elif choice == "7":
+            report_menu()
         elif choice == "0":
             print(Fore.RED + "🚪 Exiting the system. Goodbye!")
             break
@@ -65,18 +111,19 @@ def case_menu():
             crime_type = input("Enter crime type: ")
             status = input("Enter status (Open/Closed): ")
             location = input("Enter location: ")
-            date = input("Enter date (YYYY-MM-DD): ")
-            Case.create(crime_type, status, location, date)
+            case_date = input("Enter date (YYYY-MM-DD): ")
+            try:
+                case_date = date.fromisoformat(case_date)
+            except ValueError:
+                print(Fore.RED + "❌ Invalid date. Please use YYYY-MM-DD.")
+                continue
+            Case.create(crime_type, status, location, case_date)
             print(Fore.GREEN + "✅ Case added successfully!")
         
         elif choice == "2":
-            cases = Case.get_all()
-            if cases:
-                print(Fore.BLUE + tabulate([[c.id, c.crime_type, c.status, c.location, c.date] for c in cases],
-                                          headers=["ID", "Crime Type", "Status", "Location", "Date"],
-                                          tablefmt="grid"))
-            else:
-                print(Fore.RED + "❌ No cases found.")
+            browse(Case, ["ID", "Crime Type", "Status", "Location", "Date"],
+                   lambda c: [c.id, c.crime_type, c.status, c.location, c.date],
+                   "❌ No cases found.")
         
         elif choice == "3":
             case_id = input("Enter Case ID: ")
@@ -102,15 +149,16 @@ def case_menu():
         else:
             print(Fore.RED + "❌ Invalid choice. Please try again.")
 
+@profiled()
 def generate_random_case():
     try:
         crime_types = ["Robbery", "Murder", "Kidnapping", "Fraud", "Burglary", "Assault", "Arson", "Cybercrime"]
         statuses = ["Open", "Under Investigation", "Closed"]
 
         crime_type = random.choice(crime_types)
-        location = fake.address()  
+        location = fake().address()  
         status = random.choice(statuses)
-        date = fake.date_between(start_date="-5y", end_date="today").strftime("%Y-%m-%d")  # Random past date
+        date = fake().date_between(start_date="-5y", end_date="today").strftime("%Y-%m-%d")  # Random past date
 
         new_case = Case.create(crime_type=crime_type, status=status, location=location, date=date)
         print(Fore.GREEN + f"✅ Case added: {crime_type}, Status: {status}, Location: {location}, Date: {date}")
@@ -151,14 +199,9 @@ def suspect_menu():
             print(Fore.GREEN + "✅ Suspect added successfully!")
 
         elif choice == "2":
-            suspects = Suspect.get_all()
-            if suspects:
-                print(Fore.BLUE + tabulate(
-                    [[s.id, s.name, s.age, s.alibi if s.alibi else "N/A", s.case_id] for s in suspects],
-                    headers=["ID", "Name", "Age", "Alibi", "Case ID"],
-                    tablefmt="grid"))
-            else:
-                print(Fore.RED + "❌ No suspects found.")
+            browse(Suspect, ["ID", "Name", "Age", "Alibi", "Case ID"],
+                   lambda s: [s.id, s.name, s.age, s.alibi if s.alibi else "N/A", s.case_id],
+                   "❌ No suspects found.")
 
         elif choice == "3":
             suspect_id = input("Enter Suspect ID: ")
@@ -187,13 +230,19 @@ def suspect_menu():
         else:
             print(Fore.RED + "❌ Invalid choice. Please try again.")
 
+@profiled()
 def generate_random_suspect():
     
     try:
-        name = fake.name()
+        name = fake().name()
         age = random.randint(18, 65)
-        alibi = fake.sentence()
-        case_id = random.randint(1, 100)  # Assuming case IDs range from 1-100
+        alibi = fake().sentence()
+        cases = Case.sample()
+        if not cases:
+            print(Fore.RED + "❌ No cases found! Please add a case first.")
+            input(Fore.YELLOW + "Press Enter to return to the menu...")
+            return
+        case_id = cases[0].id
 
         new_suspect = Suspect.create(name=name, age=age, alibi=alibi, case_id=case_id)
         print(Fore.GREEN + f"✅ Suspect added: {name}, Alibi: {alibi}, case_id: {case_id}")
@@ -229,14 +278,9 @@ def evidence_menu():
             print(Fore.GREEN + "✅ Evidence added successfully!")
 
         elif choice == "2":
-            evidences = Evidence.get_all()
-            if evidences:
-                print(Fore.BLUE + tabulate(
-                    [[e.id, e.case_id, e.description, e.found_location] for e in evidences],
-                    headers=["ID", "Case ID", "Description", "Found Location"],
-                    tablefmt="grid"))
-            else:
-                print(Fore.RED + "❌ No evidence found.")
+            browse(Evidence, ["ID", "Case ID", "Description", "Found Location"],
+                   lambda e: [e.id, e.case_id, e.description, e.found_location],
+                   "❌ No evidence found.")
 
         elif choice == "3":
             evidence_id = input("Enter Evidence ID: ")
@@ -265,15 +309,14 @@ def evidence_menu():
         else:
             print(Fore.RED + "❌ Invalid choice. Please try again.")
 
+@profiled()
 def generate_random_evidence():
-    session = Session()
-    
-    cases = session.query(Case).all()
+    cases = Case.sample()
     if not cases:
         print(Fore.RED + "❌ No cases found! Please add a case first.")
         return
     
-    random_case = random.choice(cases)
+    random_case = cases[0]
 
     descriptions = ["Bloody knife", "Fingerprint on glass", "Security footage", "DNA sample", "Footprint at the scene"]
     locations = ["Living room", "Kitchen", "Parking lot", "Abandoned house", "Office building"]
@@ -287,7 +330,6 @@ def generate_random_evidence():
     except Exception as e:
         print(Fore.RED + f"\n❌ Error adding evidence: {str(e)}\n")
 
-    session.close()
     input(Fore.YELLOW + "Press Enter to return to the menu...")
 
 
@@ -299,6 +341,7 @@ def detective_menu():
         print("3️⃣ Find Detective by ID")
         print("4️⃣ Delete Detective")
         print("5️⃣ Generate Random Detective")
+        print("6️⃣ Assign Unassigned Cases")
         print("0️⃣ Back to Main Menu")
 
         choice = input("Enter your choice: ")
@@ -316,15 +359,9 @@ def detective_menu():
             print(Fore.GREEN + f"✅ Detective '{name}' added successfully!")
 
         elif choice == "2":
-            detectives = Detective.get_all()
-            if detectives:
-                print(Fore.BLUE + tabulate(
-                    [[d.id, d.name, d.rank, d.solved_cases] for d in detectives],
-                    headers=["ID", "Name", "Rank", "Solved Cases"],
-                    tablefmt="grid"
-                ))
-            else:
-                print(Fore.RED + "❌ No detectives found.")
+            browse(Detective, ["ID", "Name", "Rank", "Solved Cases"],
+                   lambda d: [d.id, d.name, d.rank, d.solved_cases],
+                   "❌ No detectives found.")
 
         elif choice == "3":
             detective_id = input("Enter Detective ID: ").strip()
@@ -347,12 +384,21 @@ def detective_menu():
         elif choice == "5":
             generate_random_detective()
 
+        elif choice == "6":
+            import assign
+            assigned = assign.assign()
+            if assigned:
+                print(Fore.GREEN + f"✅ Assigned {sum(assigned.values())} cases across {len(assigned)} detectives.")
+            else:
+                print(Fore.YELLOW + "No unassigned open cases (or no detectives).")
+
         elif choice == "0":
             break
 
         else:
             print(Fore.RED + "❌ Invalid choice. Please try again.")
 
+@profiled()
 def generate_random_detective():
     names = ["James Carter", "Sarah Connor", "John Wick", "Emily Watson", "Mark Spencer"]
     ranks = ["Junior", "Senior", "Chief", "Inspector"]
@@ -408,15 +454,9 @@ def criminal_record_menu():
             print(Fore.GREEN + f"✅ Criminal record for Suspect ID {suspect_id} added successfully!")
 
         elif choice == "2":
-            records = CriminalRecord.get_all()
-            if records:
-                print(Fore.BLUE + tabulate(
-                    [[r.id, r.suspect_id, r.previous_crimes, r.sentence] for r in records],
-                    headers=["ID", "Suspect ID", "Previous Crimes", "Sentence"],
-                    tablefmt="grid"
-                ))
-            else:
-                print(Fore.RED + "❌ No criminal records found.")
+            browse(CriminalRecord, ["ID", "Suspect ID", "Previous Crimes", "Sentence"],
+                   lambda r: [r.id, r.suspect_id, r.previous_crimes, r.sentence],
+                   "❌ No criminal records found.")
 
         elif choice == "3":
             record_id = input("Enter Criminal Record ID: ").strip()
@@ -445,12 +485,14 @@ def criminal_record_menu():
         else:
             print(Fore.RED + "❌ Invalid choice. Please try again.")
 
+@profiled()
 def generate_random_criminal_record():
     session = Session()
 
     try:
         # Fetch a random suspect from the database
-        suspect = session.query(Suspect).order_by(func.random()).first()
+        suspects = Suspect.sample(session=session)
+        suspect = suspects[0] if suspects else None
 
         if not suspect:
             print(Fore.RED + "❌ Error: No suspects found. Please add a suspect first.")
@@ -458,8 +500,8 @@ def generate_random_criminal_record():
             return  # Exit function if no suspect is found
 
         # Generate random crime details
-        previous_crimes = fake.sentence()
-        sentence = fake.sentence()
+        previous_crimes = fake().sentence()
+        sentence = fake().sentence()
 
         # Create and commit the new criminal record
         CriminalRecord.create(suspect_id=suspect.id, previous_crimes=previous_crimes, sentence=sentence)
@@ -481,5 +523,545 @@ def generate_random_criminal_record():
     input(Fore.YELLOW + "Press Enter to return to the menu...")
 
 
+#full-text search across evidence, alibis, case locations and criminal histories
+@profiled()
+def search_menu():
+    print_header("🔎 Search Records")
+    query = input("Enter search terms (e.g. red sedan): ").strip()
+    if not query:
+        print(Fore.RED + "❌ Please enter something to search for.")
+        return
+
+    results = search(query, limit=25)
+    if results:
+        print(Fore.BLUE + tabulate(
+            [[r.kind, r.id, r.case_id, r.snippet] for r in results],
+            headers=["Type", "ID", "Case ID", "Match"],
+            tablefmt="grid"))
+    else:
+        print(Fore.RED + f"❌ No records mention '{query}'.")
+
+    input(Fore.YELLOW + "Press Enter to return to the menu...")
+
+
+#case-file reports for one case or a filtered set, to the screen or a file
+@profiled()
+def report_menu():
+    print_header("📝 Case Reports")
+    case_id = input("Enter Case ID (leave blank for all matching cases): ").strip()
+    filters = {}
+    if case_id:
+        if not case_id.isdigit():
+            print(Fore.RED + "❌ Invalid ID. Please enter a number.")
+            return
+        filters["case_ids"] = [int(case_id)]
+    else:
+        filters["status"] = input("Filter by status (leave blank for any): ").strip() or None
+        filters["crime_type"] = input("Filter by crime type (leave blank for any): ").strip() or None
+
+    fmt = input("Format (text/markdown/json, default: text): ").strip().lower() or "text"
+    import reports
+    if fmt not in reports.FORMATS:
+        print(Fore.RED + "❌ Invalid format.")
+        return
+    path = input("Output file (leave blank to print): ").strip()
+
+    if path:
+        with open(path, "w", encoding="utf-8") as out:
+            count = reports.write_report(out, fmt, **filters)
+        print(Fore.GREEN + f"✅ Report for {count} case(s) written to {path}")
+    else:
+        count = reports.write_report(fmt=fmt, **filters)
+        if not count:
+            print(Fore.RED + "❌ No matching cases found.")
+
+    input(Fore.YELLOW + "Press Enter to return to the menu...")
+
+
+#non-interactive subcommands: `python cli.py cases list`, `python cli.py suspects get 42`, ...
+#per entity: (model, [(attribute, header)], [(field, type, required, default)] for `add`)
+ENTITIES = {
+    "cases": (Case,
+              [("id", "ID"), ("crime_type", "Crime Type"), ("status", "Status"), ("location", "Location"), ("date", "Date")],
+              [("crime_type", str, True, None), ("status", str, False, "Open"), ("location", str, True, None),
+               ("date", date.fromisoformat, True, None), ("latitude", float, False, None), ("longitude", float, False, None)]),
+    "suspects": (Suspect,
+                 [("id", "ID"), ("name", "Name"), ("age", "Age"), ("alibi", "Alibi"), ("case_id", "Case ID")],
+                 [("name", str, True, None), ("age", int, True, None), ("alibi", str, False, None),
+                  ("case_id", int, True, None)]),
+    "evidence": (Evidence,
+                 [("id", "ID"), ("case_id", "Case ID"), ("description", "Description"), ("found_location", "Found Location")],
+                 [("description", str, True, None), ("found_location", str, False, None), ("case_id", int, True, None)]),
+    "detectives": (Detective,
+                   [("id", "ID"), ("name", "Name"), ("rank", "Rank"), ("solved_cases", "Solved Cases")],
+                   [("name", str, True, None), ("rank", str, False, "Junior"), ("solved_cases", int, False, 0)]),
+    "records": (CriminalRecord,
+                [("id", "ID"), ("suspect_id", "Suspect ID"), ("previous_crimes", "Previous Crimes"), ("sentence", "Sentence")],
+                [("suspect_id", int, True, None), ("previous_crimes", str, True, None), ("sentence", str, True, None)]),
+}
+
+
+def build_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="cli.py", description="Crime Investigation & Case Management System. "
+                                     "Run without a command for the interactive menu.")
+    parser.add_argument("--profile", action="store_true",
+                        help="print per-operation query counts and timings on exit (can go before any command)")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+
+    commands.add_parser("init-db", help="create the database schema")
+
+    for entity, (_, _, fields) in ENTITIES.items():
+        entity_parser = commands.add_parser(entity, help=f"list, show, add or delete {entity}")
+        actions = entity_parser.add_subparsers(dest="action", metavar="action", required=True)
+
+        list_parser = actions.add_parser("list", help=f"list {entity} a page at a time")
+        list_parser.add_argument("--after", type=int, help="start after this id (the last id of the previous page)")
+        list_parser.add_argument("--limit", type=int, default=20, help="page size")
+        list_parser.add_argument("--all", action="store_true", help="list every row (through a pager on a terminal)")
+        list_parser.add_argument("--format", default="grid", choices=tables.FORMATS)
+
+        get_parser = actions.add_parser("get", help="show one record")
+        get_parser.add_argument("id", type=int)
+
+        add_parser = actions.add_parser("add", help="add a record")
+        for field, field_type, required, default in fields:
+            add_parser.add_argument("--" + field.replace("_", "-"), dest=field, type=field_type,
+                                    required=required, default=default)
+
+        sample_parser = actions.add_parser("sample", help=f"show random {entity} (for spot checks)")
+        sample_parser.add_argument("-k", type=int, default=5, help="how many")
+        sample_parser.add_argument("--where", action="append", default=[], metavar="FIELD=VALUE",
+                                   help="only rows with this value (repeatable)")
+        sample_parser.add_argument("--format", default="grid", choices=tables.FORMATS)
+
+        delete_parser = actions.add_parser("delete", help="delete a record")
+        delete_parser.add_argument("id", type=int)
+
+    search_parser = commands.add_parser("search", help="full-text search across records")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--limit", type=int, default=20)
+
+    report_parser = commands.add_parser("report", help="case-file report")
+    report_parser.add_argument("--case-id", type=int, action="append", dest="case_ids")
+    report_parser.add_argument("--status")
+    report_parser.add_argument("--crime-type")
+    report_parser.add_argument("--format", default="text", choices=["text", "markdown", "json"])
+    report_parser.add_argument("--output", help="write to this file instead of stdout")
+    report_parser.add_argument("--workers", type=int, default=1,
+                               help="render in this many processes (0 = one per core)")
+
+    assign_parser = commands.add_parser("assign", help="spread unassigned open cases across detectives by caseload")
+    assign_parser.add_argument("--case-id", type=int, action="append", dest="case_ids",
+                               help="only consider these cases (repeatable)")
+    assign_parser.add_argument("--per-case", type=int, default=1, help="detectives per case")
+    assign_parser.add_argument("--limit", type=int, help="assign at most this many cases")
+    assign_parser.add_argument("--dry-run", action="store_true", help="show the plan without saving it")
+
+    purge_parser = commands.add_parser("purge", help="delete matching cases and everything attached to them")
+    purge_parser.add_argument("--status", help="e.g. Closed")
+    purge_parser.add_argument("--crime-type")
+    purge_parser.add_argument("--before", type=date.fromisoformat, help="cases dated before YYYY-MM-DD")
+    purge_parser.add_argument("--older-than-years", type=int, help="cases dated more than N years ago")
+    purge_parser.add_argument("--dry-run", action="store_true", help="count what would go, then roll back")
+
+    archive_parser = commands.add_parser("archive", help="move old closed cases into the archive database")
+    archive_parser.add_argument("--older-than-years", type=int, default=7, help="cases dated more than N years ago")
+    archive_parser.add_argument("--status", default="Closed")
+    archive_parser.add_argument("--batch-size", type=int, default=1000, help="cases moved per transaction")
+
+    restore_parser = commands.add_parser("restore", help="bring archived cases back into the main database")
+    restore_parser.add_argument("case_ids", type=int, nargs="+", metavar="case_id")
+
+    stats_parser = commands.add_parser("stats", help="case counts and open caseloads from the summary tables")
+    stats_parser.add_argument("--by", default="status", choices=["crime_type", "status", "month", "location", "detective"])
+    stats_parser.add_argument("--limit", type=int, help="show only the first N buckets")
+    stats_parser.add_argument("--rebuild", action="store_true", help="recompute the summaries from scratch first")
+
+    dedup_parser = commands.add_parser("dedup", help="suspects that look like the same person")
+    dedup_parser.add_argument("--suspect-id", type=int, help="only matches for this suspect")
+    dedup_parser.add_argument("--threshold", type=float, default=0.9, help="minimum score, 0-1 (default 0.9)")
+    dedup_parser.add_argument("--limit", type=int, default=50, help="show at most N pairs (0 = all)")
+    dedup_parser.add_argument("--rebuild", action="store_true", help="re-key every suspect first")
+
+    graph_parser = commands.add_parser("graph", help="who is linked to whom through cases, detectives and locations")
+    graph_actions = graph_parser.add_subparsers(dest="action", metavar="action", required=True)
+    node_help = "KIND:KEY, e.g. suspect:12, case:7 or 'location:parking lot'"
+    kinds_help = "comma-separated node kinds (case, suspect, detective, evidence, location)"
+    neighbours_parser = graph_actions.add_parser("neighbours", help="everything within a few links of a node")
+    neighbours_parser.add_argument("node", type=_graph_node, help=node_help)
+    neighbours_parser.add_argument("--hops", type=int, default=2)
+    neighbours_parser.add_argument("--kinds", type=_kinds, help="only show these kinds; " + kinds_help)
+    neighbours_parser.add_argument("--limit", type=int, default=100)
+    path_parser = graph_actions.add_parser("path", help="shortest chain of links between two nodes")
+    path_parser.add_argument("source", type=_graph_node, help=node_help)
+    path_parser.add_argument("target", type=_graph_node, help=node_help)
+    components_parser = graph_actions.add_parser("components", help="largest connected groups")
+    components_parser.add_argument("--min-size", type=int, default=2)
+    components_parser.add_argument("--kinds", type=_kinds, help="only count these kinds; " + kinds_help)
+    components_parser.add_argument("--limit", type=int, default=10)
+    for graph_action in (neighbours_parser, path_parser, components_parser):
+        graph_action.add_argument("--through", type=_kinds,
+                                  help="only walk through these kinds, e.g. case,suspect,detective; " + kinds_help)
+
+    geocode_parser = commands.add_parser("geocode", help="fill case coordinates from the gazetteer")
+    geocode_parser.add_argument("--all", action="store_true", help="re-geocode cases that already have coordinates")
+    near_parser = commands.add_parser("near", help="cases within a distance of a case or a point")
+    near_parser.add_argument("case_id", type=int, nargs="?")
+    near_parser.add_argument("--lat", type=float, help="centre latitude (instead of a case)")
+    near_parser.add_argument("--lon", type=float, help="centre longitude (instead of a case)")
+    near_parser.add_argument("--km", type=float, default=2.0)
+    near_parser.add_argument("--limit", type=int, default=20)
+    hotspots_parser = commands.add_parser("hotspots", help="clusters of cases close together")
+    hotspots_parser.add_argument("--min-cases", type=int, default=5, help="cases per ~1 km grid cell to count as hot")
+    hotspots_parser.add_argument("--limit", type=int, default=10)
+
+    snapshot_parser = commands.add_parser("snapshot", help="columnar copy of the case tables for fast counts")
+    snapshot_actions = snapshot_parser.add_subparsers(dest="action", metavar="action", required=True)
+    refresh_parser = snapshot_actions.add_parser("refresh", help="append rows added since the last refresh")
+    refresh_parser.add_argument("--full", action="store_true", help="rewrite it from scratch (picks up edits)")
+    count_parser = snapshot_actions.add_parser("count", help="row counts grouped by columns")
+    count_parser.add_argument("table", choices=["cases", "suspects", "evidence", "detective_case"])
+    count_parser.add_argument("--by", action="append", default=[], metavar="COLUMN",
+                              help="group by this column (repeatable); date:day, date:month or date:year for "
+                                   "dates, detective_id for cases")
+    count_parser.add_argument("--where", action="append", default=[], metavar="COLUMN=VALUE",
+                              help="only rows with this value, or LOW..HIGH (repeatable; repeating a column "
+                                   "matches any of its values)")
+    count_parser.add_argument("--limit", type=int, help="show only the first N groups")
+
+    #these hand their arguments on to the standalone scripts (see run())
+    commands.add_parser("seed", help="bulk-load synthetic data (see seed.py)", add_help=False)
+    commands.add_parser("import", help="import CSV/JSONL (see transfer.py)", add_help=False)
+    commands.add_parser("export", help="export CSV/JSONL (see transfer.py)", add_help=False)
+
+    return parser
+
+
+def _print_rows(items, columns, fmt="grid", out=None, widths=None):
+    tables.write_table(([getattr(item, attr) for attr, _ in columns] for item in items),
+                       [header for _, header in columns], fmt, out, widths)
+
+
+def run_entity_command(entity, args):
+    model, columns, fields = ENTITIES[entity]
+
+    if args.action == "list":
+        if args.all:
+            with tables.pager() as out:
+                _print_rows(model.stream(page_size=1000), columns, args.format, out, {"ID": _id_width(model)})
+            return 0
+        page = model.page(after_id=args.after, page_size=args.limit)
+        if not page.items:
+            print(f"No {entity} found.", file=sys.stderr)
+            return 0
+        _print_rows(page, columns, args.format)
+        if page.has_next:
+            print(f"Next page: --after {page.last_id}", file=sys.stderr)
+        return 0
+
+    if args.action == "get":
+        item = model.find_by_id(args.id)
+        if item is None:
+            print(f"No {entity} with id {args.id}.", file=sys.stderr)
+            return 1
+        for attr, header in columns:
+            print(f"{header}: {getattr(item, attr)}")
+        return 0
+
+    if args.action == "sample":
+        filters = dict(condition.split("=", 1) for condition in args.where)
+        try:
+            items = model.sample(args.k, **filters)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return 2
+        if not items:
+            print(f"No {entity} found.", file=sys.stderr)
+            return 1
+        _print_rows(items, columns, args.format)
+        return 0
+
+    if args.action == "add":
+        item = model.create(**{field: getattr(args, field) for field, _, _, _ in fields})
+        print(f"ID: {item.id}")
+        return 0
+
+    if args.action == "delete":
+        if not model.delete(args.id):
+            print(f"No {entity} with id {args.id}.", file=sys.stderr)
+            return 1
+        return 0
+
+
+def init_database():
+    #creates missing tables; a brand-new database is also stamped as fully migrated
+    from sqlalchemy import inspect
+    from database import engine
+
+    fresh = not inspect(engine).get_table_names()
+    init_db()
+    if fresh:
+        import os
+        from alembic import command
+        from alembic.config import Config
+
+        command.stamp(Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")), "head")
+
+
+def enable_profiling():
+    import atexit
+    from database import engine
+
+    profiler.enable(engine)
+    atexit.register(lambda: print("\n" + profiler.summary(), file=sys.stderr))
+
+
+def run(argv):
+    if "--profile" in argv:
+        argv = [arg for arg in argv if arg != "--profile"]
+        enable_profiling()
+
+    if argv and argv[0] == "seed":
+        import seed
+        seed.main(argv[1:])
+        return 0
+
+    if argv and argv[0] in ("import", "export"):
+        import transfer
+        transfer.main(argv)
+        return 0
+
+    args = build_parser().parse_args(argv)
+    if args.command is None:
+        #no command: the interactive menu
+        init_db()
+        main()
+        return 0
+
+    with profiler.operation(" ".join(filter(None, ["cli", args.command, getattr(args, "action", None)]))):
+        return run_command(args)
+
+
+def _graph_node(text):
+    kind, _, key = text.partition(":")
+    if not key:
+        raise ValueError(text)
+    return (kind, key if kind == "location" else int(key))
+
+
+def _kinds(text):
+    return set(text.split(","))
+
+
+def _snapshot_where(conditions):
+    where = {}
+    for condition in conditions:
+        column, _, value = condition.partition("=")
+        low, dots, high = value.partition("..")
+        if dots:
+            where[column] = (low or None, high or None)
+        elif column in where:
+            previous = where[column]
+            where[column] = (previous if isinstance(previous, list) else [previous]) + [value]
+        else:
+            where[column] = value
+    return where
+
+
+def _years_ago(years):
+    today = date.today()
+    #day capped at 28 so 29 February has a counterpart in every year
+    return today.replace(year=today.year - years, day=min(today.day, 28))
+
+
+def run_command(args):
+    if args.command in ENTITIES:
+        return run_entity_command(args.command, args)
+
+    if args.command == "init-db":
+        init_database()
+        print("Database ready.")
+        return 0
+
+    if args.command == "search":
+        results = search(args.query, limit=args.limit)
+        if results:
+            print(tabulate([[r.kind, r.id, r.case_id, r.snippet] for r in results],
+                           headers=["Type", "ID", "Case ID", "Match"], tablefmt="grid"))
+        return 0 if results else 1
+
+    if args.command == "report":
+        filters = {"case_ids": args.case_ids, "status": args.status, "crime_type": args.crime_type}
+        if args.workers == 1:
+            import reports
+            write_report = reports.write_report
+        else:
+            import parallel
+            write_report = functools.partial(parallel.write_report, workers=args.workers or None)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as out:
+                count = write_report(out, args.format, **filters)
+        else:
+            count = write_report(fmt=args.format, **filters)
+        return 0 if count else 1
+
+    if args.command == "assign":
+        import assign
+        assigned = assign.assign(per_case=args.per_case, case_ids=args.case_ids, limit=args.limit,
+                                 dry_run=args.dry_run)
+        verb = "Would assign" if args.dry_run else "Assigned"
+        print(f"{verb} {sum(assigned.values())} case assignments across {len(assigned)} detectives.")
+        return 0
+
+    if args.command == "purge":
+        before = _years_ago(args.older_than_years) if args.older_than_years is not None else None
+        if args.before:
+            before = min(before, args.before) if before else args.before
+        session = Session()
+        try:
+            counts = Case.purge(status=args.status, crime_type=args.crime_type, before=before, session=session)
+            if args.dry_run:
+                session.rollback()
+            else:
+                session.commit()
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+        finally:
+            session.close()
+        verb = "Would delete" if args.dry_run else "Deleted"
+        for table, count in counts.items():
+            print(f"{verb} {count} {table}")
+        return 0
+
+    if args.command in ("archive", "restore"):
+        import archive
+        try:
+            if args.command == "archive":
+                counts = archive.archive_cases(_years_ago(args.older_than_years), args.status, args.batch_size)
+                verb = "Archived"
+            else:
+                counts = archive.restore(args.case_ids)
+                verb = "Restored"
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+        for table, count in counts.items():
+            print(f"{verb} {count} {table}")
+        return 0
+
+    if args.command == "stats":
+        import stats
+        if args.rebuild:
+            stats.refresh()
+        if args.by == "detective":
+            print(tabulate(stats.open_cases_by_detective(args.limit), headers=["ID", "Detective", "Open Cases"],
+                           tablefmt="grid"))
+        else:
+            print(tabulate(stats.counts(args.by, args.limit), headers=[args.by.replace("_", " ").title(), "Cases"],
+                           tablefmt="grid"))
+        return 0
+
+    if args.command == "dedup":
+        import dedup
+        from database import engine
+        if args.rebuild:
+            with engine.begin() as conn:
+                dedup.rebuild(conn)
+        if args.suspect_id is not None:
+            matches = dedup.candidates_for(args.suspect_id, args.threshold, args.limit or None)
+            if matches is None:
+                print(f"No suspect with id {args.suspect_id}", file=sys.stderr)
+                return 2
+            rows = [[m.score, m.suspect.id, m.suspect.name, m.suspect.age, m.suspect.case_id] for m in matches]
+            headers = ["Score", "ID", "Name", "Age", "Case ID"]
+        else:
+            pairs = dedup.find_duplicates(args.threshold, args.limit or None)
+            rows = [[p.score, p.first.id, p.first.name, p.first.age, p.first.case_id,
+                     p.second.id, p.second.name, p.second.age, p.second.case_id] for p in pairs]
+            headers = ["Score", "ID", "Name", "Age", "Case ID", "ID", "Name", "Age", "Case ID"]
+        if rows:
+            print(tabulate(rows, headers=headers, tablefmt="grid"))
+        return 0 if rows else 1
+
+    if args.command == "geocode":
+        import geo
+        from database import engine
+        with engine.begin() as conn:
+            located = geo.geocode_cases(conn, everything=args.all)
+        print(f"Located {located} cases.")
+        return 0
+
+    if args.command == "near":
+        if args.lat is not None and args.lon is not None:
+            found = Case.within(args.lat, args.lon, args.km, args.limit)
+        elif args.case_id is not None:
+            found = Case.near(args.case_id, args.km, args.limit)
+            if found is None:
+                print("Case not found!", file=sys.stderr)
+                return 2
+        else:
+            print("Give a case id or --lat and --lon.", file=sys.stderr)
+            return 2
+        if found:
+            print(tabulate([[case.id, case.crime_type, case.status, case.location, f"{distance:.2f}"]
+                            for case, distance in found],
+                           headers=["ID", "Crime Type", "Status", "Location", "Km"], tablefmt="grid"))
+        return 0 if found else 1
+
+    if args.command == "hotspots":
+        spots = Case.hotspots(args.min_cases, args.limit)
+        if spots:
+            print(tabulate([[h.cases, h.latitude, h.longitude, f"{h.south}..{h.north}", f"{h.west}..{h.east}"]
+                            for h in spots],
+                           headers=["Cases", "Latitude", "Longitude", "Latitudes", "Longitudes"], tablefmt="grid"))
+        return 0 if spots else 1
+
+    if args.command == "graph":
+        import graph
+        links = graph.build()
+        try:
+            if args.action == "neighbours":
+                found = links.neighbourhood(args.node, args.hops, args.kinds, args.through, args.limit)
+                rows = [[node.kind, node.key, distance] for node, distance in found]
+                if rows:
+                    print(tabulate(rows, headers=["Kind", "Key", "Hops"], tablefmt="grid"))
+                return 0 if rows else 1
+            if args.action == "path":
+                path = links.shortest_path(args.source, args.target, args.through)
+                if path is None:
+                    print("Not connected.")
+                    return 1
+                print(" -> ".join(f"{node.kind} {node.key}" for node in path))
+                return 0
+            groups = links.components(args.min_size, args.kinds, args.through, args.limit)
+        except KeyError as e:
+            print(e.args[0], file=sys.stderr)
+            return 2
+        for number, group in enumerate(groups, 1):
+            preview = ", ".join(f"{node.kind} {node.key}" for node in group[:10])
+            print(f"{number}. {len(group)} nodes: {preview}{', ...' if len(group) > 10 else ''}")
+        return 0 if groups else 1
+
+    if args.command == "snapshot":
+        import snapshot
+        if args.action == "refresh":
+            for table, count in snapshot.refresh(full=args.full).items():
+                print(f"Added {count} {table}")
+            return 0
+        try:
+            groups = snapshot.open_snapshot().count(args.table, args.by, _snapshot_where(args.where), args.limit)
+        except FileNotFoundError as e:
+            print(e, file=sys.stderr)
+            return 2
+        except (KeyError, ValueError) as e:
+            print(e.args[0], file=sys.stderr)
+            return 2
+        print(tabulate(groups, headers=args.by + ["Rows"], tablefmt="grid"))
+        return 0 if groups else 1
+
+
 if __name__ == "__main__":
-    main()
+    sys.exit(run(sys.argv[1:]))
@@ -1,10 +1,86 @@
-from sqlalchemy import create_engine
+import os
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import StaticPool
+
+#the database url can be overridden (e.g. sqlite:///:memory: or a temp file for benchmarks)
+DEFAULT_URL = "sqlite:///crime.db"
+DATABASE_URL = os.environ.get("CRIME_DB_URL", DEFAULT_URL)
+
+#applied to every new sqlite connection
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",         #readers no longer block the writer
+    "synchronous": "NORMAL",       #fsync at checkpoints instead of every commit (safe with WAL)
+    "cache_size": -64000,          #64 MB page cache (negative = KiB)
+    "mmap_size": 268435456,        #256 MB memory-mapped reads
+    "busy_timeout": 5000,          #wait for locks instead of failing with "database is locked"
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+}
+
+#pool sizing for a file database: a handful of long-lived connections, a little overflow for bursts
+POOL_SIZE = int(os.environ.get("CRIME_DB_POOL_SIZE", 5))
+MAX_OVERFLOW = int(os.environ.get("CRIME_DB_MAX_OVERFLOW", 10))
+
+
+def _is_memory(url):
+    return url.startswith("sqlite") and (url.endswith(":memory:") or url in ("sqlite://", "sqlite:///"))
+
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
 
-#creating the engine and sessiom
-engine= create_engine("sqlite:///crime.db")
-Session= sessionmaker(bind=engine)
-session= Session()
+
+#engine factory: every engine in the app (and in benchmarks/migrations) should come from here
+def make_engine(url=None, **kwargs):
+    url = url or DATABASE_URL
+    if url.startswith("sqlite"):
+        if _is_memory(url):
+            #one shared connection, otherwise every checkout would see a different empty database
+            kwargs.setdefault("poolclass", StaticPool)
+            kwargs.setdefault("connect_args", {"check_same_thread": False})
+        else:
+            kwargs.setdefault("pool_size", POOL_SIZE)
+            kwargs.setdefault("max_overflow", MAX_OVERFLOW)
+        new_engine = create_engine(url, **kwargs)
+        event.listen(new_engine, "connect", _apply_pragmas)
+        return new_engine
+    return create_engine(url, **kwargs)
+
+
+#creating the engine and session factory
+engine= make_engine()
+#objects stay readable after the session that loaded them commits and closes
+Session= sessionmaker(bind=engine, expire_on_commit=False)
 
 #base class
-Base= declarative_base()
\ No newline at end of file
+Base= declarative_base()
+
+
+#unit of work: everything done with the yielded session commits together, or rolls back on error
+@contextmanager
+def session_scope():
+    session = Session()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+#joins the caller's unit of work if one is given, otherwise runs in its own
+@contextmanager
+def use_session(session=None):
+    if session is not None:
+        yield session
+    else:
+        with session_scope() as own:
+            yield own
@@ -0,0 +1,300 @@
+import re
+import unicodedata
+from collections import namedtuple
+from itertools import groupby
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session as OrmSession
+
+from database import Base, engine
+
+#suspects whose names score at least this (0-1, jaro-winkler less the age penalty) are merge candidates
+THRESHOLD = 0.9
+#ages are blocked in bands of this many years; a suspect is compared with its own band and both neighbours
+BAND_WIDTH = 5
+#each year of age difference beyond the first costs this much score (records are taken years apart)
+AGE_PENALTY = 0.02
+#a blocking key shared by more suspects than this is too common to tell anyone apart, so the full pass skips it
+MAX_BLOCK_SIZE = 1000
+BATCH_SIZE = 5000
+
+#titles and suffixes faker (and people) put around names
+NOISE_WORDS = {"mr", "mrs", "ms", "miss", "dr", "prof", "jr", "sr", "ii", "iii", "iv", "md", "phd", "dds", "dvm"}
+
+SOUNDEX_CODES = {letter: str(code) for code, letters in enumerate(
+    ["aeiouy", "bfpv", "cgjkqsxz", "dt", "l", "mn", "r"]) for letter in letters}
+
+Entry = namedtuple("Entry", ["id", "name", "age", "case_id"])
+Match = namedtuple("Match", ["score", "suspect"])
+Pair = namedtuple("Pair", ["score", "first", "second"])
+
+TABLES = {
+    #suspect -> its blocking keys; only suspects sharing a key (in neighbouring age bands) are ever compared
+    "suspect_blocks": "CREATE TABLE IF NOT EXISTS suspect_blocks (key TEXT NOT NULL, band INTEGER, "
+                      "suspect_id INTEGER NOT NULL, PRIMARY KEY (key, suspect_id)) WITHOUT ROWID",
+    #suspects written since they were last keyed (by any writer: imports, restores, raw sql)
+    "suspect_blocks_pending": "CREATE TABLE IF NOT EXISTS suspect_blocks_pending (suspect_id INTEGER PRIMARY KEY)",
+}
+INDEXES = ["CREATE INDEX IF NOT EXISTS ix_suspect_blocks_suspect_id ON suspect_blocks (suspect_id)"]
+
+#the keys themselves are computed in python (sqlite has no soundex), so the triggers only queue the row
+TRIGGERS = {
+    "suspect_blocks_ai": "AFTER INSERT ON suspects BEGIN "
+                         "INSERT OR IGNORE INTO suspect_blocks_pending (suspect_id) VALUES (new.id); END",
+    "suspect_blocks_au": "AFTER UPDATE OF name, age ON suspects BEGIN "
+                         "INSERT OR IGNORE INTO suspect_blocks_pending (suspect_id) VALUES (new.id); END",
+    "suspect_blocks_ad": "AFTER DELETE ON suspects BEGIN "
+                         "DELETE FROM suspect_blocks WHERE suspect_id = old.id; "
+                         "DELETE FROM suspect_blocks_pending WHERE suspect_id = old.id; END",
+}
+
+
+#names and keys
+
+def normalize(name):
+    #lowercase ascii words without titles: "Dr. José  O'Neil Jr." -> ["jose", "oneil"]
+    ascii_name = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode().lower()
+    words = re.findall(r"[a-z]+", ascii_name.replace("'", ""))
+    return [w for w in words if w not in NOISE_WORDS] or words
+
+
+def soundex(word):
+    #american soundex: first letter plus three digits ("robert" -> r163)
+    if not word:
+        return ""
+    digits = []
+    previous = SOUNDEX_CODES.get(word[0])
+    for letter in word[1:]:
+        code = SOUNDEX_CODES.get(letter)
+        if code is None:  #h and w do not separate letters with the same code
+            continue
+        if code != previous and code != "0":
+            digits.append(code)
+        previous = code
+    return (word[0] + "".join(digits) + "000")[:4]
+
+
+def blocking_keys(name):
+    #the soundex of first + last name, and two keys for what soundex cannot forgive (a wrong first letter):
+    #the trigram after the first letter of one name with the soundex of the other, so "Kathy Smith"/
+    #"Cathy Smith" meet on f:aths530 and "John Kowalski"/"John Cowalski" on l:j500owa
+    words = normalize(name)
+    if not words:
+        return []
+    first, last = words[0], words[-1]
+    return [f"p:{soundex(first)}{soundex(last)}", f"f:{first[1:4]}{soundex(last)}", f"l:{soundex(first)}{last[1:4]}"]
+
+
+def band(age):
+    return age // BAND_WIDTH if age is not None else None
+
+
+def jaro_winkler(a, b):
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    window = max(max(len(a), len(b)) // 2 - 1, 0)
+    b_used = [False] * len(b)
+    a_matches = []
+    for i, letter in enumerate(a):
+        for j in range(max(0, i - window), min(len(b), i + window + 1)):
+            if not b_used[j] and b[j] == letter:
+                b_used[j] = True
+                a_matches.append(letter)
+                break
+    if not a_matches:
+        return 0.0
+    b_matches = [letter for letter, used in zip(b, b_used) if used]
+    transpositions = sum(x != y for x, y in zip(a_matches, b_matches)) / 2
+    m = len(a_matches)
+    jaro = (m / len(a) + m / len(b) + (m - transpositions) / m) / 3
+    prefix = 0
+    for x, y in zip(a[:4], b[:4]):
+        if x != y:
+            break
+        prefix += 1
+    return jaro + prefix * 0.1 * (1 - jaro)
+
+
+def _similarity(words_a, age_a, words_b, age_b):
+    similarity = jaro_winkler(words_a, words_b)
+    if age_a is not None and age_b is not None:
+        similarity -= AGE_PENALTY * max(0, abs(age_a - age_b) - 1)
+    return round(similarity, 4)
+
+
+def score(name_a, age_a, name_b, age_b):
+    return _similarity(" ".join(normalize(name_a)), age_a, " ".join(normalize(name_b)), age_b)
+
+
+#the index
+
+def install(conn):
+    #creates the blocking tables and triggers (idempotent); keys every existing suspect the first time.
+    #re-run after a migration rebuilds suspects, which drops its triggers
+    existing = {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if "suspects" not in existing:
+        return
+    for ddl in list(TABLES.values()) + INDEXES:
+        conn.exec_driver_sql(ddl)
+    for name, body in TRIGGERS.items():
+        conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    if not all(table in existing for table in TABLES):
+        rebuild(conn)
+
+
+def uninstall(conn):
+    for name in TRIGGERS:
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+    for table in TABLES:
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {table}")
+
+
+def rebuild(conn):
+    #re-keys every suspect (repair after bulk loads with triggers off, or after changing the keys)
+    conn.exec_driver_sql("DELETE FROM suspect_blocks")
+    conn.exec_driver_sql("INSERT OR IGNORE INTO suspect_blocks_pending (suspect_id) SELECT id FROM suspects")
+    catch_up(conn)
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _install_after_create(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        install(connection)
+
+
+def _index(conn, suspects):
+    #(re)writes the keys of these (id, name, age) suspects and takes them off the queue
+    ids = [(suspect_id,) for suspect_id, _, _ in suspects]
+    conn.exec_driver_sql("DELETE FROM suspect_blocks WHERE suspect_id = ?", ids)
+    rows = [(key, band(age), suspect_id) for suspect_id, name, age in suspects for key in blocking_keys(name)]
+    if rows:
+        conn.exec_driver_sql("INSERT OR IGNORE INTO suspect_blocks (key, band, suspect_id) VALUES (?, ?, ?)", rows)
+    conn.exec_driver_sql("DELETE FROM suspect_blocks_pending WHERE suspect_id = ?", ids)
+
+
+def catch_up(conn, batch_size=BATCH_SIZE):
+    #keys every queued suspect; returns how many there were
+    total = 0
+    while True:
+        suspects = conn.exec_driver_sql(
+            "SELECT s.id, s.name, s.age FROM suspect_blocks_pending p JOIN suspects s ON s.id = p.suspect_id "
+            "LIMIT ?", (batch_size,)).fetchall()
+        if not suspects:
+            #anything left points at a suspect that no longer exists
+            conn.exec_driver_sql("DELETE FROM suspect_blocks_pending")
+            return total
+        _index(conn, suspects)
+        total += len(suspects)
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _index_flushed_suspects(session, flush_context):
+    #suspects written through the orm are keyed in the same transaction; other writers wait in the queue
+    suspects = [(obj.id, obj.name, obj.age) for obj in list(session.new) + list(session.dirty)
+                if getattr(obj, "__tablename__", None) == "suspects" and obj.id is not None]
+    if suspects:
+        _index(session.connection(), suspects)
+
+
+def sync(bind=None):
+    with (bind or engine).begin() as conn:
+        return catch_up(conn)
+
+
+def _sync_if_pending(bind):
+    #lookups only take a write transaction when the queue has something in it
+    with bind.connect() as conn:
+        pending = conn.exec_driver_sql("SELECT 1 FROM suspect_blocks_pending LIMIT 1").first()
+    if pending:
+        sync(bind)
+
+
+#lookups
+
+def _near(band_column, value):
+    #sql condition: the age band is unknown on either side, or within one band of value
+    if value is None:
+        return "1"
+    return f"({band_column} IS NULL OR {band_column} BETWEEN {int(value) - 1} AND {int(value) + 1})"
+
+
+def candidates(name, age=None, exclude_id=None, threshold=THRESHOLD, limit=20, bind=None):
+    #[Match] of stored suspects who may be the person with this name and age, best first
+    keys = blocking_keys(name)
+    if not keys:
+        return []
+    marks = ", ".join("?" * len(keys))
+    bind = bind or engine
+    _sync_if_pending(bind)
+    with bind.connect() as conn:
+        rows = conn.exec_driver_sql(
+            f"SELECT DISTINCT s.id, s.name, s.age, s.case_id FROM suspect_blocks b "
+            f"JOIN suspects s ON s.id = b.suspect_id WHERE b.key IN ({marks}) AND {_near('b.band', band(age))}",
+            tuple(keys)).fetchall()
+    matches = [Match(score(name, age, row[1], row[2]), Entry(*row)) for row in rows if row[0] != exclude_id]
+    matches = sorted((m for m in matches if m.score >= threshold), key=lambda m: (-m.score, m.suspect.id))
+    return matches[:limit]
+
+
+def candidates_for(suspect_id, threshold=THRESHOLD, limit=20, bind=None):
+    #[Match] for a stored suspect (None if there is no such suspect)
+    with (bind or engine).connect() as conn:
+        row = conn.execute(text("SELECT name, age FROM suspects WHERE id = :id"), {"id": suspect_id}).first()
+    if row is None:
+        return None
+    return candidates(row[0], row[1], exclude_id=suspect_id, threshold=threshold, limit=limit, bind=bind)
+
+
+def _block_pairs(members):
+    #candidate pairs within one key's block: members sorted by band (unknown first), compared with
+    #everyone in the same or the next band, and with everyone if either band is unknown
+    for i, a in enumerate(members):
+        for b in members[i + 1:]:
+            if a[0] is not None and b[0] > a[0] + 1:
+                break
+            yield a, b
+
+
+def find_duplicates(threshold=THRESHOLD, limit=None, bind=None, progress=None):
+    #[Pair] of suspects that look like the same person, best first: one pass over the blocking index,
+    #scoring only pairs that share a key. progress(blocks done, pairs scored) is called now and then
+    bind = bind or engine
+    found = {}
+    scored = blocks = 0
+    #keys whose block was too big to score; a pair sharing one of these still gets scored in a later block
+    oversized = set()
+    #beyond this age difference the penalty alone puts a pair under the threshold
+    max_gap = 1 + (1 - threshold) / AGE_PENALTY
+    _sync_if_pending(bind)
+    with bind.connect() as conn:
+        rows = conn.exec_driver_sql(
+            "SELECT b.key, b.band, s.id, s.name, s.age, s.case_id FROM suspect_blocks b "
+            "JOIN suspects s ON s.id = b.suspect_id ORDER BY b.key, b.band IS NOT NULL, b.band")
+        for key, block in groupby(rows, key=lambda row: row[0]):
+            block = list(block)
+            blocks += 1
+            if progress and blocks % 10000 == 0:
+                progress(blocks, scored)
+            if len(block) > MAX_BLOCK_SIZE:
+                oversized.add(key)
+                continue
+            if len(block) < 2:
+                continue
+            #(band, entry, normalized name, blocking keys)
+            members = [(row[1], Entry(*row[2:]), " ".join(normalize(row[3])), blocking_keys(row[3])) for row in block]
+            for (_, a, a_words, a_keys), (_, b, b_words, b_keys) in _block_pairs(members):
+                #blocks arrive in key order: a pair sharing an earlier key was scored there already, unless
+                #that block was skipped for its size
+                if any(x == y and x < key and x not in oversized for x, y in zip(a_keys, b_keys)):
+                    continue
+                if a.age is not None and b.age is not None and abs(a.age - b.age) > max_gap:
+                    continue
+                scored += 1
+                similarity = _similarity(a_words, a.age, b_words, b.age)
+                if similarity >= threshold:
+                    first, second = (a, b) if a.id < b.id else (b, a)
+                    found[first.id, second.id] = Pair(similarity, first, second)
+    pairs = sorted(found.values(), key=lambda p: (-p.score, p.first.id, p.second.id))
+    return pairs[:limit] if limit else pairs
@@ -0,0 +1,300 @@
+import csv
+import math
+import os
+import re
+from collections import namedtuple
+
+from sqlalchemy import event
+
+from database import Base, engine
+
+#offline gazetteer: csv with kind (region/place), name, region, latitude, longitude
+GAZETTEER_PATH = os.environ.get("CRIME_GAZETTEER",
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.csv"))
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+#hotspot grid: cells of this many degrees (about 1.1 km north-south)
+GRID_DEGREES = 0.01
+BATCH_SIZE = 5000
+
+Geocode = namedtuple("Geocode", ["latitude", "longitude", "precision"])
+Hotspot = namedtuple("Hotspot", ["latitude", "longitude", "cases", "south", "west", "north", "east"])
+
+#"..., Springfield, IL 62701" at the end of a us-style address
+_CITY_REGION_ZIP = re.compile(r"([^,\n]+),\s*([A-Za-z]{2})\s+\d{5}(?:-\d{4})?\s*$")
+
+
+def _key(text):
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+class Gazetteer:
+    def __init__(self, rows=()):
+        #rows: (kind, name, region, latitude, longitude)
+        self.places = {}        #(name, region) -> (lat, lon)
+        self.place_names = {}   #name -> (lat, lon) of its first listing
+        self.regions = {}       #region code or name -> (lat, lon)
+        self.listed = []        #(name, region) of every place, as written
+        for kind, name, region, latitude, longitude in rows:
+            point = (float(latitude), float(longitude))
+            if kind == "region":
+                self.regions.setdefault(_key(region), point)
+                self.regions.setdefault(_key(name), point)
+            else:
+                self.places.setdefault((_key(name), _key(region)), point)
+                self.place_names.setdefault(_key(name), point)
+                self.listed.append((name, region))
+
+    @classmethod
+    def load(cls, path=None):
+        with open(path or GAZETTEER_PATH, newline="", encoding="utf-8") as f:
+            return cls((row["kind"], row["name"], row["region"], row["latitude"], row["longitude"])
+                       for row in csv.DictReader(f))
+
+    def geocode(self, text):
+        #the most specific match for free-text location: a known place in its region, then any known
+        #place name among the comma-separated parts, then the region's centre; None if nothing matches
+        if not text:
+            return None
+        tail = _CITY_REGION_ZIP.search(text)
+        if tail:
+            city, region = _key(tail.group(1)), _key(tail.group(2))
+            if (city, region) in self.places:
+                return Geocode(*self.places[city, region], "place")
+        parts = [_key(part) for part in re.split(r"[,\n]", text)]
+        for part in reversed(parts + [_key(text)]):
+            if part in self.place_names:
+                return Geocode(*self.place_names[part], "place")
+        if tail and _key(tail.group(2)) in self.regions:
+            return Geocode(*self.regions[_key(tail.group(2))], "region")
+        for part in reversed(parts):
+            if part in self.regions:
+                return Geocode(*self.regions[part], "region")
+        return None
+
+
+_gazetteer = None
+
+
+def gazetteer():
+    #the gazetteer at GAZETTEER_PATH, loaded on first use
+    global _gazetteer
+    if _gazetteer is None:
+        #without a gazetteer file nothing is located, but saving cases still works
+        _gazetteer = Gazetteer.load() if os.path.exists(GAZETTEER_PATH) else Gazetteer()
+    return _gazetteer
+
+
+def geocode(text):
+    return gazetteer().geocode(text)
+
+
+#distances and boxes
+
+def distance_km(lat1, lon1, lat2, lon2):
+    #great-circle (haversine) distance
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def radius_box(latitude, longitude, km):
+    #(south, west, north, east) enclosing every point within km of the centre
+    dlat = km / KM_PER_DEGREE
+    south, north = max(-90.0, latitude - dlat), min(90.0, latitude + dlat)
+    widest = math.cos(math.radians(max(abs(south), abs(north))))
+    if north >= 90 or south <= -90 or widest * 180 <= dlat:
+        return south, -180.0, north, 180.0
+    dlon = dlat / widest
+    return south, longitude - dlon, north, longitude + dlon
+
+
+def _boxes(south, west, north, east):
+    #splits a box that crosses the antimeridian (west > east, or past +-180) in two
+    if east - west >= 360:
+        return [(south, -180.0, north, 180.0)]
+    west = (west + 180) % 360 - 180
+    east = (east + 180) % 360 - 180
+    if west <= east:
+        return [(south, west, north, east)]
+    return [(south, west, north, 180.0), (south, -180.0, north, east)]
+
+
+#the spatial index: an r*tree of case coordinates, and case counts per grid cell for hotspots, both kept
+#current by triggers
+
+def _cell(column):
+    #floor(column / GRID_DEGREES) without sqlite's optional math functions
+    x = f"({column} / {GRID_DEGREES})"
+    return f"(CAST({x} AS INTEGER) - ({x} < CAST({x} AS INTEGER)))"
+
+
+def cell(latitude, longitude):
+    return math.floor(latitude / GRID_DEGREES), math.floor(longitude / GRID_DEGREES)
+
+
+TABLES = {
+    "cases_rtree": "CREATE VIRTUAL TABLE IF NOT EXISTS cases_rtree USING rtree(id, south, north, west, east)",
+    "case_grid": "CREATE TABLE IF NOT EXISTS case_grid (cell_lat INTEGER NOT NULL, cell_lon INTEGER NOT NULL, "
+                 "count INTEGER NOT NULL, PRIMARY KEY (cell_lat, cell_lon)) WITHOUT ROWID",
+}
+INDEXES = ["CREATE INDEX IF NOT EXISTS ix_case_grid_count ON case_grid (count)"]
+
+
+def _indexed(row):
+    #located cases, except those only placed at their region's centre: that point can be hundreds of km
+    #from the case, and every such case in a region would stack up on it as neighbours and a hotspot
+    return f"{row}.latitude IS NOT NULL AND {row}.longitude IS NOT NULL AND {row}.geo_precision IS NOT 'region'"
+
+
+def _add(row):
+    located = _indexed(row)
+    return (f"INSERT INTO cases_rtree (id, south, north, west, east) SELECT {row}.id, {row}.latitude, "
+            f"{row}.latitude, {row}.longitude, {row}.longitude WHERE {located}; "
+            f"INSERT INTO case_grid (cell_lat, cell_lon, count) SELECT {_cell(row + '.latitude')}, "
+            f"{_cell(row + '.longitude')}, 1 WHERE {located} "
+            f"ON CONFLICT (cell_lat, cell_lon) DO UPDATE SET count = count + 1;")
+
+
+def _remove(row):
+    #cases that were never counted (unlocated, or region-level) leave the grid alone
+    cell_match = f"cell_lat = {_cell(row + '.latitude')} AND cell_lon = {_cell(row + '.longitude')}"
+    return (f"DELETE FROM cases_rtree WHERE id = {row}.id; "
+            f"UPDATE case_grid SET count = count - 1 WHERE {cell_match} AND {_indexed(row)}; "
+            f"DELETE FROM case_grid WHERE {cell_match} AND count <= 0;")
+
+
+TRIGGERS = {
+    "geo_cases_ai": f"AFTER INSERT ON cases BEGIN {_add('new')} END",
+    "geo_cases_ad": f"AFTER DELETE ON cases BEGIN {_remove('old')} END",
+    "geo_cases_au": f"AFTER UPDATE OF latitude, longitude, geo_precision ON cases BEGIN "
+                    f"{_remove('old')} {_add('new')} END",
+}
+
+
+def install(conn):
+    #creates the r*tree, the grid and their triggers (idempotent); fills them the first time
+    existing = {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if "cases" not in existing:
+        return
+    for ddl in list(TABLES.values()) + INDEXES:
+        conn.exec_driver_sql(ddl)
+    for name, body in TRIGGERS.items():
+        conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    if not all(table in existing for table in TABLES):
+        rebuild(conn)
+
+
+def uninstall(conn):
+    for name in TRIGGERS:
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+    for table in TABLES:
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {table}")
+
+
+def rebuild(conn):
+    conn.exec_driver_sql("DELETE FROM cases_rtree")
+    conn.exec_driver_sql("INSERT INTO cases_rtree (id, south, north, west, east) "
+                         f"SELECT id, latitude, latitude, longitude, longitude FROM cases WHERE {_indexed('cases')}")
+    conn.exec_driver_sql("DELETE FROM case_grid")
+    conn.exec_driver_sql(f"INSERT INTO case_grid (cell_lat, cell_lon, count) "
+                         f"SELECT {_cell('latitude')}, {_cell('longitude')}, count(*) FROM cases "
+                         f"WHERE {_indexed('cases')} GROUP BY 1, 2")
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _install_after_create(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        install(connection)
+
+
+def geocode_cases(conn, everything=False, batch_size=BATCH_SIZE):
+    #fills latitude/longitude/geo_precision from the gazetteer for cases without coordinates (every case
+    #if everything); returns how many cases were located
+    located = 0
+    last_id = 0
+    missing = "" if everything else "AND latitude IS NULL "
+    while True:
+        rows = conn.exec_driver_sql(f"SELECT id, location FROM cases WHERE id > ? {missing}ORDER BY id LIMIT ?",
+                                    (last_id, batch_size)).fetchall()
+        if not rows:
+            return located
+        updates = []
+        for case_id, location in rows:
+            point = geocode(location)
+            if point is not None:
+                updates.append((point.latitude, point.longitude, point.precision, case_id))
+            elif everything:
+                updates.append((None, None, None, case_id))
+        if updates:
+            conn.exec_driver_sql("UPDATE cases SET latitude = ?, longitude = ?, geo_precision = ? WHERE id = ?",
+                                 updates)
+        located += sum(1 for update in updates if update[0] is not None)
+        last_id = rows[-1][0]
+
+
+#queries; each returns case ids, which Case.within / in_box / near turn into cases. cases located only
+#to a region are not indexed, so none of them come up
+
+def box_ids(conn, south, west, north, east):
+    #[(id, latitude, longitude)] of cases inside the box, from the r*tree
+    found = []
+    for box in _boxes(south, west, north, east):
+        found.extend(conn.exec_driver_sql(
+            "SELECT c.id, c.latitude, c.longitude FROM cases_rtree r JOIN cases c ON c.id = r.id "
+            "WHERE r.north >= ? AND r.south <= ? AND r.east >= ? AND r.west <= ?",
+            (box[0], box[2], box[1], box[3])))
+    #the r*tree stores 32-bit floats rounded outwards, so the edges are checked against the real columns
+    return [(case_id, lat, lon) for case_id, lat, lon in found
+            if south <= lat <= north and any(w <= lon <= e for _, w, _, e in _boxes(south, west, north, east))]
+
+
+def within(latitude, longitude, km, limit=None, bind=None):
+    #[(case id, distance km)] within km of the point, nearest first
+    with (bind or engine).connect() as conn:
+        candidates = box_ids(conn, *radius_box(latitude, longitude, km))
+    found = sorted((distance_km(latitude, longitude, lat, lon), case_id) for case_id, lat, lon in candidates)
+    return [(case_id, distance) for distance, case_id in found if distance <= km][:limit]
+
+
+def in_box(south, west, north, east, limit=None, bind=None):
+    #[case id] inside the box (west > east crosses the antimeridian), in id order
+    with (bind or engine).connect() as conn:
+        return sorted(case_id for case_id, _, _ in box_ids(conn, south, west, north, east))[:limit]
+
+
+def hotspots(min_cases=5, limit=10, box=None, bind=None):
+    #[Hotspot] clusters of adjacent grid cells holding at least min_cases cases each, busiest first.
+    #box (south, west, north, east) limits the search to one area
+    sql = "SELECT cell_lat, cell_lon, count FROM case_grid WHERE count >= ?"
+    params = [min_cases]
+    if box is not None:
+        south, west, north, east = box
+        (south_cell, west_cell), (north_cell, east_cell) = cell(south, west), cell(north, east)
+        sql += " AND cell_lat BETWEEN ? AND ? AND cell_lon BETWEEN ? AND ?"
+        params += [south_cell, north_cell, west_cell, east_cell]
+    with (bind or engine).connect() as conn:
+        cells = {(row[0], row[1]): row[2] for row in conn.exec_driver_sql(sql, tuple(params))}
+    clusters = []
+    unvisited = set(cells)
+    while unvisited:
+        stack = [unvisited.pop()]
+        members = []
+        while stack:
+            i, j = stack.pop()
+            members.append((i, j))
+            for neighbour in ((i + di, j + dj) for di in (-1, 0, 1) for dj in (-1, 0, 1)):
+                if neighbour in unvisited:
+                    unvisited.remove(neighbour)
+                    stack.append(neighbour)
+        total = sum(cells[m] for m in members)
+        clusters.append(Hotspot(
+            round(sum((i + 0.5) * cells[i, j] for i, j in members) * GRID_DEGREES / total, 5),
+            round(sum((j + 0.5) * cells[i, j] for i, j in members) * GRID_DEGREES / total, 5),
+            total,
+            round(min(i for i, _ in members) * GRID_DEGREES, 5), round(min(j for _, j in members) * GRID_DEGREES, 5),
+            round((max(i for i, _ in members) + 1) * GRID_DEGREES, 5),
+            round((max(j for _, j in members) + 1) * GRID_DEGREES, 5)))
+    clusters.sort(key=lambda h: -h.cases)
+    return clusters[:limit]
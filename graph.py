@@ -0,0 +1,450 @@
+from array import array
+from bisect import bisect_right
+from collections import defaultdict, deque, namedtuple
+
+from sqlalchemy import event
+
+from database import Base, engine
+
+#node kinds keyed by integer row id, in layout order; evidence locations follow them, keyed by text
+ID_KINDS = ("case", "suspect", "detective", "evidence")
+LOCATION = "location"
+
+#edge sources: (kind a, kind b, sql giving (a key, b key)); locations are compared trimmed and lowercased,
+#and case ids that are not integers (free text left in old rows) link nothing
+LOCATION_KEY = "lower(trim({column}))"
+EDGE_SOURCES = [
+    ("suspect", "case", "SELECT id, case_id FROM suspects WHERE typeof(case_id) = 'integer'"),
+    ("detective", "case", "SELECT detective_id, case_id FROM detective_case"),
+    ("evidence", "case", "SELECT id, case_id FROM evidence WHERE typeof(case_id) = 'integer'"),
+    ("evidence", LOCATION, f"SELECT id, {LOCATION_KEY.format(column='found_location')} FROM evidence "
+                           f"WHERE trim(found_location) != ''"),
+]
+#tables whose rows are the nodes of each id kind
+KIND_TABLES = {"case": "cases", "suspect": "suspects", "detective": "detectives", "evidence": "evidence"}
+
+Node = namedtuple("Node", ["kind", "key"])
+
+
+def location_key(text):
+    #python's version of LOCATION_KEY (sqlite's lower() only folds ascii)
+    return "".join(c.lower() if c.isascii() else c for c in text.strip(" "))
+
+
+#change log for long-lived graphs (see build(follow=...)). while at least one graph follows it, triggers
+#record every edge added (+1) or removed (-1) so those graphs can catch up; with no followers nothing is
+#written, so bulk loads and one-off builds cost nothing extra
+LOG_TABLE = ("CREATE TABLE IF NOT EXISTS graph_log (seq INTEGER PRIMARY KEY AUTOINCREMENT, delta INTEGER NOT NULL, "
+             "a_kind TEXT NOT NULL, a_key NOT NULL, b_kind TEXT NOT NULL, b_key NOT NULL)")
+#followers by name, with the last entry each has applied
+FOLLOWERS_TABLE = "CREATE TABLE IF NOT EXISTS graph_followers (name TEXT PRIMARY KEY, seq INTEGER NOT NULL)"
+FOLLOWED = "WHEN EXISTS (SELECT 1 FROM graph_followers)"
+#the log keeps roughly the last LOG_LIMIT entries (trimmed every TRIM_EVERY); a follower that falls
+#further behind than that finds its position gone and rebuilds
+LOG_LIMIT = 200000
+TRIM_EVERY = 1000
+
+
+def _log(delta, a_kind, a_key, b_kind, b_key):
+    #only edges EDGE_SOURCES would have read: a real location or an integer case id
+    valid = f"{b_key} != ''" if b_kind == LOCATION else f"typeof({b_key}) = 'integer'"
+    return (f"INSERT INTO graph_log (delta, a_kind, a_key, b_kind, b_key) "
+            f"SELECT {delta}, '{a_kind}', {a_key}, '{b_kind}', {b_key} WHERE {valid};")
+
+
+def _triggers():
+    location = {row: LOCATION_KEY.format(column=f"{row}.found_location") for row in ("new", "old")}
+
+    def evidence(delta, row):
+        return (_log(delta, "evidence", f"{row}.id", "case", f"{row}.case_id") + " "
+                + _log(delta, "evidence", f"{row}.id", LOCATION, location[row]))
+
+    return {
+        "graph_log_suspect_ai": f"AFTER INSERT ON suspects {FOLLOWED} BEGIN "
+                                f"{_log(1, 'suspect', 'new.id', 'case', 'new.case_id')} END",
+        "graph_log_suspect_ad": f"AFTER DELETE ON suspects {FOLLOWED} BEGIN "
+                                f"{_log(-1, 'suspect', 'old.id', 'case', 'old.case_id')} END",
+        "graph_log_suspect_au": f"AFTER UPDATE OF case_id ON suspects {FOLLOWED} BEGIN "
+                                f"{_log(-1, 'suspect', 'old.id', 'case', 'old.case_id')} "
+                                f"{_log(1, 'suspect', 'new.id', 'case', 'new.case_id')} END",
+        "graph_log_link_ai": f"AFTER INSERT ON detective_case {FOLLOWED} BEGIN "
+                             f"{_log(1, 'detective', 'new.detective_id', 'case', 'new.case_id')} END",
+        "graph_log_link_ad": f"AFTER DELETE ON detective_case {FOLLOWED} BEGIN "
+                             f"{_log(-1, 'detective', 'old.detective_id', 'case', 'old.case_id')} END",
+        "graph_log_evidence_ai": f"AFTER INSERT ON evidence {FOLLOWED} BEGIN {evidence(1, 'new')} END",
+        "graph_log_evidence_ad": f"AFTER DELETE ON evidence {FOLLOWED} BEGIN {evidence(-1, 'old')} END",
+        "graph_log_evidence_au": f"AFTER UPDATE OF case_id, found_location ON evidence {FOLLOWED} BEGIN "
+                                 f"{evidence(-1, 'old')} {evidence(1, 'new')} END",
+        "graph_log_trim": f"AFTER INSERT ON graph_log WHEN new.seq % {TRIM_EVERY} = 0 BEGIN "
+                          f"DELETE FROM graph_log WHERE seq <= new.seq - {LOG_LIMIT}; END",
+    }
+
+
+def install(conn):
+    #creates the change log and its triggers (idempotent). re-run after a migration rebuilds
+    #suspects, evidence or detective_case, which drops their triggers
+    existing = {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if not all(table in existing for table in ("suspects", "evidence", "detective_case")):
+        return
+    conn.exec_driver_sql(LOG_TABLE)
+    conn.exec_driver_sql(FOLLOWERS_TABLE)
+    for name, body in _triggers().items():
+        conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+
+def uninstall(conn):
+    for name in _triggers():
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+    conn.exec_driver_sql("DROP TABLE IF EXISTS graph_followers")
+    conn.exec_driver_sql("DROP TABLE IF EXISTS graph_log")
+
+
+def _last_seq(conn):
+    #seq of the last entry ever logged (AUTOINCREMENT keeps counting after entries are deleted)
+    return conn.exec_driver_sql("SELECT seq FROM sqlite_sequence WHERE name = 'graph_log'").scalar() or 0
+
+
+def _log_start(conn):
+    #seq of the oldest entry still logged, or of the next one if the log is empty
+    first = conn.exec_driver_sql("SELECT min(seq) FROM graph_log").scalar()
+    return first if first is not None else _last_seq(conn) + 1
+
+
+def _prune(conn):
+    #drops followers that have fallen behind the trimmed log (they rebuild when they next sync), then the
+    #entries every remaining follower has applied; with no followers left the log empties
+    conn.exec_driver_sql("DELETE FROM graph_followers WHERE seq < ?", (_log_start(conn) - 1,))
+    conn.exec_driver_sql("DELETE FROM graph_log WHERE seq <= coalesce((SELECT min(seq) FROM graph_followers), ?)",
+                         (_last_seq(conn),))
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _install_after_create(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        install(connection)
+
+
+#in-memory link graph: an immutable CSR (compressed sparse row) adjacency built in one pass, plus a small
+#overlay of edges added and removed since, which compact() folds back in
+class Graph:
+    def __init__(self, sizes, locations, offsets, targets, seq, follower=None):
+        #sizes: {id kind: max id + 1}; locations: [location text] in node order; follower: the name this
+        #graph follows the change log under, if it does
+        self._kind_starts = []
+        start = 0
+        for kind in ID_KINDS:
+            self._kind_starts.append(start)
+            start += sizes.get(kind, 0)
+        self._sizes = dict(sizes)
+        self._location_start = start
+        self._locations = list(locations)
+        self._location_index = {text: start + i for i, text in enumerate(self._locations)}
+        #nodes that appeared after the build (new ids past the end of their range, new locations)
+        self._extra = {}
+        self._extra_nodes = []
+        self._offsets = offsets
+        self._targets = targets
+        self._added = defaultdict(list)
+        self._removed = set()
+        self.seq = seq
+        self.follower = follower
+
+    #nodes
+
+    @property
+    def node_count(self):
+        return self._location_start + len(self._locations) + len(self._extra_nodes)
+
+    @property
+    def edge_count(self):
+        return (len(self._targets) + sum(len(v) for v in self._added.values()) - len(self._removed)) // 2
+
+    def index(self, kind, key, create=False):
+        #node index of (kind, key); None if the graph has never seen it (unless create)
+        if kind in ID_KINDS:
+            key = int(key)
+            if 0 <= key < self._sizes.get(kind, 0):
+                return self._kind_starts[ID_KINDS.index(kind)] + key
+        elif kind == LOCATION:
+            key = location_key(key)
+            if key in self._location_index:
+                return self._location_index[key]
+        else:
+            raise ValueError(f"Unknown node kind: {kind}")
+        node = self._extra.get((kind, key))
+        if node is None and create:
+            node = self._extra[kind, key] = self.node_count
+            self._extra_nodes.append(Node(kind, key))
+        return node
+
+    def node(self, index):
+        if index >= self._location_start + len(self._locations):
+            return self._extra_nodes[index - self._location_start - len(self._locations)]
+        if index >= self._location_start:
+            return Node(LOCATION, self._locations[index - self._location_start])
+        position = bisect_right(self._kind_starts, index) - 1
+        #kinds with no rows share a start with the next kind; the last of them is the one that holds index
+        return Node(ID_KINDS[position], index - self._kind_starts[position])
+
+    #edges
+
+    def neighbours(self, index):
+        if index + 1 < len(self._offsets):
+            base = self._targets[self._offsets[index]:self._offsets[index + 1]]
+            if self._removed:
+                base = [v for v in base if (index, v) not in self._removed]
+        else:
+            base = []
+        extra = self._added.get(index)
+        return list(base) + extra if extra else base
+
+    def _change(self, u, v, delta):
+        if delta > 0:
+            if (u, v) in self._removed:
+                self._removed.discard((u, v))
+            else:
+                self._added[u].append(v)
+        else:
+            if v in self._added.get(u, ()):
+                self._added[u].remove(v)
+            else:
+                self._removed.add((u, v))
+
+    def add_edge(self, a, b):
+        #a and b are (kind, key) nodes
+        u, v = self.index(*a, create=True), self.index(*b, create=True)
+        self._change(u, v, 1)
+        self._change(v, u, 1)
+
+    def remove_edge(self, a, b):
+        u, v = self.index(*a), self.index(*b)
+        if u is None or v is None:
+            return
+        self._change(u, v, -1)
+        self._change(v, u, -1)
+
+    def sync(self, bind=None):
+        #applies the changes logged since the build (or the last sync); returns how many, or None if the
+        #graph needs rebuilding: it does not follow the log, or the log no longer reaches back that far
+        if self.follower is None:
+            return None
+        with (bind or engine).begin() as conn:
+            following = conn.exec_driver_sql("SELECT 1 FROM graph_followers WHERE name = ?", (self.follower,)).first()
+            if following is None or _log_start(conn) > self.seq + 1:
+                return None
+            rows = conn.exec_driver_sql("SELECT seq, delta, a_kind, a_key, b_kind, b_key FROM graph_log "
+                                        "WHERE seq > ? ORDER BY seq", (self.seq,)).fetchall()
+            for seq, delta, a_kind, a_key, b_kind, b_key in rows:
+                if delta > 0:
+                    self.add_edge((a_kind, a_key), (b_kind, b_key))
+                else:
+                    self.remove_edge((a_kind, a_key), (b_kind, b_key))
+                self.seq = seq
+            conn.exec_driver_sql("UPDATE graph_followers SET seq = ? WHERE name = ?", (self.seq, self.follower))
+            _prune(conn)
+        return len(rows)
+
+    def unfollow(self, bind=None):
+        #stops following the change log; once no graph follows it, nothing more is logged
+        if self.follower is None:
+            return
+        with (bind or engine).begin() as conn:
+            conn.exec_driver_sql("DELETE FROM graph_followers WHERE name = ?", (self.follower,))
+            _prune(conn)
+        self.follower = None
+
+    def compact(self):
+        #folds the overlay into the CSR arrays (new nodes keep their indexes)
+        count = self.node_count
+        offsets = array("q", [0]) * (count + 1)
+        for u in range(count):
+            offsets[u + 1] = offsets[u] + len(self.neighbours(u))
+        targets = array("i", [0]) * offsets[count]
+        for u in range(count):
+            targets[offsets[u]:offsets[u + 1]] = array("i", self.neighbours(u))
+        self._offsets, self._targets = offsets, targets
+        self._added.clear()
+        self._removed.clear()
+
+    #queries. `through` limits which kinds of node a walk may pass through (endpoints are exempt), e.g.
+    #{"case", "suspect", "detective"} to keep busy locations from joining everything to everything
+
+    def _start(self, node):
+        index = self.index(*node)
+        if index is None:
+            raise KeyError(f"No such node: {node[0]} {node[1]}")
+        return index
+
+    def kind(self, index):
+        if index >= self._location_start:
+            return self.node(index).kind
+        return ID_KINDS[bisect_right(self._kind_starts, index) - 1]
+
+    def neighbourhood(self, node, hops=2, kinds=None, through=None, limit=None):
+        #[(Node, distance)] of everything within `hops` links of node, nearest first (only the given
+        #kinds, if any; other kinds are still walked through)
+        start = self._start(node)
+        seen = {start}
+        frontier = [start]
+        found = []
+        for distance in range(1, hops + 1):
+            next_frontier = []
+            for u in frontier:
+                if u != start and through is not None and self.kind(u) not in through:
+                    continue
+                for v in self.neighbours(u):
+                    if v not in seen:
+                        seen.add(v)
+                        next_frontier.append(v)
+                        if kinds is None or self.kind(v) in kinds:
+                            found.append((self.node(v), distance))
+                            if limit and len(found) >= limit:
+                                return found
+            frontier = next_frontier
+            if not frontier:
+                break
+        return found
+
+    def shortest_path(self, a, b, through=None, max_hops=None):
+        #[Node] from a to b along the fewest links (None if they are not connected): breadth-first
+        #from both ends, always expanding the smaller frontier
+        source, target = self._start(a), self._start(b)
+        if source == target:
+            return [self.node(source)]
+        parents = [{source: None}, {target: None}]
+        frontiers = [[source], [target]]
+        hops = 0
+        while frontiers[0] and frontiers[1] and (max_hops is None or hops < max_hops):
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            mine, theirs = parents[side], parents[1 - side]
+            next_frontier = []
+            for u in frontiers[side]:
+                if through is not None and u not in (source, target) and self.kind(u) not in through:
+                    continue
+                for v in self.neighbours(u):
+                    if v in mine:
+                        continue
+                    mine[v] = u
+                    if v in theirs and (through is None or v in (source, target) or self.kind(v) in through):
+                        return self._join(parents, v)
+                    next_frontier.append(v)
+            frontiers[side] = next_frontier
+            hops += 1
+        return None
+
+    def _join(self, parents, meeting):
+        path = []
+        node = meeting
+        while node is not None:
+            path.append(node)
+            node = parents[0][node]
+        path.reverse()
+        node = parents[1][meeting]
+        while node is not None:
+            path.append(node)
+            node = parents[1][node]
+        return [self.node(index) for index in path]
+
+    def component_labels(self, through=None):
+        #array of component numbers by node index; isolated nodes get a component of their own, and
+        #nodes of kinds outside `through` none (-1)
+        count = self.node_count
+        labels = array("i", [-1]) * count
+        walkable = [self.kind(u) in through for u in range(count)] if through is not None else None
+        component = 0
+        for start in range(count):
+            if labels[start] != -1 or (walkable is not None and not walkable[start]):
+                continue
+            labels[start] = component
+            queue = deque([start])
+            while queue:
+                for v in self.neighbours(queue.popleft()):
+                    if labels[v] == -1 and (walkable is None or walkable[v]):
+                        labels[v] = component
+                        queue.append(v)
+            component += 1
+        return labels
+
+    def component(self, node, kinds=None, through=None):
+        #[Node] connected to node, node first; like components(), nodes outside `through` are left out
+        start = Node(*node)
+        rest = [found for found, _ in self.neighbourhood(node, self.node_count, kinds, through)
+                if through is None or found.kind in through]
+        return ([start] if kinds is None or start.kind in kinds else []) + rest
+
+    def components(self, min_size=2, kinds=None, through=None, limit=None):
+        #[[Node]] of connected groups with at least min_size members (counting only the given kinds),
+        #largest first
+        labels = self.component_labels(through)
+        members = defaultdict(list)
+        for index, label in enumerate(labels):
+            if label != -1 and (kinds is None or self.kind(index) in kinds):
+                members[label].append(index)
+        groups = sorted((m for m in members.values() if len(m) >= min_size), key=len, reverse=True)
+        return [[self.node(index) for index in group] for group in groups[:limit]]
+
+
+def build(bind=None, follow=None):
+    #reads every edge source once and lays the graph out as CSR arrays. follow names a graph that will
+    #be kept up to date with sync(): changes are logged from now until it unfollows (or falls too far
+    #behind). one-off graphs leave it out, and nothing is logged for them
+    bind = bind or engine
+    if follow is not None:
+        #registered before the read, so every change the snapshot misses is logged
+        with bind.begin() as conn:
+            conn.exec_driver_sql("INSERT OR REPLACE INTO graph_followers (name, seq) VALUES (?, ?)",
+                                 (follow, _last_seq(conn)))
+    location_index = {}
+    edges = []
+    with bind.connect() as conn, conn.begin():
+        #one read transaction, so the edges and the log position come from the same snapshot
+        seq = _last_seq(conn)
+        sizes = {kind: (conn.exec_driver_sql(f"SELECT max(id) FROM {table}").scalar() or 0) + 1
+                 for kind, table in KIND_TABLES.items()}
+        for a_kind, b_kind, sql in EDGE_SOURCES:
+            a_keys, b_keys = array("q"), array("q")
+            for a_key, b_key in conn.exec_driver_sql(sql):
+                if b_kind == LOCATION:
+                    b_key = location_index.setdefault(b_key, len(location_index))
+                a_keys.append(a_key)
+                b_keys.append(b_key)
+            edges.append((a_kind, a_keys, b_kind, b_keys))
+    #old rows can point past the last id (dangling references); their nodes still get a slot
+    for a_kind, a_keys, b_kind, b_keys in edges:
+        for kind, keys in ((a_kind, a_keys), (b_kind, b_keys)):
+            if kind != LOCATION and keys:
+                sizes[kind] = max(sizes[kind], max(keys) + 1)
+    starts = {}
+    start = 0
+    for kind in ID_KINDS:
+        starts[kind] = start
+        start += sizes[kind]
+    starts[LOCATION] = start
+    sources, destinations = array("i"), array("i")
+    for a_kind, a_keys, b_kind, b_keys in edges:
+        a_start, b_start = starts[a_kind], starts[b_kind]
+        sources.extend(a_start + key for key in a_keys)
+        destinations.extend(b_start + key for key in b_keys)
+    del edges
+    count = start + len(location_index)
+    #counting sort of both directions of every edge into per-node runs
+    offsets = array("q", [0]) * (count + 1)
+    for u in sources:
+        offsets[u + 1] += 1
+    for v in destinations:
+        offsets[v + 1] += 1
+    for u in range(count):
+        offsets[u + 1] += offsets[u]
+    fill = array("q", offsets)
+    targets = array("i", [0]) * offsets[count]
+    for u, v in zip(sources, destinations):
+        targets[fill[u]] = v
+        fill[u] += 1
+        targets[fill[v]] = u
+        fill[v] += 1
+    graph = Graph(sizes, sorted(location_index, key=location_index.get), offsets, targets, seq, follow)
+    if follow is not None:
+        with bind.begin() as conn:
+            conn.exec_driver_sql("UPDATE graph_followers SET seq = ? WHERE name = ?", (seq, follow))
+            _prune(conn)
+    return graph
@@ -0,0 +1,211 @@
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Mapper, Session as OrmSession
+
+slow_log = logging.getLogger("crime.sql.slow")
+
+#statements slower than this (milliseconds) go to the slow-query log
+SLOW_QUERY_MS = float(os.environ.get("CRIME_SLOW_QUERY_MS", 100))
+
+UNTRACKED = "(outside any operation)"
+
+#innermost logical operation running in this thread/task
+_current = contextvars.ContextVar("crime_operation", default=None)
+
+
+class OperationStats:
+    def __init__(self):
+        self.calls = 0
+        self.wall_time = 0.0
+        self.statements = 0
+        self.sql_time = 0.0
+        self.max_statement = 0.0
+        self.rows = 0
+        self.checkouts = 0
+        self.checkout_time = 0.0
+        self.flushes = 0
+        self.commits = 0
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "wall_ms": self.wall_time * 1000,
+            "statements": self.statements,
+            "sql_ms": self.sql_time * 1000,
+            "max_statement_ms": self.max_statement * 1000,
+            "rows": self.rows,
+            "checkouts": self.checkouts,
+            "checkout_ms": self.checkout_time * 1000,
+            "flushes": self.flushes,
+            "commits": self.commits,
+        }
+
+
+#collects per-operation sql statistics from engine, pool, session and mapper events while enabled
+class Profiler:
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self.enabled = False
+        self.slow_queries = []
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._wrapped_pools = []
+
+    #recording
+
+    def _bucket(self):
+        name = _current.get() or UNTRACKED
+        stats = self._stats.get(name)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(name, OperationStats())
+        return stats
+
+    @contextmanager
+    def operation(self, name):
+        #groups every statement issued inside the block under `name` (nested blocks count separately)
+        if not self.enabled:
+            yield
+            return
+        token = _current.set(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats = self._bucket()
+            stats.calls += 1
+            stats.wall_time += time.perf_counter() - started
+            _current.reset(token)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = self._bucket()
+        stats.statements += 1
+        stats.sql_time += elapsed
+        stats.max_statement = max(stats.max_statement, elapsed)
+        if cursor.rowcount and cursor.rowcount > 0:  #rows written; selected rows are counted as they load
+            stats.rows += cursor.rowcount
+        if elapsed * 1000 >= self.slow_query_ms:
+            entry = {"operation": _current.get() or UNTRACKED, "ms": elapsed * 1000, "statement": statement}
+            self.slow_queries.append(entry)
+            slow_log.warning("slow query (%.1f ms) in %s: %s", entry["ms"], entry["operation"], statement)
+
+    def _on_load(self, target, context):
+        self._bucket().rows += 1
+
+    def _after_flush(self, session, flush_context):
+        self._bucket().flushes += 1
+
+    def _after_commit(self, session):
+        self._bucket().commits += 1
+
+    def _wrap_pool(self, engine):
+        #no event fires before a checkout starts, so time the pool's connect() itself
+        pool = engine.pool
+        original = pool.connect
+
+        def timed_connect():
+            started = time.perf_counter()
+            try:
+                return original()
+            finally:
+                stats = self._bucket()
+                stats.checkouts += 1
+                stats.checkout_time += time.perf_counter() - started
+
+        pool.connect = timed_connect
+        self._wrapped_pools.append((pool, original))
+
+    #switching on and off
+
+    _LISTENERS = (
+        (Engine, "before_cursor_execute", "_before_cursor_execute"),
+        (Engine, "after_cursor_execute", "_after_cursor_execute"),
+        (Mapper, "load", "_on_load"),
+        (OrmSession, "after_flush", "_after_flush"),
+        (OrmSession, "after_commit", "_after_commit"),
+    )
+
+    def enable(self, *engines):
+        #starts recording; pass engines whose pool checkout time should be measured
+        if not self.enabled:
+            for target, name, method in self._LISTENERS:
+                event.listen(target, name, getattr(self, method))
+            self.enabled = True
+        for engine in engines:
+            if all(pool is not engine.pool for pool, _ in self._wrapped_pools):
+                self._wrap_pool(engine)
+
+    def disable(self):
+        if self.enabled:
+            for target, name, method in self._LISTENERS:
+                event.remove(target, name, getattr(self, method))
+            self.enabled = False
+        for pool, original in self._wrapped_pools:
+            pool.connect = original
+        self._wrapped_pools = []
+
+    #reading
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self.slow_queries = []
+
+    def snapshot(self):
+        #{operation name: stats dict}, for the benchmark harness and other tools
+        return {name: stats.as_dict() for name, stats in list(self._stats.items())}
+
+    def totals(self):
+        total = OperationStats()
+        for stats in list(self._stats.values()):
+            for key, value in vars(stats).items():
+                if key == "max_statement":
+                    total.max_statement = max(total.max_statement, value)
+                else:
+                    setattr(total, key, getattr(total, key) + value)
+        return total.as_dict()
+
+    def summary(self):
+        rows = sorted(self.snapshot().items(), key=lambda item: item[1]["sql_ms"], reverse=True)
+        lines = [f"{'operation':<32}{'calls':>7}{'stmts':>8}{'rows':>9}{'sql ms':>10}{'max ms':>9}{'chkout ms':>11}{'wall ms':>10}"]
+        for name, s in rows:
+            lines.append(f"{name[:31]:<32}{s['calls']:>7}{s['statements']:>8}{s['rows']:>9}{s['sql_ms']:>10.1f}"
+                         f"{s['max_statement_ms']:>9.1f}{s['checkout_ms']:>11.1f}{s['wall_ms']:>10.1f}")
+        if self.slow_queries:
+            lines.append(f"\n{len(self.slow_queries)} statement(s) over {self.slow_query_ms:g} ms:")
+            for entry in sorted(self.slow_queries, key=lambda e: e["ms"], reverse=True)[:10]:
+                lines.append(f"  {entry['ms']:8.1f} ms  {entry['operation']}: {' '.join(entry['statement'].split())[:100]}")
+        return "\n".join(lines)
+
+
+profiler = Profiler()
+
+
+def profiled(name=None):
+    #decorator: runs the function as a profiler operation; for classmethods the name includes the class
+    def decorate(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return fn(*args, **kwargs)
+            op = label
+            if name is None and args and isinstance(args[0], type):
+                op = f"{args[0].__name__}.{label}"
+            with profiler.operation(op):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,65 @@
+"""Full-text search tables and sync triggers
+
+Revision ID: 3f8a2d6c1e94
+Revises: b7d41c9e2a60
+Create Date: 2026-10-18 11:03:27.550912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f8a2d6c1e94'
+down_revision: Union[str, None] = 'b7d41c9e2a60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# searchable columns per table, as of this revision
+FTS_SOURCES = {
+    "evidence": ["description", "found_location"],
+    "suspects": ["alibi"],
+    "cases": ["location"],
+    "criminal_records": ["previous_crimes"],
+}
+
+
+def _ddl(table, columns):
+    fts = f"{table}_fts"
+    cols = ", ".join(columns)
+    new_vals = ", ".join(f"new.{c}" for c in columns)
+    old_vals = ", ".join(f"old.{c}" for c in columns)
+    # external-content index: the text lives only in the source table, triggers keep the index in step
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', content_rowid='id', "
+        f"tokenize='porter unicode61')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals}); END",
+    ]
+
+
+def upgrade() -> None:
+    # FTS5 virtual tables over evidence, suspects, cases and criminal_records, filled from existing rows
+    bind = op.get_bind()
+    existing = {row[0] for row in bind.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for table, columns in FTS_SOURCES.items():
+        if table not in existing:
+            continue
+        for statement in _ddl(table, columns):
+            op.execute(statement)
+        if f"{table}_fts" not in existing:
+            op.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    for table in FTS_SOURCES:
+        for suffix in ("ai", "ad", "au"):
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{suffix}")
+        op.execute(f"DROP TABLE IF EXISTS {table}_fts")
@@ -0,0 +1,110 @@
+"""Case statistics summary tables
+
+Revision ID: 4d7b2e9a1f03
+Revises: c91e0f5a7d28
+Create Date: 2026-10-18 15:42:11.204817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4d7b2e9a1f03'
+down_revision: Union[str, None] = 'c91e0f5a7d28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# the summaries as of this revision: case_stats dimensions (bucket sql over a cases row) and the one
+# status that does not count towards a detective's open caseload
+DIMENSIONS = {
+    "crime_type": "{row}.crime_type",
+    "status": "{row}.status",
+    "month": "strftime('%Y-%m', {row}.date)",
+    "location": "{row}.location",
+}
+CLOSED_STATUS = "Closed"
+SOURCES = ("cases", "detective_case", "detectives")
+
+
+def _bucket(dimension, row):
+    return f"COALESCE({DIMENSIONS[dimension].format(row=row)}, '')"
+
+
+def _is_open(row):
+    return f"({row}.status IS NOT '{CLOSED_STATUS}')"
+
+
+def _bump(dimension, row, delta):
+    return (f"INSERT INTO case_stats (dimension, bucket, count) VALUES ('{dimension}', {_bucket(dimension, row)}, {delta}) "
+            f"ON CONFLICT (dimension, bucket) DO UPDATE SET count = count + excluded.count;")
+
+
+def _drop_empty(dimension, row):
+    return f"DELETE FROM case_stats WHERE dimension = '{dimension}' AND bucket = {_bucket(dimension, row)} AND count <= 0;"
+
+
+def _bump_detectives(case_row, delta):
+    return (f"INSERT INTO detective_open_cases (detective_id, open_cases) "
+            f"SELECT detective_id, {delta} FROM detective_case WHERE case_id = {case_row}.id "
+            f"ON CONFLICT (detective_id) DO UPDATE SET open_cases = open_cases + excluded.open_cases;")
+
+
+def _triggers():
+    inserted = " ".join(_bump(d, "new", 1) for d in DIMENSIONS)
+    deleted = " ".join(_bump(d, "old", -1) + " " + _drop_empty(d, "old") for d in DIMENSIONS)
+    columns = ", ".join(["crime_type", "status", "location", "date"])
+    reopened = f"CASE WHEN {_is_open('new')} THEN 1 ELSE -1 END"
+    return {
+        "case_stats_ai": f"AFTER INSERT ON cases BEGIN {inserted} END",
+        "case_stats_ad": f"AFTER DELETE ON cases BEGIN {deleted} END",
+        "case_stats_au": f"AFTER UPDATE OF {columns} ON cases BEGIN {deleted} {inserted} END",
+        "detective_open_cases_link_ai":
+            f"AFTER INSERT ON detective_case BEGIN "
+            f"INSERT INTO detective_open_cases (detective_id, open_cases) "
+            f"SELECT new.detective_id, 1 FROM cases c WHERE c.id = new.case_id AND {_is_open('c')} "
+            f"ON CONFLICT (detective_id) DO UPDATE SET open_cases = open_cases + 1; END",
+        "detective_open_cases_link_ad":
+            f"AFTER DELETE ON detective_case BEGIN "
+            f"UPDATE detective_open_cases SET open_cases = open_cases - 1 WHERE detective_id = old.detective_id "
+            f"AND EXISTS (SELECT 1 FROM cases c WHERE c.id = old.case_id AND {_is_open('c')}); END",
+        "detective_open_cases_case_bd":
+            f"BEFORE DELETE ON cases WHEN {_is_open('old')} BEGIN {_bump_detectives('old', -1)} END",
+        "detective_open_cases_case_au":
+            f"AFTER UPDATE OF status ON cases WHEN {_is_open('old')} != {_is_open('new')} BEGIN "
+            f"{_bump_detectives('new', reopened)} END",
+        "detective_open_cases_detective_ad":
+            "AFTER DELETE ON detectives BEGIN DELETE FROM detective_open_cases WHERE detective_id = old.id; END",
+    }
+
+
+def upgrade() -> None:
+    # case_stats and detective_open_cases, filled from existing rows and kept current by triggers
+    bind = op.get_bind()
+    existing = {row[0] for row in bind.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if not all(table in existing for table in SOURCES):
+        return
+    op.execute("CREATE TABLE IF NOT EXISTS case_stats (dimension TEXT NOT NULL, bucket TEXT NOT NULL, "
+               "count INTEGER NOT NULL, PRIMARY KEY (dimension, bucket)) WITHOUT ROWID")
+    op.execute("CREATE TABLE IF NOT EXISTS detective_open_cases (detective_id INTEGER PRIMARY KEY, "
+               "open_cases INTEGER NOT NULL)")
+    for name, body in _triggers().items():
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    op.execute("DELETE FROM case_stats")
+    for dimension in DIMENSIONS:
+        bucket = _bucket(dimension, "c")
+        op.execute(f"INSERT INTO case_stats (dimension, bucket, count) "
+                   f"SELECT '{dimension}', {bucket}, count(*) FROM cases c GROUP BY {bucket}")
+    op.execute("DELETE FROM detective_open_cases")
+    op.execute(f"INSERT INTO detective_open_cases (detective_id, open_cases) "
+               f"SELECT dc.detective_id, count(*) FROM detective_case dc JOIN cases c ON c.id = dc.case_id "
+               f"WHERE {_is_open('c')} GROUP BY dc.detective_id")
+
+
+def downgrade() -> None:
+    for name in _triggers():
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.execute("DROP TABLE IF EXISTS case_stats")
+    op.execute("DROP TABLE IF EXISTS detective_open_cases")
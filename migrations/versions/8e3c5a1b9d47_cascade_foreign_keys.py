@@ -0,0 +1,172 @@
+"""ON DELETE CASCADE foreign keys, and ids that are never reused
+
+Revision ID: 8e3c5a1b9d47
+Revises: 4d7b2e9a1f03
+Create Date: 2026-10-18 17:05:39.618402
+
+"""
+import os
+import sqlite3
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e3c5a1b9d47'
+down_revision: Union[str, None] = '4d7b2e9a1f03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# sqlite cannot alter a foreign key, so each child table is rebuilt: (table, columns, indexes)
+def _tables(ondelete):
+    return [
+        ("suspects", lambda: [
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("name", sa.String(), nullable=False),
+            sa.Column("age", sa.Integer()),
+            sa.Column("alibi", sa.String()),
+            sa.Column("case_id", sa.Integer(), sa.ForeignKey("cases.id", ondelete=ondelete)),
+        ], [("ix_suspects_case_id", ["case_id"])]),
+        ("evidence", lambda: [
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("description", sa.String(), nullable=False),
+            sa.Column("found_location", sa.String()),
+            sa.Column("case_id", sa.Integer(), sa.ForeignKey("cases.id", ondelete=ondelete)),
+        ], [("ix_evidence_case_id", ["case_id"])]),
+        ("criminal_records", lambda: [
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("previous_crimes", sa.String()),
+            sa.Column("sentence", sa.String()),
+            sa.Column("suspect_id", sa.Integer(), sa.ForeignKey("suspects.id", ondelete=ondelete), unique=True),
+        ], []),
+        ("detective_case", lambda: [
+            sa.Column("detective_id", sa.Integer(), sa.ForeignKey("detectives.id", ondelete=ondelete), nullable=False),
+            sa.Column("case_id", sa.Integer(), sa.ForeignKey("cases.id", ondelete=ondelete), nullable=False),
+            sa.PrimaryKeyConstraint("detective_id", "case_id"),
+        ], [("ix_detective_case_case_id", ["case_id"])]),
+    ]
+
+
+# archived rows leave these tables; without AUTOINCREMENT sqlite hands their ids out again
+AUTOINCREMENT_TABLES = ["cases", "suspects", "evidence", "criminal_records"]
+
+
+def _cascades(inspector, table):
+    return all((fk.get("options") or {}).get("ondelete", "").upper() == "CASCADE"
+               for fk in inspector.get_foreign_keys(table))
+
+
+def _rebuild(table, columns, indexes):
+    names = ", ".join(c.name for c in columns if isinstance(c, sa.Column))
+    op.create_table(f"_{table}_new", *columns)
+    op.execute(f"INSERT INTO _{table}_new ({names}) SELECT {names} FROM {table}")
+    op.drop_table(table)
+    op.rename_table(f"_{table}_new", table)
+    for name, index_columns in indexes:
+        op.create_index(name, table, index_columns)
+
+
+def _set_aside(bind):
+    # drops every trigger and view, returning their sql: triggers on a rebuilt table go with it, and
+    # sqlite will not rename a table while a trigger or view elsewhere names one that is missing
+    saved = bind.exec_driver_sql(
+        "SELECT type, name, sql FROM sqlite_master WHERE type IN ('trigger', 'view') AND sql IS NOT NULL").fetchall()
+    for kind, name, _ in saved:
+        op.execute(f"DROP {kind.upper()} {name}")
+    return [sql for _, _, sql in saved]
+
+
+def _restore(saved):
+    for sql in saved:
+        op.execute(sql)
+
+
+def _autoincrement(bind, table):
+    sql = bind.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).scalar()
+    return "AUTOINCREMENT" in sql.upper()
+
+
+def _rebuild_autoincrement(bind, tables, autoincrement):
+    # sqlite only sets AUTOINCREMENT at CREATE TABLE, so each table is copied into a new one as it stands
+    metadata = sa.MetaData()
+    for table in tables:
+        old = sa.Table(table, metadata, autoload_with=bind)
+        new = old.to_metadata(metadata, name=f"_{table}_new")
+        new.dialect_options["sqlite"]["autoincrement"] = autoincrement
+        indexes = bind.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? "
+                                       "AND sql IS NOT NULL", (table,)).scalars().all()
+        columns = ", ".join(c.name for c in old.columns)
+        op.execute(sa.schema.CreateTable(new))
+        op.execute(f"INSERT INTO _{table}_new ({columns}) SELECT {columns} FROM {table}")
+        op.drop_table(table)
+        op.rename_table(f"_{table}_new", table)
+        for sql in indexes:
+            op.execute(sql)
+
+
+def _archive_path(bind):
+    # where archive.py keeps archived rows for this database (as of this revision)
+    if os.environ.get("CRIME_ARCHIVE_PATH"):
+        return os.environ["CRIME_ARCHIVE_PATH"]
+    database = bind.engine.url.database
+    if not database or database == ":memory:":
+        return None
+    root, ext = os.path.splitext(database)
+    return f"{root}_archive{ext or '.db'}"
+
+
+def _reserve_archived_ids(bind):
+    # ids already moved to the archive count as used, so the first new row starts past them
+    path = _archive_path(bind)
+    if path is None or not os.path.exists(path):
+        return
+    archive = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        present = {row[0] for row in archive.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        highest = {table: archive.execute(f"SELECT max(id) FROM {table}").fetchone()[0]
+                   for table in AUTOINCREMENT_TABLES if table in present}
+    finally:
+        archive.close()
+    for table, seq in highest.items():
+        if seq is None:
+            continue
+        op.execute(sa.text("INSERT INTO sqlite_sequence (name, seq) SELECT :name, 0 WHERE NOT EXISTS "
+                           "(SELECT 1 FROM sqlite_sequence WHERE name = :name)").bindparams(name=table))
+        op.execute(sa.text("UPDATE sqlite_sequence SET seq = :seq WHERE name = :name AND seq < :seq")
+                   .bindparams(name=table, seq=seq))
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+
+    # databases created by models.py after this change already cascade and autoincrement
+    stale = [(table, columns, indexes) for table, columns, indexes in _tables("CASCADE")
+             if table in tables and not _cascades(inspector, table)]
+    counters = [table for table in AUTOINCREMENT_TABLES if table in tables and not _autoincrement(bind, table)]
+
+    # the rows are copied unchanged, so the full-text and statistics triggers come back as they were
+    # and the summaries stay correct
+    if stale or counters:
+        saved = _set_aside(bind)
+        for table, columns, indexes in stale:
+            _rebuild(table, columns(), indexes)
+        # the cascade copies are plain tables, so which tables still lack autoincrement is checked again
+        _rebuild_autoincrement(bind, [table for table in AUTOINCREMENT_TABLES
+                                      if table in tables and not _autoincrement(bind, table)], True)
+        _restore(saved)
+    if bind.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'").first():
+        _reserve_archived_ids(bind)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    saved = _set_aside(bind)
+    _rebuild_autoincrement(bind, [table for table in AUTOINCREMENT_TABLES if _autoincrement(bind, table)], False)
+    for table, columns, indexes in _tables(None):
+        _rebuild(table, columns(), indexes)
+    _restore(saved)
@@ -0,0 +1,51 @@
+"""Suspect blocking index for duplicate detection
+
+Revision ID: a6f19c3e8b52
+Revises: 8e3c5a1b9d47
+Create Date: 2026-10-18 19:12:40.381926
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6f19c3e8b52'
+down_revision: Union[str, None] = '8e3c5a1b9d47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TRIGGERS = {
+    "suspect_blocks_ai": "AFTER INSERT ON suspects BEGIN "
+                         "INSERT OR IGNORE INTO suspect_blocks_pending (suspect_id) VALUES (new.id); END",
+    "suspect_blocks_au": "AFTER UPDATE OF name, age ON suspects BEGIN "
+                         "INSERT OR IGNORE INTO suspect_blocks_pending (suspect_id) VALUES (new.id); END",
+    "suspect_blocks_ad": "AFTER DELETE ON suspects BEGIN "
+                         "DELETE FROM suspect_blocks WHERE suspect_id = old.id; "
+                         "DELETE FROM suspect_blocks_pending WHERE suspect_id = old.id; END",
+}
+
+
+def upgrade() -> None:
+    # suspect_blocks and its queue; triggers queue new and changed suspects
+    bind = op.get_bind()
+    if not bind.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'suspects'").first():
+        return
+    op.execute("CREATE TABLE IF NOT EXISTS suspect_blocks (key TEXT NOT NULL, band INTEGER, "
+               "suspect_id INTEGER NOT NULL, PRIMARY KEY (key, suspect_id)) WITHOUT ROWID")
+    op.execute("CREATE TABLE IF NOT EXISTS suspect_blocks_pending (suspect_id INTEGER PRIMARY KEY)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_suspect_blocks_suspect_id ON suspect_blocks (suspect_id)")
+    for name, body in TRIGGERS.items():
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    # the keys are computed in python (sqlite has no soundex): every existing suspect is queued, and
+    # the first duplicate lookup keys them
+    op.execute("INSERT OR IGNORE INTO suspect_blocks_pending (suspect_id) SELECT id FROM suspects")
+
+
+def downgrade() -> None:
+    for name in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.execute("DROP TABLE IF EXISTS suspect_blocks")
+    op.execute("DROP TABLE IF EXISTS suspect_blocks_pending")
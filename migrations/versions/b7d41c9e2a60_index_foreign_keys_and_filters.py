@@ -0,0 +1,75 @@
+"""Index foreign keys and filter columns
+
+Revision ID: b7d41c9e2a60
+Revises: 5ea5682723ed
+Create Date: 2026-10-18 09:12:44.103215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d41c9e2a60'
+down_revision: Union[str, None] = '5ea5682723ed'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = [
+    ("ix_cases_crime_type", "cases", ["crime_type"]),
+    ("ix_cases_status", "cases", ["status"]),
+    ("ix_suspects_case_id", "suspects", ["case_id"]),
+    ("ix_evidence_case_id", "evidence", ["case_id"]),
+]
+
+
+def _existing_indexes(inspector, table):
+    return {ix["name"] for ix in inspector.get_indexes(table)}
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    # databases created by models.py after this change already have the indexes
+    for name, table, columns in INDEXES:
+        if table in tables and name not in _existing_indexes(inspector, table):
+            op.create_index(name, table, columns)
+
+    # detective_case had no key at all: rebuild it with a composite primary key,
+    # dropping duplicate and half-empty links on the way
+    if "detective_case" in tables and not inspector.get_pk_constraint("detective_case")["constrained_columns"]:
+        op.create_table(
+            "_detective_case_new",
+            sa.Column("detective_id", sa.Integer(), sa.ForeignKey("detectives.id"), nullable=False),
+            sa.Column("case_id", sa.Integer(), sa.ForeignKey("cases.id"), nullable=False),
+            sa.PrimaryKeyConstraint("detective_id", "case_id"),
+        )
+        op.execute(
+            "INSERT OR IGNORE INTO _detective_case_new (detective_id, case_id) "
+            "SELECT detective_id, case_id FROM detective_case "
+            "WHERE detective_id IS NOT NULL AND case_id IS NOT NULL"
+        )
+        op.drop_table("detective_case")
+        op.rename_table("_detective_case_new", "detective_case")
+
+    if "detective_case" in tables and "ix_detective_case_case_id" not in _existing_indexes(sa.inspect(op.get_bind()), "detective_case"):
+        op.create_index("ix_detective_case_case_id", "detective_case", ["case_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_detective_case_case_id", table_name="detective_case")
+    op.create_table(
+        "_detective_case_old",
+        sa.Column("detective_id", sa.Integer(), sa.ForeignKey("detectives.id")),
+        sa.Column("case_id", sa.Integer(), sa.ForeignKey("cases.id")),
+    )
+    op.execute("INSERT INTO _detective_case_old (detective_id, case_id) SELECT detective_id, case_id FROM detective_case")
+    op.drop_table("detective_case")
+    op.rename_table("_detective_case_old", "detective_case")
+
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,97 @@
+"""Typed, indexed case dates
+
+Revision ID: c91e0f5a7d28
+Revises: 3f8a2d6c1e94
+Create Date: 2026-10-18 14:26:05.318774
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c91e0f5a7d28'
+down_revision: Union[str, None] = '3f8a2d6c1e94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# formats seen in hand-entered dates; the first that parses wins
+DATE_FORMATS = ["%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y", "%m/%d/%Y", "%d-%m-%Y", "%Y-%m-%d %H:%M:%S"]
+
+ISO_GLOB = "[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]"
+
+
+def _parse(text):
+    text = str(text or "").strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def _set_aside(bind):
+    # drops every trigger and view, returning their sql: the batch rebuild of cases drops its triggers,
+    # and sqlite will not rename a table while a trigger or view elsewhere names one that is missing
+    saved = bind.exec_driver_sql(
+        "SELECT type, name, sql FROM sqlite_master WHERE type IN ('trigger', 'view') AND sql IS NOT NULL").fetchall()
+    for kind, name, _ in saved:
+        op.execute(f"DROP {kind.upper()} {name}")
+    return [sql for _, _, sql in saved]
+
+
+def _restore(saved):
+    for sql in saved:
+        op.execute(sql)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "cases" not in inspector.get_table_names():
+        return
+
+    # rows already in YYYY-MM-DD form are left alone, everything else is parsed in python and
+    # what cannot be parsed is blanked (the old column is NOT NULL; blanks become NULL below)
+    rows = bind.exec_driver_sql(
+        f"SELECT id, date FROM cases WHERE date IS NULL OR date NOT GLOB '{ISO_GLOB}'").fetchall()
+    for case_id, text in rows:
+        bind.exec_driver_sql("UPDATE cases SET date = ? WHERE id = ?", (_parse(text) or "", case_id))
+
+    # the batch copy does CAST(date AS DATE), which sqlite evaluates as a number ('2023-01-23' -> 2023),
+    # so the text is kept aside and written back after the rebuild
+    op.execute("CREATE TEMP TABLE _case_dates (id INTEGER PRIMARY KEY, date TEXT)")
+    op.execute("INSERT INTO _case_dates SELECT id, date FROM cases")
+
+    saved = _set_aside(bind)
+    with op.batch_alter_table("cases", recreate="always") as batch_op:
+        batch_op.alter_column("date", existing_type=sa.String(), type_=sa.Date(), nullable=True)
+
+    op.execute("UPDATE cases SET date = (SELECT NULLIF(d.date, '') FROM _case_dates d WHERE d.id = cases.id)")
+    op.execute("DROP TABLE _case_dates")
+
+    # the composites serve date ranges; ix_cases_crime_type / ix_cases_status stay for plain filters,
+    # whose matches they keep in id order
+    existing = {ix["name"] for ix in sa.inspect(bind).get_indexes("cases")}
+    for name, columns in (("ix_cases_date", ["date"]),
+                          ("ix_cases_crime_type_date", ["crime_type", "date"]),
+                          ("ix_cases_status_date", ["status", "date"])):
+        if name not in existing:
+            op.create_index(name, "cases", columns)
+    _restore(saved)
+
+
+def downgrade() -> None:
+    saved = _set_aside(op.get_bind())
+    with op.batch_alter_table("cases", recreate="always") as batch_op:
+        batch_op.drop_index("ix_cases_status_date")
+        batch_op.drop_index("ix_cases_crime_type_date")
+        batch_op.drop_index("ix_cases_date")
+        batch_op.alter_column("date", existing_type=sa.Date(), type_=sa.String(), nullable=True)
+    op.execute("UPDATE cases SET date = '' WHERE date IS NULL")
+    _restore(saved)
@@ -0,0 +1,74 @@
+"""Link graph change log
+
+Revision ID: e2b87d4f6a19
+Revises: a6f19c3e8b52
+Create Date: 2026-10-18 20:27:03.915264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b87d4f6a19'
+down_revision: Union[str, None] = 'a6f19c3e8b52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+LOCATION_KEY = "lower(trim({column}))"
+LOG_LIMIT = 200000
+TRIM_EVERY = 1000
+
+
+def _log(delta, a_kind, a_key, b_kind, b_key):
+    # only edges the graph reads: a real location or an integer case id
+    valid = f"{b_key} != ''" if b_kind == "location" else f"typeof({b_key}) = 'integer'"
+    return (f"INSERT INTO graph_log (delta, a_kind, a_key, b_kind, b_key) "
+            f"SELECT {delta}, '{a_kind}', {a_key}, '{b_kind}', {b_key} WHERE {valid};")
+
+
+def _evidence(delta, row):
+    return (_log(delta, "evidence", f"{row}.id", "case", f"{row}.case_id") + " "
+            + _log(delta, "evidence", f"{row}.id", "location", LOCATION_KEY.format(column=f"{row}.found_location")))
+
+
+# graphs register in graph_followers to have changes logged for them; with none registered nothing is written
+WHEN = "WHEN EXISTS (SELECT 1 FROM graph_followers) "
+TRIGGERS = {
+    "graph_log_suspect_ai": f"AFTER INSERT ON suspects {WHEN}BEGIN "
+                            f"{_log(1, 'suspect', 'new.id', 'case', 'new.case_id')} END",
+    "graph_log_suspect_ad": f"AFTER DELETE ON suspects {WHEN}BEGIN "
+                            f"{_log(-1, 'suspect', 'old.id', 'case', 'old.case_id')} END",
+    "graph_log_suspect_au": f"AFTER UPDATE OF case_id ON suspects {WHEN}BEGIN "
+                            f"{_log(-1, 'suspect', 'old.id', 'case', 'old.case_id')} "
+                            f"{_log(1, 'suspect', 'new.id', 'case', 'new.case_id')} END",
+    "graph_log_link_ai": f"AFTER INSERT ON detective_case {WHEN}BEGIN "
+                         f"{_log(1, 'detective', 'new.detective_id', 'case', 'new.case_id')} END",
+    "graph_log_link_ad": f"AFTER DELETE ON detective_case {WHEN}BEGIN "
+                         f"{_log(-1, 'detective', 'old.detective_id', 'case', 'old.case_id')} END",
+    "graph_log_evidence_ai": f"AFTER INSERT ON evidence {WHEN}BEGIN {_evidence(1, 'new')} END",
+    "graph_log_evidence_ad": f"AFTER DELETE ON evidence {WHEN}BEGIN {_evidence(-1, 'old')} END",
+    "graph_log_evidence_au": f"AFTER UPDATE OF case_id, found_location ON evidence {WHEN}BEGIN "
+                             f"{_evidence(-1, 'old')} {_evidence(1, 'new')} END",
+    # the log keeps roughly its last LOG_LIMIT entries whatever its followers do
+    "graph_log_trim": f"AFTER INSERT ON graph_log WHEN new.seq % {TRIM_EVERY} = 0 BEGIN "
+                      f"DELETE FROM graph_log WHERE seq <= new.seq - {LOG_LIMIT}; END",
+}
+
+
+def upgrade() -> None:
+    # graph_log records suspect, evidence and detective link changes for graphs built in memory
+    op.execute("CREATE TABLE IF NOT EXISTS graph_log (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+               "delta INTEGER NOT NULL, a_kind TEXT NOT NULL, a_key NOT NULL, b_kind TEXT NOT NULL, b_key NOT NULL)")
+    op.execute("CREATE TABLE IF NOT EXISTS graph_followers (name TEXT PRIMARY KEY, seq INTEGER NOT NULL)")
+    for name, body in TRIGGERS.items():
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+
+def downgrade() -> None:
+    for name in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.execute("DROP TABLE IF EXISTS graph_followers")
+    op.execute("DROP TABLE IF EXISTS graph_log")
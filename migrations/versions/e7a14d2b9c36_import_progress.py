@@ -0,0 +1,34 @@
+"""Import checkpoints table
+
+Revision ID: e7a14d2b9c36
+Revises: f4c06a2d9e73
+Create Date: 2026-10-19 18:05:51.276934
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a14d2b9c36'
+down_revision: Union[str, None] = 'f4c06a2d9e73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # transfer.py used to create this itself on first import, so it may already be there
+    if "import_progress" in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'import_progress',
+        sa.Column('source', sa.String(), nullable=False),
+        sa.Column('rows_done', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('source'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('import_progress')
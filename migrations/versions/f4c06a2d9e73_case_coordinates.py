@@ -0,0 +1,146 @@
+"""Case coordinates, their precision, and spatial index
+
+Revision ID: f4c06a2d9e73
+Revises: e2b87d4f6a19
+Create Date: 2026-10-18 21:48:16.502739
+
+"""
+import csv
+import os
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4c06a2d9e73'
+down_revision: Union[str, None] = 'e2b87d4f6a19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+GRID_DEGREES = 0.01
+BATCH_SIZE = 5000
+GAZETTEER_PATH = os.environ.get("CRIME_GAZETTEER", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "gazetteer.csv"))
+_CITY_REGION_ZIP = re.compile(r"([^,\n]+),\s*([A-Za-z]{2})\s+\d{5}(?:-\d{4})?\s*$")
+
+
+def _key(text):
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def _geocoder():
+    # the gazetteer lookup as of this revision: a known place in its region, then any known place name
+    # among the comma-separated parts, then the region's centre; each with its precision
+    places, place_names, regions = {}, {}, {}
+    if os.path.exists(GAZETTEER_PATH):
+        with open(GAZETTEER_PATH, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                point = (float(row["latitude"]), float(row["longitude"]))
+                if row["kind"] == "region":
+                    regions.setdefault(_key(row["region"]), point)
+                    regions.setdefault(_key(row["name"]), point)
+                else:
+                    places.setdefault((_key(row["name"]), _key(row["region"])), point)
+                    place_names.setdefault(_key(row["name"]), point)
+
+    def geocode(text):
+        if not text:
+            return None
+        tail = _CITY_REGION_ZIP.search(text)
+        if tail and (_key(tail.group(1)), _key(tail.group(2))) in places:
+            return places[_key(tail.group(1)), _key(tail.group(2))] + ("place",)
+        parts = [_key(part) for part in re.split(r"[,\n]", text)]
+        for part in reversed(parts + [_key(text)]):
+            if part in place_names:
+                return place_names[part] + ("place",)
+        if tail and _key(tail.group(2)) in regions:
+            return regions[_key(tail.group(2))] + ("region",)
+        for part in reversed(parts):
+            if part in regions:
+                return regions[part] + ("region",)
+        return None
+
+    return geocode
+
+
+def _cell(column):
+    # floor(column / GRID_DEGREES) without sqlite's optional math functions
+    x = f"({column} / {GRID_DEGREES})"
+    return f"(CAST({x} AS INTEGER) - ({x} < CAST({x} AS INTEGER)))"
+
+
+def _indexed(row):
+    # region centres are too coarse for radius and hotspot queries, so only other points are indexed
+    return (f"{row}.latitude IS NOT NULL AND {row}.longitude IS NOT NULL "
+            f"AND {row}.geo_precision IS NOT 'region'")
+
+
+def _add(row):
+    located = _indexed(row)
+    return (f"INSERT INTO cases_rtree (id, south, north, west, east) SELECT {row}.id, {row}.latitude, "
+            f"{row}.latitude, {row}.longitude, {row}.longitude WHERE {located}; "
+            f"INSERT INTO case_grid (cell_lat, cell_lon, count) SELECT {_cell(row + '.latitude')}, "
+            f"{_cell(row + '.longitude')}, 1 WHERE {located} "
+            f"ON CONFLICT (cell_lat, cell_lon) DO UPDATE SET count = count + 1;")
+
+
+def _remove(row):
+    cell_match = f"cell_lat = {_cell(row + '.latitude')} AND cell_lon = {_cell(row + '.longitude')}"
+    return (f"DELETE FROM cases_rtree WHERE id = {row}.id; "
+            f"UPDATE case_grid SET count = count - 1 WHERE {cell_match} AND {_indexed(row)}; "
+            f"DELETE FROM case_grid WHERE {cell_match} AND count <= 0;")
+
+
+TRIGGERS = {
+    "geo_cases_ai": f"AFTER INSERT ON cases BEGIN {_add('new')} END",
+    "geo_cases_ad": f"AFTER DELETE ON cases BEGIN {_remove('old')} END",
+    "geo_cases_au": f"AFTER UPDATE OF latitude, longitude, geo_precision ON cases BEGIN {_remove('old')} {_add('new')} END",
+}
+
+
+def upgrade() -> None:
+    # plain ADD COLUMN: no table rebuild, so the triggers on cases survive
+    op.add_column('cases', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('cases', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('cases', sa.Column('geo_precision', sa.String(), nullable=True))
+    bind = op.get_bind()
+    geocode = _geocoder()
+    last_id = 0
+    while True:
+        rows = bind.exec_driver_sql("SELECT id, location FROM cases WHERE id > ? ORDER BY id LIMIT ?",
+                                    (last_id, BATCH_SIZE)).fetchall()
+        if not rows:
+            break
+        updates = [point + (case_id,) for case_id, point in ((r[0], geocode(r[1])) for r in rows) if point]
+        if updates:
+            bind.exec_driver_sql("UPDATE cases SET latitude = ?, longitude = ?, geo_precision = ? WHERE id = ?",
+                                 updates)
+        last_id = rows[-1][0]
+    # cases_rtree and case_grid, filled from the coordinates just written
+    op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS cases_rtree USING rtree(id, south, north, west, east)")
+    op.execute("CREATE TABLE IF NOT EXISTS case_grid (cell_lat INTEGER NOT NULL, cell_lon INTEGER NOT NULL, "
+               "count INTEGER NOT NULL, PRIMARY KEY (cell_lat, cell_lon)) WITHOUT ROWID")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_case_grid_count ON case_grid (count)")
+    for name, body in TRIGGERS.items():
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    op.execute("DELETE FROM cases_rtree")
+    op.execute(f"INSERT INTO cases_rtree (id, south, north, west, east) SELECT id, latitude, latitude, "
+               f"longitude, longitude FROM cases WHERE {_indexed('cases')}")
+    op.execute("DELETE FROM case_grid")
+    op.execute(f"INSERT INTO case_grid (cell_lat, cell_lon, count) SELECT {_cell('latitude')}, "
+               f"{_cell('longitude')}, count(*) FROM cases WHERE {_indexed('cases')} GROUP BY 1, 2")
+
+
+def downgrade() -> None:
+    for name in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.execute("DROP TABLE IF EXISTS cases_rtree")
+    op.execute("DROP TABLE IF EXISTS case_grid")
+    # sqlite 3.35+ drops a column in place (batch mode would rebuild cases and lose its triggers)
+    op.execute('ALTER TABLE cases DROP COLUMN geo_precision')
+    op.execute('ALTER TABLE cases DROP COLUMN longitude')
+    op.execute('ALTER TABLE cases DROP COLUMN latitude')
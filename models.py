@@ -1,172 +1,574 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Table
-from sqlalchemy.orm import relationship, sessionmaker
-from database import Base, engine
+import datetime
+import random
+
+from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Table, Index, event, func, inspect, select, type_coerce
+from sqlalchemy.orm import relationship
+from database import Base, engine, use_session
+import search as fts  #also registers the full-text tables with the metadata
+import stats  #registers the summary tables and their triggers with the metadata
+import dedup  #registers the suspect blocking index with the metadata
+import graph  #registers the link graph change log with the metadata
+import geo  #registers the spatial index with the metadata
+from cache import identity_cache
+from instrument import profiled
+
+PAGE_SIZE = 20
+
+#sql for the start of the day/week (monday)/month/year bucket a case date falls in
+DATE_BUCKETS = {
+    "day": lambda column: column,
+    "week": lambda column: func.date(column, "-6 days", "weekday 1"),
+    "month": lambda column: func.strftime("%Y-%m-01", column),
+    "year": lambda column: func.strftime("%Y-01-01", column),
+}
+
+
+def _to_date(value):  #accepts date objects or YYYY-MM-DD text
+    if value is None or isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(value)
+
+
+#one page of a keyset-paginated listing
+class Page:
+    def __init__(self, items, has_prev, has_next):
+        self.items = items
+        self.has_prev = has_prev
+        self.has_next = has_next
+
+    @property
+    def first_id(self):
+        return self.items[0].id if self.items else None
+
+    @property
+    def last_id(self):
+        return self.items[-1].id if self.items else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+#generic data access shared by every model; each one takes an optional session so a caller
+#can group many operations into one unit of work (see database.session_scope)
+class ModelMixin:
+    @classmethod
+    def _add(cls, session=None, **fields):
+        with use_session(session) as s:
+            obj = cls(**fields)
+            s.add(obj)
+            s.flush()  #assigns the id
+        identity_cache.invalidate(cls, obj.id)
+        return obj
+
+    @classmethod
+    def _all(cls, session=None):
+        with use_session(session) as s:
+            return s.query(cls).all()
+
+    #models whose rows archive.py can move out of the hot database
+    _archived = False
+
+    @classmethod
+    def _get(cls, obj_id, session=None):
+        #a caller's own session always reads through, so it sees its uncommitted changes
+        if session is not None:
+            return session.get(cls, obj_id) or cls._get_archived(obj_id)
+        obj = identity_cache.get(cls, obj_id)
+        if obj is None:
+            with use_session() as s:
+                obj = s.get(cls, obj_id)
+            if obj is None:
+                obj = cls._get_archived(obj_id)
+            identity_cache.put(cls, obj_id, obj)
+        return obj
+
+    @classmethod
+    def _get_archived(cls, obj_id):  #archived rows are still found by id, read from the archive file
+        if not cls._archived:
+            return None
+        import archive
+        return archive.find_by_id(cls, obj_id)
+
+    @classmethod
+    def _remove(cls, obj_id, session=None):  #returns True if a row was deleted
+        with use_session(session) as s:
+            obj = s.get(cls, obj_id)
+            if obj is None:
+                return False
+            s.delete(obj)
+        identity_cache.invalidate(cls, obj_id)
+        return True
+
+    #asyncio counterparts (see aio.py); they return their result instead of printing
+    @classmethod
+    async def _async_add(cls, session=None, **fields):
+        import aio
+        return await aio.add(cls, session, **fields)
 
-Session=sessionmaker(bind=engine)
+    @classmethod
+    async def async_get_all(cls, session=None):
+        import aio
+        return await aio.get_all(cls, session)
+
+    @classmethod
+    async def async_find_by_id(cls, obj_id, session=None):
+        import aio
+        return await aio.find_by_id(cls, obj_id, session)
+
+    @classmethod
+    async def async_delete(cls, obj_id, session=None):  #returns True if a row was deleted
+        import aio
+        return await aio.delete(cls, obj_id, session)
+
+    #keyset pagination on the primary key
+    @classmethod
+    @profiled()
+    def page(cls, after_id=None, before_id=None, page_size=PAGE_SIZE, session=None):  #rows after (or before) the given id, in id order
+        with use_session(session) as s:
+            query = s.query(cls)
+            if before_id is not None:
+                rows = query.filter(cls.id < before_id).order_by(cls.id.desc()).limit(page_size + 1).all()
+                has_prev = len(rows) > page_size
+                items = list(reversed(rows[:page_size]))
+                has_next = s.query(query.filter(cls.id >= before_id).exists()).scalar()
+            else:
+                if after_id is not None:
+                    query = query.filter(cls.id > after_id)
+                rows = query.order_by(cls.id).limit(page_size + 1).all()
+                has_next = len(rows) > page_size
+                items = rows[:page_size]
+                has_prev = after_id is not None
+        return Page(items, has_prev, has_next)
+
+    @classmethod
+    def stream(cls, page_size=500, after_id=None):  #yields every row, holding one page in memory at a time
+        while True:
+            page = cls.page(after_id=after_id, page_size=page_size)
+            yield from page.items
+            if not page.has_next:
+                break
+            after_id = page.last_id
+
+    @classmethod
+    def _id_ordered_columns(cls):  #columns whose equality matches an index returns in id order
+        table = cls.__table__
+        return ({index.columns[0].name for index in table.indexes if len(index.columns) == 1}
+                | {column.name for column in table.primary_key})
+
+    #random rows by probing the primary key range, so the cost doesn't grow with the table
+    @classmethod
+    @profiled()
+    def sample(cls, k=1, session=None, rng=None, **filters):  #up to k distinct random rows matching column=value filters
+        #each probe picks a random id and takes the first matching row at or after it (wrapping to the
+        #start), so rows that follow gaps in the ids are somewhat more likely to come up
+        rng = rng or random
+        #a probe walks a filter's matches in id order; only a single-column index keeps them in that order,
+        #anything else reads the whole table (or sorts) on every probe
+        indexed = cls._id_ordered_columns()
+        unindexed = sorted(set(filters) - indexed)
+        if unindexed:
+            raise ValueError(f"sample can only filter on indexed columns ({', '.join(sorted(indexed))}), "
+                             f"not {', '.join(unindexed)}")
+        with use_session(session) as s:
+            #probes stay within the matching rows' id range. two queries, because sqlite answers a lone
+            #min() or max() by walking in from one end of the primary key, but not both at once
+            low = s.query(func.min(cls.id)).filter_by(**filters).scalar()
+            high = s.query(func.max(cls.id)).filter_by(**filters).scalar()
+            if low is None:
+                return []
+            query = s.query(cls).filter_by(**filters).order_by(cls.id)
+            found = {}
+            for _ in range(3 * k + 10):
+                if len(found) >= k:
+                    break
+                obj = query.filter(cls.id >= rng.randint(low, high)).first() or query.first()
+                if obj is None:  #nothing matches the filters
+                    break
+                found[obj.id] = obj
+            return list(found.values())
 
 #joint table
 detective_case= Table(
     "detective_case",
     Base.metadata,
-    Column("detective_id", Integer, ForeignKey("detectives.id")),
-    Column("case_id", Integer, ForeignKey("cases.id"))
+    Column("detective_id", Integer, ForeignKey("detectives.id", ondelete="CASCADE"), primary_key=True),
+    Column("case_id", Integer, ForeignKey("cases.id", ondelete="CASCADE"), primary_key=True),
+    #the primary key covers lookups by detective; this one covers lookups by case
+    Index("ix_detective_case_case_id", "case_id"),
+)
+#import checkpoints for transfer.py: how many rows of each source file are already in
+import_progress = Table(
+    "import_progress",
+    Base.metadata,
+    Column("source", String, primary_key=True),
+    Column("rows_done", Integer, nullable=False),
 )
 #Case class
-class Case(Base):
+class Case(ModelMixin, Base):
     __tablename__="cases"
+    _archived = True
     id =Column(Integer, primary_key=True)
-    crime_type = Column(String, nullable=False)
-    status = Column(String, default="Open")
+    crime_type = Column(String, nullable=False, index=True)
+    status = Column(String, default="Open", index=True)
     location = Column(String, nullable=False)
-    date = Column(String, nullable=False)
-
-    #relationships
-    suspects= relationship("Suspect", back_populates="case", cascade="all, delete")
-    evidence= relationship("Evidence", back_populates="case", cascade="all, delete")
-    detectives = relationship("Detective", back_populates="cases", secondary=detective_case, cascade="all, delete")
+    date = Column(Date, nullable=True, index=True)  #NULL only for legacy text dates that could not be parsed
+    #geocoded from location when the case is saved (NULL if the gazetteer does not know the place)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    #how the gazetteer placed them: "place" (a known city) or "region" (only the state's centre, left out of
+    #spatial queries); NULL when the coordinates were given
+    geo_precision = Column(String, nullable=True)
+
+    #date-range variants of the crime type / status filters use these; the single-column indexes above
+    #keep plain filters in id order, which paging and sample() walk by. ids are never reused
+    #(AUTOINCREMENT), so a new case cannot take the id of one moved to the archive
+    __table_args__ = (
+        Index("ix_cases_crime_type_date", "crime_type", "date"),
+        Index("ix_cases_status_date", "status", "date"),
+        {"sqlite_autoincrement": True},
+    )
+
+    #relationships; the database's ON DELETE CASCADE removes children and links, so a delete never loads them.
+    #deleting a case only unlinks its detectives
+    suspects= relationship("Suspect", back_populates="case", cascade="all, delete", passive_deletes=True)
+    evidence= relationship("Evidence", back_populates="case", cascade="all, delete", passive_deletes=True)
+    detectives = relationship("Detective", back_populates="cases", secondary=detective_case, passive_deletes=True)
 
     #CRUD operations
     @classmethod
-    def create(cls, crime_type, status, location, date):  #creates a new case
-        session=Session()
-        new_case=cls(crime_type=crime_type, status=status, location=location, date=date)
-        session.add(new_case)
-        session.commit()
-        session.close()
+    @profiled()
+    def create(cls, crime_type, status, location, date, latitude=None, longitude=None, session=None):  #creates a new case
+        new_case = cls._add(session, crime_type=crime_type, status=status, location=location, date=_to_date(date),
+                            latitude=latitude, longitude=longitude)
         print("Case added successfully")
-    
+        return new_case
+
     @classmethod
-    def get_all(cls): #retrieves all cases
-        session=Session()
-        cases= session.query(cls).all()
-        session.close()
-        return cases
+    async def async_create(cls, crime_type, status, location, date, latitude=None, longitude=None, session=None):
+        return await cls._async_add(session, crime_type=crime_type, status=status, location=location, date=_to_date(date),
+                                    latitude=latitude, longitude=longitude)
 
     @classmethod
-    def find_by_id(cls, case_id):  #retrieves cases by id
-        session = Session()
-        case = session.query(cls).filter_by(id=case_id).first()
-        session.close()
-        return case
+    @profiled()
+    def create_with_details(cls, crime_type, status, location, date, suspects=(), evidence=(), session=None):
+        #adds a case with its suspects and evidence (lists of dicts) in a single transaction
+        with use_session(session) as s:
+            new_case = cls(crime_type=crime_type, status=status, location=location, date=_to_date(date))
+            new_case.suspects = [Suspect(**fields) for fields in suspects]
+            new_case.evidence = [Evidence(**fields) for fields in evidence]
+            s.add(new_case)
+            s.flush()
+        print("Case added successfully")
+        return new_case
 
     @classmethod
-    def delete(cls, case_id):  #deletes cases by id
-        session = Session()
-        case = session.query(cls).filter_by(id=case_id).first()
-        if case:
-            session.delete(case)
-            session.commit()
+    @profiled()
+    def get_all(cls, session=None): #retrieves all cases
+        return cls._all(session)
+
+    @classmethod
+    @profiled()
+    def find_by_id(cls, case_id, session=None):  #retrieves cases by id
+        return cls._get(case_id, session)
+
+    @classmethod
+    @profiled()
+    def delete(cls, case_id, session=None):  #deletes cases by id; returns True if a row was deleted
+        if cls._remove(case_id, session):
+            #the database cascaded to rows the cache may still hold
+            for model in (Suspect, Evidence, CriminalRecord, Detective):
+                identity_cache.invalidate_model(model)
             print("Case deleted successfully!")
-        else:
-            print("Case not found!")
-        session.close()
+            return True
+        print("Case not found!")
+        return False
+
+    @classmethod
+    async def async_delete(cls, case_id, session=None):  #returns True if a row was deleted
+        deleted = await super().async_delete(case_id, session)
+        if deleted:
+            #the database cascaded to rows the cache may still hold
+            for model in (Suspect, Evidence, CriminalRecord, Detective):
+                identity_cache.invalidate_model(model)
+        return deleted
+
+    @classmethod
+    @profiled()
+    def purge(cls, status=None, crime_type=None, before=None, case_ids=None, session=None):
+        #deletes every case matching all the given criteria (before: dated earlier than this) together with
+        #its suspects, their criminal records, evidence and detective links, one set-based statement per
+        #table in a single transaction; returns {table: rows deleted}
+        if status is None and crime_type is None and before is None and case_ids is None:
+            raise ValueError("purge needs at least one criterion")
+        cases = select(cls.id)
+        if status is not None:
+            cases = cases.where(cls.status == status)
+        if crime_type is not None:
+            cases = cases.where(cls.crime_type == crime_type)
+        if before is not None:
+            cases = cases.where(cls.date < _to_date(before))
+        if case_ids is not None:
+            cases = cases.where(cls.id.in_(case_ids))
+        suspects = select(Suspect.id).where(Suspect.case_id.in_(cases))
+
+        #children first, so each count is exact whether or not the foreign keys would have cascaded
+        statements = [
+            ("criminal_records", CriminalRecord.__table__.delete().where(CriminalRecord.suspect_id.in_(suspects))),
+            ("suspects", Suspect.__table__.delete().where(Suspect.case_id.in_(cases))),
+            ("evidence", Evidence.__table__.delete().where(Evidence.case_id.in_(cases))),
+            ("detective_case", detective_case.delete().where(detective_case.c.case_id.in_(cases))),
+            ("cases", cls.__table__.delete().where(cls.id.in_(cases))),
+        ]
+        counts = {}
+        with use_session(session) as s:
+            for table, statement in statements:
+                counts[table] = s.execute(statement).rowcount
+        if counts["cases"]:
+            for model in (cls, Suspect, Evidence, CriminalRecord, Detective):
+                identity_cache.invalidate_model(model)
+        return counts
+
+    @classmethod
+    @profiled()
+    def update_status(cls, case_id, status, session=None):  #moves a case to a new status; returns the case or None
+        with use_session(session) as s:
+            case = s.get(cls, case_id)
+            if case is None:
+                print("Case not found!")
+                return None
+            case.status = status
+        identity_cache.invalidate(cls, case_id)
+        print(f"Case {case_id} is now {status}.")
+        return case
+
+    #date range and time-bucket queries, answered from the date indexes
+    @classmethod
+    def _date_filters(cls, stmt, start=None, end=None, crime_type=None, status=None):
+        if start is not None:
+            stmt = stmt.where(cls.date >= _to_date(start))
+        if end is not None:
+            stmt = stmt.where(cls.date <= _to_date(end))
+        if crime_type:
+            stmt = stmt.where(cls.crime_type == crime_type)
+        if status:
+            stmt = stmt.where(cls.status == status)
+        return stmt
+
+    @classmethod
+    @profiled()
+    def between(cls, start, end, crime_type=None, status=None, limit=None, session=None):  #cases dated start..end (inclusive), oldest first
+        stmt = cls._date_filters(select(cls), start, end, crime_type, status).order_by(cls.date, cls.id)
+        if limit:
+            stmt = stmt.limit(limit)
+        with use_session(session) as s:
+            return s.scalars(stmt).all()
+
+    @classmethod
+    @profiled()
+    def count_between(cls, start, end, crime_type=None, status=None, session=None):
+        stmt = cls._date_filters(select(func.count()).select_from(cls), start, end, crime_type, status)
+        with use_session(session) as s:
+            return s.scalar(stmt)
+
+    @classmethod
+    @profiled()
+    def counts_by(cls, bucket="month", start=None, end=None, crime_type=None, status=None,
+                  by_crime_type=False, by_status=False, session=None):
+        #case counts per day/week/month/year, optionally split by crime type and/or status;
+        #returns rows with .bucket (date the bucket starts), [.crime_type], [.status] and .count
+        if bucket not in DATE_BUCKETS:
+            raise ValueError(f"Unknown bucket '{bucket}', expected one of: {', '.join(DATE_BUCKETS)}")
+        keys = [type_coerce(DATE_BUCKETS[bucket](cls.date), Date)]
+        if by_crime_type:
+            keys.append(cls.crime_type)
+        if by_status:
+            keys.append(cls.status)
+        stmt = select(keys[0].label("bucket"), *keys[1:], func.count().label("count")).where(cls.date.is_not(None))
+        stmt = cls._date_filters(stmt, start, end, crime_type, status).group_by(*keys).order_by(*keys)
+        with use_session(session) as s:
+            return s.execute(stmt).all()
+
+    @classmethod
+    @profiled()
+    def search(cls, query, limit=20):  #full-text search over case locations
+        return fts.search(query, kinds=["cases"], limit=limit)
+
+    #spatial queries, answered from the r*tree and grid in geo.py
+    @classmethod
+    def _by_ids(cls, ids, session=None):  #{id: case} for these ids
+        ids = list(ids)
+        found = {}
+        with use_session(session) as s:
+            for start in range(0, len(ids), 5000):
+                found.update((case.id, case) for case in s.scalars(select(cls).where(cls.id.in_(ids[start:start + 5000]))))
+        return found
+
+    @classmethod
+    @profiled()
+    def within(cls, latitude, longitude, km, limit=None, session=None):  #[(case, distance in km)] nearest first
+        found = geo.within(latitude, longitude, km, limit)
+        cases = cls._by_ids((case_id for case_id, _ in found), session)
+        return [(cases[case_id], distance) for case_id, distance in found if case_id in cases]
+
+    @classmethod
+    @profiled()
+    def near(cls, case_id, km=2, limit=None, session=None):  #[(case, distance in km)] around a case; None if it is missing
+        case = cls._get(case_id, session)
+        if case is None:
+            return None
+        if case.latitude is None or case.longitude is None or case.geo_precision == "region":
+            return []
+        found = cls.within(case.latitude, case.longitude, km, limit + 1 if limit else None, session)
+        return [(other, distance) for other, distance in found if other.id != case_id][:limit]
+
+    @classmethod
+    @profiled()
+    def in_box(cls, south, west, north, east, limit=None, session=None):  #cases inside the box, in id order
+        ids = geo.in_box(south, west, north, east, limit)
+        cases = cls._by_ids(ids, session)
+        return [cases[case_id] for case_id in ids if case_id in cases]
+
+    @classmethod
+    @profiled()
+    def hotspots(cls, min_cases=5, limit=10, box=None):  #[geo.Hotspot] busiest clusters of nearby cases
+        return geo.hotspots(min_cases, limit, box)
+
+
+#cases saved through the orm are geocoded from their location unless coordinates were given
+@event.listens_for(Case, "before_insert")
+def _geocode_new_case(mapper, connection, case):
+    if case.latitude is None and case.longitude is None and case.location:
+        point = geo.geocode(case.location)
+        if point is not None:
+            case.latitude, case.longitude, case.geo_precision = point
+
+
+@event.listens_for(Case, "before_update")
+def _geocode_moved_case(mapper, connection, case):
+    state = inspect(case)
+    moved = state.attrs.latitude.history.has_changes() or state.attrs.longitude.history.has_changes()
+    if state.attrs.location.history.has_changes() and not moved:
+        point = geo.geocode(case.location)
+        case.latitude, case.longitude, case.geo_precision = point or (None, None, None)
+    elif moved and not state.attrs.geo_precision.history.has_changes():
+        case.geo_precision = None
 
 
 pass
 #suspect class
-class Suspect(Base):
+class Suspect(ModelMixin, Base):
     __tablename__="suspects"
+    _archived = True
+    __table_args__ = {"sqlite_autoincrement": True}  #archived ids are never handed out again
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
     age = Column(Integer)
     alibi = Column(String, nullable=True)
 
     #relationship(case-class(one to many, one to one(suspect-record)))
-    case_id =Column(Integer, ForeignKey("cases.id"))
+    case_id =Column(Integer, ForeignKey("cases.id", ondelete="CASCADE"), index=True)
     case = relationship("Case", back_populates="suspects")
-    criminal_record= relationship("CriminalRecord", back_populates="suspect", uselist=False)
+    criminal_record= relationship("CriminalRecord", back_populates="suspect", uselist=False,
+                                  cascade="all, delete", passive_deletes=True)
 
     #crud operation
     @classmethod
-    def create(cls, name, age, alibi, case_id):
-        session = Session()
-        new_suspect = cls(name=name, age=age, alibi=alibi, case_id=case_id)
-        session.add(new_suspect)
-        session.commit()
-        session.close()
+    @profiled()
+    def create(cls, name, age, alibi, case_id, session=None):
+        new_suspect = cls._add(session, name=name, age=age, alibi=alibi, case_id=case_id)
         print("Suspect added successfully!")
+        return new_suspect
 
     @classmethod
-    def get_all(cls):
-        session = Session()
-        suspects = session.query(cls).all()
-        session.close()
-        return suspects
+    async def async_create(cls, name, age, alibi, case_id, session=None):
+        return await cls._async_add(session, name=name, age=age, alibi=alibi, case_id=case_id)
 
     @classmethod
-    def find_by_id(cls, suspect_id):
-        session = Session()
-        suspect = session.query(cls).filter_by(id=suspect_id).first()
-        session.close()
-        return suspect
+    @profiled()
+    def get_all(cls, session=None):
+        return cls._all(session)
 
     @classmethod
-    def delete(cls, suspect_id):
-        session = Session()
-        suspect = session.query(cls).filter_by(id=suspect_id).first()
-        if suspect:
-            session.delete(suspect)
-            session.commit()
+    @profiled()
+    def find_by_id(cls, suspect_id, session=None):
+        return cls._get(suspect_id, session)
+
+    @classmethod
+    @profiled()
+    def delete(cls, suspect_id, session=None):  #returns True if a row was deleted
+        if cls._remove(suspect_id, session):
             print("Suspect deleted successfully!")
-        else:
-            print("Suspect not found!")
-        session.close()
+            return True
+        print("Suspect not found!")
+        return False
+
+    @classmethod
+    @profiled()
+    def search(cls, query, limit=20):  #full-text search over alibis
+        return fts.search(query, kinds=["suspects"], limit=limit)
+
+
 
-    
 
 
 pass
 #evidence class
-class Evidence(Base):
+class Evidence(ModelMixin, Base):
     __tablename__="evidence"
+    _archived = True
+    __table_args__ = {"sqlite_autoincrement": True}  #archived ids are never handed out again
     id = Column(Integer, primary_key=True)
     description = Column(String, nullable=False)
     found_location = Column(String)
 
     #relationships(case-evidence(one to many))
-    case_id= Column(Integer, ForeignKey("cases.id"))
+    case_id= Column(Integer, ForeignKey("cases.id", ondelete="CASCADE"), index=True)
     case = relationship("Case", back_populates="evidence")
 
     #crud operations
     @classmethod
-    def create(cls, description, found_location, case_id):
-        session = Session()
-        new_evidence = cls(description=description, found_location=found_location, case_id=case_id)
-        session.add(new_evidence)
-        session.commit()
-        session.close()
+    @profiled()
+    def create(cls, description, found_location, case_id, session=None):
+        new_evidence = cls._add(session, description=description, found_location=found_location, case_id=case_id)
         print("Evidence added successfully!")
+        return new_evidence
 
     @classmethod
-    def get_all(cls):
-        session = Session()
-        evidences = session.query(cls).all()
-        session.close()
-        return evidences
+    async def async_create(cls, description, found_location, case_id, session=None):
+        return await cls._async_add(session, description=description, found_location=found_location, case_id=case_id)
 
     @classmethod
-    def find_by_id(cls, evidence_id):
-        session = Session()
-        evidence = session.query(cls).filter_by(id=evidence_id).first()
-        session.close()
-        return evidence
+    @profiled()
+    def get_all(cls, session=None):
+        return cls._all(session)
 
     @classmethod
-    def delete(cls, evidence_id):
-        session = Session()
-        evidence = session.query(cls).filter_by(id=evidence_id).first()
-        if evidence:
-            session.delete(evidence)
-            session.commit()
+    @profiled()
+    def find_by_id(cls, evidence_id, session=None):
+        return cls._get(evidence_id, session)
+
+    @classmethod
+    @profiled()
+    def delete(cls, evidence_id, session=None):  #returns True if a row was deleted
+        if cls._remove(evidence_id, session):
             print("Evidence deleted successfully!")
-        else:
-            print("Evidence not found!")
-        session.close()
+            return True
+        print("Evidence not found!")
+        return False
+
+    @classmethod
+    @profiled()
+    def search(cls, query, limit=20):  #full-text search over evidence descriptions and found locations
+        return fts.search(query, kinds=["evidence"], limit=limit)
+
 
 pass
 
 #detective class
-class Detective(Base):
+class Detective(ModelMixin, Base):
     __tablename__="detectives"
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
@@ -174,95 +576,93 @@ class Detective(Base):
     solved_cases = Column(Integer, default=0)
 
     #relationship(cases-detectives(many-many))
-    cases = relationship("Case", back_populates="detectives", secondary=detective_case, cascade="all, delete")
+    cases = relationship("Case", back_populates="detectives", secondary=detective_case, passive_deletes=True)
 
 
     #crud operations
     @classmethod
-    def create(cls, name, rank, solved_cases=0):  #add new detective
-        session=Session()
-        new_detective= cls(name=name, rank=rank, solved_cases=solved_cases)
-        session.add(new_detective)
-        session.commit()
-        session.close()
+    @profiled()
+    def create(cls, name, rank, solved_cases=0, session=None):  #add new detective
+        new_detective = cls._add(session, name=name, rank=rank, solved_cases=solved_cases)
         print("New detective added successfully")
+        return new_detective
 
     @classmethod
-    def get_all(cls):
-        session=Session()
-        detectives =session.query(cls).all()
-        session.close()
-        return detectives
-    
-    @classmethod
-    def find_by_id(cls, detective_id):
-        session=Session()
-        detective= session.query(cls).filter_by(id=detective_id).first()
-        session.close()
-        return detective
-    
-    @classmethod
-    def delete(cls, detective_id):
-        session=Session()
-        detective = session.query(cls).filter_by(id=detective_id).first()
-        if detective:
-            session.delete(detective)
-            session.commit()
+    async def async_create(cls, name, rank, solved_cases=0, session=None):
+        return await cls._async_add(session, name=name, rank=rank, solved_cases=solved_cases)
+
+    @classmethod
+    @profiled()
+    def get_all(cls, session=None):
+        return cls._all(session)
+
+    @classmethod
+    @profiled()
+    def find_by_id(cls, detective_id, session=None):
+        return cls._get(detective_id, session)
+
+    @classmethod
+    @profiled()
+    def delete(cls, detective_id, session=None):  #returns True if a row was deleted
+        if cls._remove(detective_id, session):
             print("Detective deleted successfully!")
-        else:
-            print("Detective not found!")
-        session.close()
+            return True
+        print("Detective not found!")
+        return False
 
 
 pass
 #criminal_record class
-class CriminalRecord(Base):
+class CriminalRecord(ModelMixin, Base):
     __tablename__="criminal_records"
+    _archived = True
+    __table_args__ = {"sqlite_autoincrement": True}  #archived ids are never handed out again
     id = Column(Integer, primary_key=True)
     previous_crimes = Column(String)
     sentence = Column(String)
 
     #relationship(suspect-criminal_record(one to one))
-    suspect_id = Column(Integer, ForeignKey("suspects.id"), unique=True)
+    suspect_id = Column(Integer, ForeignKey("suspects.id", ondelete="CASCADE"), unique=True)
     suspect= relationship("Suspect", back_populates="criminal_record", uselist=False)
 
     #crud operation
     @classmethod
-    def create(cls, suspect_id, previous_crimes, sentence):
-        session = Session()
-        new_record = cls(suspect_id=suspect_id, previous_crimes=previous_crimes, sentence=sentence)
-        session.add(new_record)
-        session.commit()
-        session.close()
+    @profiled()
+    def create(cls, suspect_id, previous_crimes, sentence, session=None):
+        new_record = cls._add(session, suspect_id=suspect_id, previous_crimes=previous_crimes, sentence=sentence)
         print("Criminal record added successfully!")
+        return new_record
+
+    @classmethod
+    async def async_create(cls, suspect_id, previous_crimes, sentence, session=None):
+        return await cls._async_add(session, suspect_id=suspect_id, previous_crimes=previous_crimes, sentence=sentence)
 
     @classmethod
-    def get_all(cls):
-        session = Session()
-        records = session.query(cls).all()
-        session.close()
-        return records
+    @profiled()
+    def get_all(cls, session=None):
+        return cls._all(session)
 
     @classmethod
-    def find_by_id(cls, record_id):
-        session = Session()
-        record = session.query(cls).filter_by(id=record_id).first()
-        session.close()
-        return record
+    @profiled()
+    def find_by_id(cls, record_id, session=None):
+        return cls._get(record_id, session)
 
     @classmethod
-    def delete(cls, record_id):
-        session = Session()
-        record = session.query(cls).filter_by(id=record_id).first()
-        if record:
-            session.delete(record)
-            session.commit()
+    @profiled()
+    def delete(cls, record_id, session=None):  #returns True if a row was deleted
+        if cls._remove(record_id, session):
             print("Criminal record deleted successfully!")
-        else:
-            print("Criminal record not found!")
-        session.close()
+            return True
+        print("Criminal record not found!")
+        return False
+
+    @classmethod
+    @profiled()
+    def search(cls, query, limit=20):  #full-text search over previous crimes
+        return fts.search(query, kinds=["criminal_records"], limit=limit)
 
 
-# Create tables in the database
-Base.metadata.create_all(engine)
 
+# Create tables in the database; run explicitly (cli.py init-db, or on interactive start) rather than on import
+def init_db(bind=None):
+    Base.metadata.create_all(bind or engine)
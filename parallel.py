@@ -0,0 +1,138 @@
+import csv
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import func, select
+
+import database
+import reports
+import transfer
+from database import engine, make_engine
+from models import Case
+
+#worker processes for report and export jobs: CRIME_WORKERS, else one per core
+WORKERS = int(os.environ.get("CRIME_WORKERS", 0)) or os.cpu_count() or 1
+#several shards per worker, so a worker that drew a sparse id range picks up another one
+SHARDS_PER_WORKER = 4
+
+#set in each worker process by _init_worker
+_worker_engine = None
+
+
+def read_only_url(bind=None):
+    #the same sqlite file opened read-only; WAL lets the workers read while the app keeps writing
+    path = (bind or engine).url.database
+    if not path or path == ":memory:":
+        raise ValueError("Parallel jobs need a file database")
+    return f"sqlite:///file:{os.path.abspath(path)}?mode=ro&uri=true"
+
+
+def _init_worker(url):
+    #connections inherited from the parent stay with the parent; this process gets its own engine
+    global _worker_engine
+    engine.dispose(close=False)
+    _worker_engine = make_engine(url)
+    database.Session.configure(bind=_worker_engine)
+
+
+def shards(column, count, bind=None):
+    #splits the range of an integer column into up to `count` (after, until] ranges
+    with (bind or engine).connect() as conn:
+        #two queries: sqlite answers a lone min() or max() from the end of the index
+        low = conn.execute(select(func.min(column))).scalar()
+        high = conn.execute(select(func.max(column))).scalar()
+    if low is None:
+        return []
+    step = max(1, -(-(high - low + 1) // count))
+    return [(start - 1, min(start + step - 1, high)) for start in range(low, high + 1, step)]
+
+
+def _run(job, tasks, workers, bind=None):
+    #runs job over tasks in the pool, yielding results in task order as soon as each is ready
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(read_only_url(bind),)) as pool:
+        yield from pool.map(job, tasks)
+
+
+def _concatenate(parts, out, separator=""):
+    #appends (part path, item count) files to out in order, with separator between non-empty parts
+    total = 0
+    for path, count in parts:
+        if count:
+            if total and separator:
+                out.write(separator)
+            with open(path, encoding="utf-8", newline="") as part:
+                shutil.copyfileobj(part, out)
+        os.remove(path)
+        total += count
+    return total
+
+
+#reports
+
+def _report_shard(task):
+    after_id, until_id, fmt, filters, path = task
+    count = 0
+
+    def counted(cases):
+        nonlocal count
+        for case in cases:
+            count += 1
+            yield case
+
+    with open(path, "w", encoding="utf-8") as out:
+        for piece in reports.render_cases(counted(reports.load_cases(after_id=after_id, until_id=until_id,
+                                                                     **filters)), fmt):
+            out.write(piece)
+    return path, count
+
+
+def write_report(out=None, fmt="text", workers=None, **filters):
+    #reports.write_report split over worker processes by case id range; the output is identical
+    out = out or sys.stdout
+    workers = workers or WORKERS
+    if fmt not in reports.FORMATS:
+        raise ValueError(f"Unknown report format: {fmt}")
+    with tempfile.TemporaryDirectory() as workdir:
+        tasks = [(after, until, fmt, filters, os.path.join(workdir, f"part{i}"))
+                 for i, (after, until) in enumerate(shards(Case.id, workers * SHARDS_PER_WORKER))]
+        out.write(reports.HEADERS[fmt])
+        #json pieces carry their own "," except the first of each part
+        count = _concatenate(_run(_report_shard, tasks, workers), out, "," if fmt == "json" else "")
+        out.write(reports.FOOTERS[fmt])
+    return count
+
+
+#exports
+
+def _export_shard(task):
+    name, after, until, fmt, chunk_size, path = task
+    columns = [c.name for c in transfer.TABLES[name].columns]
+    with open(path, "w", newline="", encoding="utf-8") as out:
+        count = transfer.write_rows(out, fmt, columns,
+                                    transfer.iter_rows(name, chunk_size, _worker_engine, after, until))
+    return path, count
+
+
+def export_table(name, path, fmt=None, chunk_size=transfer.CHUNK_SIZE, workers=None):
+    #transfer.export_table split over worker processes by key range; the file is identical
+    fmt = transfer._format_for(path, fmt)
+    workers = workers or WORKERS
+    columns = [c.name for c in transfer.TABLES[name].columns]
+    with tempfile.TemporaryDirectory() as workdir:
+        tasks = [(name, after, until, fmt, chunk_size, os.path.join(workdir, f"part{i}"))
+                 for i, (after, until) in enumerate(shards(transfer.shard_column(name),
+                                                           workers * SHARDS_PER_WORKER))]
+        with open(path, "w", newline="", encoding="utf-8") as out:
+            if fmt == "csv":
+                csv.writer(out).writerow(columns)
+            return _concatenate(_run(_export_shard, tasks, workers), out)
+
+
+def export_all(directory, fmt="csv", chunk_size=transfer.CHUNK_SIZE, workers=None):
+    os.makedirs(directory, exist_ok=True)
+    return {name: export_table(name, os.path.join(directory, f"{name}.{fmt}"), fmt, chunk_size, workers)
+            for name in transfer.TABLES}
@@ -0,0 +1,67 @@
+import sys
+from datetime import date
+
+from sqlalchemy import delete, select
+
+from database import engine
+from models import Case, Suspect, Evidence, Detective, CriminalRecord, detective_case
+
+#the statements behind find_by_id, relationship loads, cascade deletes, keyset pages and filters
+CORE_QUERIES = [
+    ("case by id", select(Case).where(Case.id == 1)),
+    ("cases page", select(Case).where(Case.id > 100).order_by(Case.id).limit(21)),
+    ("cases by status", select(Case).where(Case.status == "Open")),
+    ("cases by crime type", select(Case).where(Case.crime_type == "Fraud")),
+    ("sample probe by status", select(Case).where(Case.status == "Open", Case.id >= 100).order_by(Case.id).limit(1)),
+    ("cases in date range", select(Case).where(Case.date.between(date(2024, 7, 1), date(2024, 9, 30)))),
+    ("crime type in date range", select(Case).where(Case.crime_type == "Burglary",
+                                                    Case.date.between(date(2024, 7, 1), date(2024, 9, 30)))),
+    ("case.suspects", select(Suspect).where(Suspect.case_id == 1)),
+    ("case.evidence", select(Evidence).where(Evidence.case_id == 1)),
+    ("case.detectives", select(Detective).join(detective_case).where(detective_case.c.case_id == 1)),
+    ("detective.cases", select(Case).join(detective_case).where(detective_case.c.detective_id == 1)),
+    ("suspect.criminal_record", select(CriminalRecord).where(CriminalRecord.suspect_id == 1)),
+    ("delete case links", delete(detective_case).where(detective_case.c.case_id == 1)),
+    ("delete detective links", delete(detective_case).where(detective_case.c.detective_id == 1)),
+]
+
+
+def explain(stmt, bind=None):
+    #returns the EXPLAIN QUERY PLAN detail lines for a statement
+    bind = bind or engine
+    sql = str(stmt.compile(bind, compile_kwargs={"literal_binds": True}))
+    with bind.connect() as conn:
+        return [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql)]
+
+
+def full_scans(plan):
+    #"SCAN t" is a full table scan; a scan of a covering index or a constant row is fine
+    return [line for line in plan if line.startswith("SCAN") and "INDEX" not in line and "CONSTANT" not in line]
+
+
+def sorts(plan):
+    #a temp b-tree for ORDER BY means every matching row is read and sorted before the first comes back
+    return [line for line in plan if line.startswith("USE TEMP B-TREE FOR ORDER BY")]
+
+
+def check(queries=CORE_QUERIES, bind=None):
+    #returns [(name, plan, problems)] for every query: full scans and sorts
+    return [(name, plan, full_scans(plan) + sorts(plan)) for name, plan in ((n, explain(s, bind)) for n, s in queries)]
+
+
+def main():
+    failed = 0
+    for name, plan, scans in check():
+        status = ("SORT" if sorts(plan) else "SCAN") if scans else "ok"
+        print(f"[{status}] {name}")
+        for line in plan:
+            print(f"    {line}")
+        failed += bool(scans)
+    if failed:
+        print(f"{failed} queries do a full table scan or sort")
+        sys.exit(1)
+    print("All core queries use an index")
+
+
+if __name__ == "__main__":
+    main()
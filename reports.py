@@ -0,0 +1,171 @@
+import json
+import sys
+
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
+
+from database import session_scope
+from models import Case, Suspect
+
+#selectin loading runs one query per relationship per batch of up to 500 parents, so keeping
+#chunks at or under that size makes every chunk cost at most QUERIES_PER_CHUNK queries:
+#cases, suspects (with their criminal records joined in), evidence, detectives
+CHUNK_SIZE = 500
+QUERIES_PER_CHUNK = 4
+
+FORMATS = ("text", "markdown", "json")
+
+
+def _report_options():
+    return (
+        #a chunk can have more than 500 suspects, so records are joined rather than batched
+        selectinload(Case.suspects).joinedload(Suspect.criminal_record),
+        selectinload(Case.evidence),
+        selectinload(Case.detectives),
+    )
+
+
+def load_cases(case_ids=None, status=None, crime_type=None, chunk_size=CHUNK_SIZE, after_id=0, until_id=None):
+    #yields cases with everything a report needs already loaded, one keyset chunk at a time;
+    #after_id/until_id limit it to the id range (after_id, until_id]
+    chunk_size = min(chunk_size, CHUNK_SIZE)
+    while True:
+        stmt = select(Case).options(*_report_options()).where(Case.id > after_id)
+        if until_id is not None:
+            stmt = stmt.where(Case.id <= until_id)
+        if case_ids is not None:
+            stmt = stmt.where(Case.id.in_(case_ids))
+        if status:
+            stmt = stmt.where(Case.status == status)
+        if crime_type:
+            stmt = stmt.where(Case.crime_type == crime_type)
+        with session_scope() as session:
+            cases = session.scalars(stmt.order_by(Case.id).limit(chunk_size)).all()
+        yield from cases
+        if len(cases) < chunk_size:
+            break
+        after_id = cases[-1].id
+
+
+def load_case(case_id):
+    return next(load_cases(case_ids=[case_id]), None)
+
+
+def case_to_dict(case):
+    return {
+        "id": case.id,
+        "crime_type": case.crime_type,
+        "status": case.status,
+        "location": case.location,
+        "date": case.date.isoformat() if case.date else None,
+        "detectives": [{"id": d.id, "name": d.name, "rank": d.rank} for d in case.detectives],
+        "suspects": [
+            {
+                "id": s.id,
+                "name": s.name,
+                "age": s.age,
+                "alibi": s.alibi,
+                "criminal_record": {
+                    "previous_crimes": s.criminal_record.previous_crimes,
+                    "sentence": s.criminal_record.sentence,
+                } if s.criminal_record else None,
+            }
+            for s in case.suspects
+        ],
+        "evidence": [
+            {"id": e.id, "description": e.description, "found_location": e.found_location}
+            for e in case.evidence
+        ],
+    }
+
+
+def render_text(case):
+    data = case_to_dict(case)
+    lines = [
+        f"Case #{data['id']}: {data['crime_type']} ({data['status']})",
+        f"  Date: {data['date']}",
+        f"  Location: {data['location']}",
+        "  Detectives: " + (", ".join(f"{d['name']} ({d['rank']})" for d in data["detectives"]) or "none assigned"),
+        f"  Suspects ({len(data['suspects'])}):",
+    ]
+    for s in data["suspects"]:
+        lines.append(f"    - {s['name']}, age {s['age']}, alibi: {s['alibi'] or 'N/A'}")
+        if s["criminal_record"]:
+            lines.append(f"      record: {s['criminal_record']['previous_crimes']} / sentence: {s['criminal_record']['sentence']}")
+    lines.append(f"  Evidence ({len(data['evidence'])}):")
+    for e in data["evidence"]:
+        lines.append(f"    - {e['description']} (found: {e['found_location'] or 'unknown'})")
+    return "\n".join(lines) + "\n\n"
+
+
+def render_markdown(case):
+    data = case_to_dict(case)
+    lines = [
+        f"## Case #{data['id']}: {data['crime_type']}",
+        "",
+        f"- **Status:** {data['status']}",
+        f"- **Date:** {data['date']}",
+        f"- **Location:** {data['location']}",
+        "- **Detectives:** " + (", ".join(f"{d['name']} ({d['rank']})" for d in data["detectives"]) or "none assigned"),
+        "",
+        "### Suspects",
+        "",
+    ]
+    if data["suspects"]:
+        lines += ["| ID | Name | Age | Alibi | Record |", "|---|---|---|---|---|"]
+        for s in data["suspects"]:
+            record = s["criminal_record"]["previous_crimes"] if s["criminal_record"] else ""
+            lines.append(f"| {s['id']} | {s['name']} | {s['age']} | {s['alibi'] or 'N/A'} | {record} |")
+    else:
+        lines.append("_None_")
+    lines += ["", "### Evidence", ""]
+    if data["evidence"]:
+        lines += ["| ID | Description | Found Location |", "|---|---|---|"]
+        for e in data["evidence"]:
+            lines.append(f"| {e['id']} | {e['description']} | {e['found_location'] or ''} |")
+    else:
+        lines.append("_None_")
+    return "\n".join(lines) + "\n\n"
+
+
+#what goes around the per-case pieces of a whole report
+HEADERS = {"text": "", "markdown": "# Case Report\n\n", "json": "["}
+FOOTERS = {"text": "", "markdown": "", "json": "\n]\n"}
+
+
+def render_cases(cases, fmt="text"):
+    #the per-case pieces only; for json, pieces after the first start with the "," separator
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown report format: {fmt}")
+    if fmt == "json":
+        for i, case in enumerate(cases):
+            yield ("," if i else "") + "\n  " + json.dumps(case_to_dict(case))
+    else:
+        renderer = render_markdown if fmt == "markdown" else render_text
+        for case in cases:
+            yield renderer(case)
+
+
+def render(cases, fmt="text"):
+    #yields the report piece by piece so it can be written out as it is produced
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown report format: {fmt}")
+    yield HEADERS[fmt]
+    yield from render_cases(cases, fmt)
+    yield FOOTERS[fmt]
+
+
+def write_report(out=None, fmt="text", **filters):
+    #streams a report for the matching cases to a file object (stdout by default); returns the case count
+    out = out or sys.stdout
+    count = 0
+
+    def counted(cases):
+        nonlocal count
+        for case in cases:
+            count += 1
+            yield case
+
+    for piece in render(counted(load_cases(**filters)), fmt):
+        out.write(piece)
+    return count
@@ -0,0 +1,108 @@
+import re
+from collections import namedtuple
+
+from sqlalchemy import event, text
+
+from database import Base, engine
+
+#searchable text per table: kind -> (source table, indexed columns, sql giving the owning case id)
+FTS_SOURCES = {
+    "evidence": ("evidence", ["description", "found_location"], "src.case_id"),
+    "suspects": ("suspects", ["alibi"], "src.case_id"),
+    "cases": ("cases", ["location"], "src.id"),
+    "criminal_records": ("criminal_records", ["previous_crimes"],
+                         "(SELECT s.case_id FROM suspects s WHERE s.id = src.suspect_id)"),
+}
+
+SearchResult = namedtuple("SearchResult", ["kind", "id", "case_id", "score", "snippet"])
+
+
+def _fts_table(table):
+    return f"{table}_fts"
+
+
+def _ddl(table, columns):
+    fts = _fts_table(table)
+    cols = ", ".join(columns)
+    new_vals = ", ".join(f"new.{c}" for c in columns)
+    old_vals = ", ".join(f"old.{c}" for c in columns)
+    #external-content index: the text lives only in the source table, triggers keep the index in step
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', content_rowid='id', "
+        f"tokenize='porter unicode61')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals}); END",
+    ]
+
+
+def install(conn):
+    #creates the fts tables and triggers (idempotent); indexes existing rows the first time
+    existing = {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for table, columns, _ in FTS_SOURCES.values():
+        if table not in existing:
+            continue
+        for statement in _ddl(table, columns):
+            conn.exec_driver_sql(statement)
+        if _fts_table(table) not in existing:
+            rebuild(conn, table)
+
+
+def uninstall(conn):
+    for table, _, _ in FTS_SOURCES.values():
+        fts = _fts_table(table)
+        for suffix in ("ai", "ad", "au"):
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {fts}")
+
+
+def rebuild(conn, table=None):
+    #re-reads the source tables into the index (repair after bulk loads with triggers off, etc.)
+    tables = [table] if table else [t for t, _, _ in FTS_SOURCES.values()]
+    for t in tables:
+        fts = _fts_table(t)
+        conn.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _install_after_create(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        install(connection)
+
+
+def to_match_query(query):
+    #turns free text into an fts5 query: every word must appear (prefix match on the last one)
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search(query, kinds=None, limit=20, raw=False, bind=None):
+    #ranked matches (best first) across the requested kinds; raw=True passes fts5 syntax through
+    match = query if raw else to_match_query(query)
+    if not match:
+        return []
+    bind = bind or engine
+    results = []
+    with bind.connect() as conn:
+        for kind in kinds or FTS_SOURCES:
+            if kind not in FTS_SOURCES:
+                raise ValueError(f"Unknown search kind: {kind}")
+            table, _, case_id = FTS_SOURCES[kind]
+            fts = _fts_table(table)
+            rows = conn.execute(text(
+                f"SELECT src.id, {case_id}, bm25({fts}), snippet({fts}, -1, '[', ']', '…', 12) "
+                f"FROM {fts} JOIN {table} src ON src.id = {fts}.rowid "
+                f"WHERE {fts} MATCH :match ORDER BY rank LIMIT :limit"
+            ), {"match": match, "limit": limit})
+            results.extend(SearchResult(kind, *row) for row in rows)
+    #bm25 is lower-is-better
+    results.sort(key=lambda r: r.score)
+    return results[:limit]
@@ -0,0 +1,185 @@
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from faker import Faker
+from sqlalchemy import func, select
+
+import geo
+from database import engine
+from models import Case, Suspect, Evidence, Detective, CriminalRecord, detective_case, init_db
+
+#same vocabularies the interactive generators in cli.py use
+CRIME_TYPES = ["Robbery", "Murder", "Kidnapping", "Fraud", "Burglary", "Assault", "Arson", "Cybercrime"]
+STATUSES = ["Open", "Under Investigation", "Closed"]
+RANKS = ["Junior", "Senior", "Chief", "Inspector"]
+DESCRIPTIONS = ["Bloody knife", "Fingerprint on glass", "Security footage", "DNA sample", "Footprint at the scene"]
+FOUND_LOCATIONS = ["Living room", "Kitchen", "Parking lot", "Abandoned house", "Office building"]
+
+#fan-out per case (min, max) and other ratios
+SUSPECTS_PER_CASE = (0, 4)
+EVIDENCE_PER_CASE = (1, 6)
+DETECTIVES_PER_CASE = (1, 2)
+CASES_PER_DETECTIVE = 40
+RECORD_RATIO = 0.35
+
+#faker is far too slow to call millions of times, so text is drawn from pools built once per run
+POOL_SIZE = 5000
+#share of addresses set in a city the gazetteer lists (so they locate to it, and show up in radius and
+#hotspot queries); the rest are faker's, whose made-up towns only ever locate to their state
+PLACE_SHARE = 0.9
+
+
+def _address(fake, rng, places):
+    if places and rng.random() < PLACE_SHARE:
+        name, region = rng.choice(places)
+        return f"{fake.street_address()}, {name}, {region} {fake.zipcode()}"
+    return fake.address().replace("\n", ", ")
+
+
+class _Pools:
+    def __init__(self, fake, rng):
+        places = geo.gazetteer().listed
+        self.addresses = [_address(fake, rng, places) for _ in range(POOL_SIZE)]
+        #core inserts skip the orm's geocoding hook, so each address is looked up here, once
+        self.points = {address: geo.geocode(address) or (None, None, None) for address in self.addresses}
+        self.names = [fake.name() for _ in range(POOL_SIZE)]
+        self.sentences = [fake.sentence() for _ in range(POOL_SIZE)]
+
+
+def _next_id(conn, table):
+    return (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+
+def seed(cases, seed=42, chunk_size=10000, bind=None, progress=None):
+    #fills the database with `cases` cases plus related rows; returns the row count per table
+    bind = bind or engine
+    rng = random.Random(seed)
+    fake = Faker()
+    fake.seed_instance(seed)
+    pools = _Pools(fake, rng)
+
+    cases_t = Case.__table__
+    suspects_t = Suspect.__table__
+    evidence_t = Evidence.__table__
+    detectives_t = Detective.__table__
+    records_t = CriminalRecord.__table__
+
+    counts = {"cases": 0, "suspects": 0, "evidence": 0, "detectives": 0, "criminal_records": 0, "detective_case": 0}
+    today = date.today()
+
+    with bind.begin() as conn:
+        case_id = _next_id(conn, cases_t)
+        suspect_id = _next_id(conn, suspects_t)
+        evidence_id = _next_id(conn, evidence_t)
+        detective_id = _next_id(conn, detectives_t)
+        record_id = _next_id(conn, records_t)
+
+        #detectives are a small shared pool, inserted up front so links can reference them
+        n_detectives = max(5, cases // CASES_PER_DETECTIVE)
+        detective_ids = list(range(detective_id, detective_id + n_detectives))
+        detective_rows = [
+            {"id": d, "name": rng.choice(pools.names), "rank": rng.choice(RANKS), "solved_cases": rng.randint(0, 50)}
+            for d in detective_ids
+        ]
+        for start in range(0, len(detective_rows), chunk_size):
+            conn.execute(detectives_t.insert(), detective_rows[start:start + chunk_size])
+        counts["detectives"] = n_detectives
+
+    remaining = cases
+    while remaining > 0:
+        n = min(chunk_size, remaining)
+        case_rows, suspect_rows, evidence_rows, record_rows, link_rows = [], [], [], [], []
+
+        for _ in range(n):
+            case_date = today - timedelta(days=rng.randint(0, 5 * 365))
+            location = rng.choice(pools.addresses)
+            latitude, longitude, precision = pools.points[location]
+            case_rows.append({
+                "id": case_id,
+                "crime_type": rng.choice(CRIME_TYPES),
+                "status": rng.choice(STATUSES),
+                "location": location,
+                "date": case_date,
+                "latitude": latitude,
+                "longitude": longitude,
+                "geo_precision": precision,
+            })
+
+            for _ in range(rng.randint(*SUSPECTS_PER_CASE)):
+                suspect_rows.append({
+                    "id": suspect_id,
+                    "name": rng.choice(pools.names),
+                    "age": rng.randint(18, 65),
+                    "alibi": rng.choice(pools.sentences),
+                    "case_id": case_id,
+                })
+                if rng.random() < RECORD_RATIO:
+                    record_rows.append({
+                        "id": record_id,
+                        "suspect_id": suspect_id,
+                        "previous_crimes": rng.choice(pools.sentences),
+                        "sentence": rng.choice(pools.sentences),
+                    })
+                    record_id += 1
+                suspect_id += 1
+
+            for _ in range(rng.randint(*EVIDENCE_PER_CASE)):
+                evidence_rows.append({
+                    "id": evidence_id,
+                    "description": rng.choice(DESCRIPTIONS),
+                    "found_location": rng.choice(FOUND_LOCATIONS),
+                    "case_id": case_id,
+                })
+                evidence_id += 1
+
+            for d in rng.sample(detective_ids, min(len(detective_ids), rng.randint(*DETECTIVES_PER_CASE))):
+                link_rows.append({"detective_id": d, "case_id": case_id})
+
+            case_id += 1
+
+        #one transaction per chunk, one executemany per table
+        with bind.begin() as conn:
+            conn.execute(cases_t.insert(), case_rows)
+            if suspect_rows:
+                conn.execute(suspects_t.insert(), suspect_rows)
+            if record_rows:
+                conn.execute(records_t.insert(), record_rows)
+            conn.execute(evidence_t.insert(), evidence_rows)
+            conn.execute(detective_case.insert(), link_rows)
+
+        counts["cases"] += len(case_rows)
+        counts["suspects"] += len(suspect_rows)
+        counts["evidence"] += len(evidence_rows)
+        counts["criminal_records"] += len(record_rows)
+        counts["detective_case"] += len(link_rows)
+        remaining -= n
+        if progress:
+            progress(counts)
+
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-load synthetic cases and related rows.")
+    parser.add_argument("--cases", type=int, default=1000, help="number of cases to generate")
+    parser.add_argument("--seed", type=int, default=42, help="random seed (same seed, same data)")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="cases per transaction")
+    args = parser.parse_args(argv)
+
+    init_db()
+    started = time.perf_counter()
+
+    def report(counts):
+        print(f"\r{counts['cases']}/{args.cases} cases ({time.perf_counter() - started:.1f}s)", end="", flush=True)
+
+    counts = seed(args.cases, seed=args.seed, chunk_size=args.chunk_size, progress=report)
+    print()
+    for table, count in counts.items():
+        print(f"{table}: {count}")
+    print(f"Done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
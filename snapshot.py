@@ -0,0 +1,402 @@
+import datetime
+import json
+import os
+import shutil
+
+import numpy as np
+
+from database import engine
+
+#column kinds: int (int64), float (float64, NULL = nan), date (int32 days since 1970-01-01),
+#str (int32 codes into a per-column dictionary, NULL = -1)
+DTYPES = {"int": np.int64, "float": np.float64, "date": np.int32, "str": np.int32}
+INT_NULL = np.iinfo(np.int64).min
+DATE_NULL = np.iinfo(np.int32).min
+STR_NULL = -1
+
+#what goes into the snapshot: table -> [(column, kind)]. free text (names, descriptions, case locations)
+#stays out; evidence found_location is kept as a category
+TABLES = {
+    "cases": [("id", "int"), ("crime_type", "str"), ("status", "str"), ("date", "date"),
+              ("latitude", "float"), ("longitude", "float")],
+    "suspects": [("id", "int"), ("case_id", "int"), ("age", "int")],
+    "evidence": [("id", "int"), ("case_id", "int"), ("found_location", "str")],
+    "detective_case": [("detective_id", "int"), ("case_id", "int")],
+}
+#derived group-by keys over a date column
+DATE_PARTS = {"day": "D", "month": "M", "year": "Y"}
+CHUNK_SIZE = 100000
+
+
+def snapshot_path(bind=None):
+    #CRIME_SNAPSHOT_DIR, else "<database>_snapshot" next to a file database
+    if os.environ.get("CRIME_SNAPSHOT_DIR"):
+        return os.environ["CRIME_SNAPSHOT_DIR"]
+    database = (bind or engine).url.database
+    if not database or database == ":memory:":
+        raise ValueError("No snapshot directory for an in-memory database; set CRIME_SNAPSHOT_DIR")
+    return os.path.splitext(database)[0] + "_snapshot"
+
+
+#writing
+
+def _encode(kind, values, dictionary=None):
+    #python values -> numpy column; str columns extend dictionary ({text: code}) as they go
+    #legacy rows can hold text in numeric columns; anything that is not the column's type is stored as NULL
+    if kind == "int":
+        return np.array([v if isinstance(v, int) else INT_NULL for v in values], dtype=np.int64)
+    if kind == "float":
+        return np.array([v if isinstance(v, (int, float)) else np.nan for v in values], dtype=np.float64)
+    if kind == "date":
+        return np.array([_days(v) for v in values], dtype=np.int32)
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, v in enumerate(values):
+        codes[i] = STR_NULL if v is None else dictionary.setdefault(v, len(dictionary))
+    return codes
+
+
+def _days(value):
+    try:
+        day = np.datetime64(value, "D") if isinstance(value, (str, datetime.date)) else np.datetime64("NaT")
+    except ValueError:
+        return DATE_NULL
+    return DATE_NULL if np.isnat(day) else int(day.astype(np.int64))
+
+
+def _write_meta(directory, meta):
+    #the meta file is what readers trust, so it is replaced in one step after the columns are written
+    temporary = os.path.join(directory, "meta.json.tmp")
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(temporary, os.path.join(directory, "meta.json"))
+
+
+def _read_meta(directory):
+    try:
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def refresh_table(conn, name, directory, full=False, chunk_size=CHUNK_SIZE):
+    #appends rows past the table's rowid watermark; rebuilds it when full, when its columns have changed, or
+    #when rows at or below the watermark have been deleted since. returns the number of rows appended
+    columns = TABLES[name]
+    meta = None if full else _read_meta(directory)
+    if meta is not None and meta["columns"] != dict(columns):
+        meta = None
+    if meta is not None:
+        below = conn.exec_driver_sql(f"SELECT count(*) FROM {name} WHERE rowid <= ?", (meta["watermark"],)).scalar()
+        if below != meta["rows"]:
+            meta = None
+    if meta is None:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        meta = {"rows": 0, "watermark": 0, "columns": dict(columns)}
+    dictionaries = {}
+    for column, kind in columns:
+        path = os.path.join(directory, f"{column}.bin")
+        #bytes past the recorded row count are left over from an interrupted refresh
+        with open(path, "ab") as f:
+            f.truncate(meta["rows"] * np.dtype(DTYPES[kind]).itemsize)
+        if kind == "str":
+            dictionaries[column] = {text: code for code, text in enumerate(_load_dictionary(directory, column))}
+
+    appended = 0
+    select_list = ", ".join(["rowid"] + [column for column, _ in columns])
+    while True:
+        rows = conn.exec_driver_sql(f"SELECT {select_list} FROM {name} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                                    (meta["watermark"], chunk_size)).fetchall()
+        if not rows:
+            break
+        values = list(zip(*rows))
+        for position, (column, kind) in enumerate(columns, 1):
+            with open(os.path.join(directory, f"{column}.bin"), "ab") as f:
+                f.write(_encode(kind, values[position], dictionaries.get(column)).tobytes())
+        meta["rows"] += len(rows)
+        meta["watermark"] = rows[-1][0]
+        appended += len(rows)
+    for column, dictionary in dictionaries.items():
+        with open(os.path.join(directory, f"{column}.dict.json"), "w", encoding="utf-8") as f:
+            json.dump(sorted(dictionary, key=dictionary.get), f)
+    _write_meta(directory, meta)
+    return appended
+
+
+def _load_dictionary(directory, column):
+    try:
+        with open(os.path.join(directory, f"{column}.dict.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def refresh(path=None, full=False, tables=None, bind=None):
+    #brings the snapshot up to date (in one read transaction, so every table is from the same moment);
+    #returns {table: rows appended}
+    bind = bind or engine
+    path = path or snapshot_path(bind)
+    appended = {}
+    with bind.connect() as conn, conn.begin():
+        for name in tables or TABLES:
+            appended[name] = refresh_table(conn, name, os.path.join(path, name), full)
+    return appended
+
+
+#reading
+
+class Table:
+    #one snapshot table; columns are memory-mapped on first use, so only the pages a query touches are read
+    def __init__(self, directory):
+        self.directory = directory
+        meta = _read_meta(directory)
+        if meta is None:
+            raise FileNotFoundError(f"No snapshot in {directory}; run a refresh first")
+        self.rows = meta["rows"]
+        self.watermark = meta["watermark"]
+        self.kinds = meta["columns"]
+        self._columns = {}
+        self._dictionaries = {}
+        self._lookup = {}
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, name):
+        #the raw column (codes for str columns)
+        if name not in self.kinds:
+            raise KeyError(f"No column {name}")
+        if name not in self._columns:
+            dtype = DTYPES[self.kinds[name]]
+            self._columns[name] = (np.memmap(os.path.join(self.directory, f"{name}.bin"), dtype=dtype, mode="r",
+                                             shape=(self.rows,))
+                                   if self.rows else np.empty(0, dtype=dtype))
+        return self._columns[name]
+
+    def dictionary(self, name):
+        if name not in self._dictionaries:
+            self._dictionaries[name] = _load_dictionary(self.directory, name)
+        return self._dictionaries[name]
+
+    def _code(self, name, value):
+        #dictionary code of a str value (-2, which matches nothing, if it never occurs)
+        if value is None:
+            return STR_NULL
+        if name not in self._lookup:
+            self._lookup[name] = {text: code for code, text in enumerate(self.dictionary(name))}
+        return self._lookup[name].get(value, -2)
+
+    def _scalar(self, name, value):
+        kind = self.kinds[name]
+        if kind == "str":
+            return self._code(name, value)
+        if kind == "date":
+            day = _days(value)
+            if day == DATE_NULL and value is not None:
+                raise ValueError(f"Not a date: {value}")
+            return day
+        if value is None:
+            return INT_NULL if kind == "int" else np.nan
+        return int(value) if kind == "int" else float(value)
+
+    def mask(self, where=None, rows=slice(None)):
+        #boolean array over `rows` (a slice or index array) of the rows matching every condition:
+        #{column: value}, {column: [values]}, or {column: (low, high)} inclusive with None for an open end
+        #(ranges skip NULLs)
+        selected = None
+        for name, condition in (where or {}).items():
+            column = self.column(name)[rows]
+            if isinstance(condition, tuple):
+                if self.kinds[name] == "str":
+                    raise ValueError(f"Cannot take a range of text column {name}")
+                low, high = condition
+                matched = np.ones(len(column), dtype=bool)
+                if low is not None:
+                    matched &= column >= self._scalar(name, low)
+                if high is not None:
+                    matched &= column <= self._scalar(name, high)
+                if self.kinds[name] in ("int", "date"):
+                    matched &= column != (INT_NULL if self.kinds[name] == "int" else DATE_NULL)
+            elif isinstance(condition, (list, set, frozenset)):
+                matched = np.isin(column, [self._scalar(name, value) for value in condition])
+            else:
+                matched = column == self._scalar(name, condition)
+            selected = matched if selected is None else selected & matched
+        if selected is None:
+            return np.ones(len(range(self.rows)[rows]) if isinstance(rows, slice) else len(rows), dtype=bool)
+        return selected
+
+    def key(self, name):
+        #Key for grouping by a column or a date part ("date:month")
+        column, _, part = name.partition(":")
+        kind = self.kinds.get(column)
+        if kind is None:
+            raise KeyError(f"No column {column}")
+        values = self.column(column)
+        if part:
+            if kind != "date" or part not in DATE_PARTS:
+                raise ValueError(f"Unknown date part: {name}")
+            unit = DATE_PARTS[part]
+            bounds = _bounds(Key(values.__getitem__, DATE_NULL, None), self.rows)
+            if bounds is None:
+                return Key(values.__getitem__, DATE_NULL, None, (0, -1))
+            #days only span a few thousand values, so the part of each day is looked up rather than computed
+            days = np.arange(bounds[0], bounds[1] + 1, dtype=np.int64)
+            parts = days.astype("datetime64[D]").astype(f"datetime64[{unit}]").astype(np.int64)
+            first = int(parts[0])
+
+            def get(rows):
+                day = values[rows]
+                keys = parts[np.clip(day.astype(np.int64) - bounds[0], 0, len(parts) - 1)]
+                keys[day == DATE_NULL] = INT_NULL
+                return keys
+            return Key(get, INT_NULL, lambda k: str(np.datetime64(k, unit)), (first, int(parts[-1])))
+        if kind == "str":
+            dictionary = self.dictionary(column)
+            return Key(values.__getitem__, STR_NULL, dictionary.__getitem__, (0, len(dictionary) - 1))
+        if kind == "date":
+            return Key(values.__getitem__, DATE_NULL, lambda k: str(np.datetime64(k, "D")))
+        if kind == "float":
+            raise ValueError(f"Cannot group by float column {column}")
+        return Key(values.__getitem__, INT_NULL, int)
+
+
+class Key:
+    #a group-by key: get(rows) -> integer keys for a slice or index array of rows, the key standing for NULL,
+    #decode(key) -> value, and the (low, high) range of non-NULL keys when it is known up front
+    def __init__(self, get, null, decode, bounds=None):
+        self.get = get
+        self.null = null
+        self.decode = decode
+        self.bounds = bounds
+
+
+#aggregations walk the rows in chunks so the working set stays a few MB whatever the table size
+AGGREGATE_CHUNK = 1 << 20
+#combinations up to this many get a dense counter array; beyond it distinct combinations are sorted
+DENSE_GROUPS = 1 << 22
+
+
+def _chunks(rows):
+    for start in range(0, rows, AGGREGATE_CHUNK):
+        yield slice(start, min(start + AGGREGATE_CHUNK, rows))
+
+
+def _bounds(key, rows):
+    #(low, high) over the non-NULL keys, or None when every key is NULL
+    if key.bounds is not None:
+        return key.bounds if key.bounds[1] >= key.bounds[0] else None
+    low = high = None
+    for chunk in _chunks(rows):
+        values = key.get(chunk)
+        values = values[values != key.null]
+        if len(values):
+            low = int(values.min()) if low is None else min(low, int(values.min()))
+            high = int(values.max()) if high is None else max(high, int(values.max()))
+    return None if low is None else (low, high)
+
+
+def count_keys(rows, keys, selected, limit=None):
+    #[(value, ..., count)] per distinct combination of keys among the rows where selected(rows) is true,
+    #largest first
+    if not keys:
+        return [(sum(int(np.count_nonzero(selected(chunk))) for chunk in _chunks(rows)),)]
+    #each key maps to 0 for NULL and 1.. over its range; a combination is then one mixed-radix integer
+    lows, sizes = [], []
+    for key in keys:
+        bounds = _bounds(key, rows)
+        lows.append(bounds[0] - 1 if bounds else 0)
+        sizes.append(bounds[1] - bounds[0] + 2 if bounds else 1)
+    if np.prod(sizes, dtype=float) >= 2 ** 62:
+        raise ValueError("Too many combinations to group by")
+    total = int(np.prod(sizes, dtype=object))
+    dense = total <= DENSE_GROUPS
+    counts = np.zeros(total, dtype=np.int64) if dense else []
+    for chunk in _chunks(rows):
+        chosen = selected(chunk)
+        combined = np.zeros(int(np.count_nonzero(chosen)), dtype=np.int64)
+        for key, low, size in zip(keys, lows, sizes):
+            values = key.get(chunk)[chosen].astype(np.int64)
+            codes = values - low
+            codes[values == key.null] = 0
+            combined = combined * size + codes
+        if dense:
+            counts += np.bincount(combined, minlength=total)
+        else:
+            counts.append(np.unique(combined, return_counts=True))
+    if dense:
+        present = np.nonzero(counts)[0]
+        counts = counts[present]
+    elif counts:
+        present, inverse = np.unique(np.concatenate([c for c, _ in counts]), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate([n for _, n in counts])).astype(np.int64)
+    else:
+        present = counts = np.zeros(0, dtype=np.int64)
+    #largest first, ties in key order; only the groups asked for are decoded
+    order = np.lexsort((present, -counts))[:limit]
+    results = []
+    for code, count in zip(present[order].tolist(), counts[order].tolist()):
+        values = []
+        for key, low, size in zip(reversed(keys), reversed(lows), reversed(sizes)):
+            code, index = divmod(code, size)
+            values.append(None if index == 0 else key.decode(low + index))
+        results.append(tuple(reversed(values)) + (count,))
+    return results
+
+
+class Snapshot:
+    def __init__(self, path=None, bind=None):
+        self.path = path or snapshot_path(bind)
+        self._tables = {}
+
+    def __getitem__(self, name):
+        if name not in TABLES:
+            raise KeyError(f"No table {name}")
+        if name not in self._tables:
+            self._tables[name] = Table(os.path.join(self.path, name))
+        return self._tables[name]
+
+    def count(self, table, by=(), where=None, limit=None):
+        #[(value, ..., count)] of rows grouped by the `by` columns, largest first. by/where take columns of
+        #the table, "date:month"-style date parts, and for cases "detective_id" (one row per assignment)
+        by = [by] if isinstance(by, str) else list(by)
+        where = where or {}
+        source = self[table]
+        if table == "cases" and ("detective_id" in by or "detective_id" in where):
+            return self._count_assignments(source, by, where, limit)
+        keys = [source.key(name) for name in by]
+        return count_keys(source.rows, keys, lambda rows: source.mask(where, rows), limit)
+
+    def _count_assignments(self, cases, by, where, limit):
+        #cases joined to detective_case: each link row takes its case's columns
+        links = self["detective_case"]
+        ids = cases.column("id")
+        position = np.full(int(ids.max()) + 1 if len(ids) else 1, -1, dtype=np.int32)
+        for chunk in _chunks(cases.rows):
+            position[ids[chunk]] = np.arange(chunk.start, chunk.stop, dtype=np.int32)
+
+        def case_rows(rows):
+            #row in cases of each link row (-1 for links to a case not in the snapshot)
+            case_ids = links.column("case_id")[rows]
+            inside = (case_ids >= 0) & (case_ids < len(position))
+            return np.where(inside, position[np.where(inside, case_ids, 0)], -1)
+
+        def selected(rows):
+            found = case_rows(rows)
+            known = found >= 0
+            matched = known & cases.mask({k: v for k, v in where.items() if k != "detective_id"},
+                                         np.where(known, found, 0))
+            if "detective_id" in where:
+                matched &= links.mask({"detective_id": where["detective_id"]}, rows)
+            return matched
+
+        def joined(key):
+            return Key(lambda rows: key.get(np.maximum(case_rows(rows), 0)), key.null, key.decode, key.bounds)
+
+        keys = [links.key(name) if name == "detective_id" else joined(cases.key(name)) for name in by]
+        return count_keys(links.rows, keys, selected, limit)
+
+
+def open_snapshot(path=None, bind=None):
+    return Snapshot(path, bind)
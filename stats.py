@@ -0,0 +1,145 @@
+from sqlalchemy import event, text
+
+from database import Base, engine
+
+#case_stats dimensions: name -> sql bucket expression over a cases row ({row} is new/old/c)
+DIMENSIONS = {
+    "crime_type": "{row}.crime_type",
+    "status": "{row}.status",
+    "month": "strftime('%Y-%m', {row}.date)",
+    "location": "{row}.location",
+}
+
+#every status but this one counts towards a detective's open caseload
+CLOSED_STATUS = "Closed"
+
+TABLES = {
+    "case_stats": "CREATE TABLE IF NOT EXISTS case_stats (dimension TEXT NOT NULL, bucket TEXT NOT NULL, "
+                  "count INTEGER NOT NULL, PRIMARY KEY (dimension, bucket)) WITHOUT ROWID",
+    "detective_open_cases": "CREATE TABLE IF NOT EXISTS detective_open_cases (detective_id INTEGER PRIMARY KEY, "
+                            "open_cases INTEGER NOT NULL)",
+}
+
+#the tables whose rows feed the summaries
+SOURCES = ("cases", "detective_case", "detectives")
+
+
+def _bucket(dimension, row):
+    #NULL buckets (no date, no status) are kept under ''
+    return f"COALESCE({DIMENSIONS[dimension].format(row=row)}, '')"
+
+
+def _is_open(row):
+    return f"({row}.status IS NOT '{CLOSED_STATUS}')"
+
+
+def _bump(dimension, row, delta):
+    return (f"INSERT INTO case_stats (dimension, bucket, count) VALUES ('{dimension}', {_bucket(dimension, row)}, {delta}) "
+            f"ON CONFLICT (dimension, bucket) DO UPDATE SET count = count + excluded.count;")
+
+
+def _drop_empty(dimension, row):
+    return f"DELETE FROM case_stats WHERE dimension = '{dimension}' AND bucket = {_bucket(dimension, row)} AND count <= 0;"
+
+
+def _bump_detectives(case_row, delta):
+    #adds delta to every detective linked to the case
+    return (f"INSERT INTO detective_open_cases (detective_id, open_cases) "
+            f"SELECT detective_id, {delta} FROM detective_case WHERE case_id = {case_row}.id "
+            f"ON CONFLICT (detective_id) DO UPDATE SET open_cases = open_cases + excluded.open_cases;")
+
+
+def _triggers():
+    inserted = " ".join(_bump(d, "new", 1) for d in DIMENSIONS)
+    deleted = " ".join(_bump(d, "old", -1) + " " + _drop_empty(d, "old") for d in DIMENSIONS)
+    columns = ", ".join(["crime_type", "status", "location", "date"])
+    reopened = f"CASE WHEN {_is_open('new')} THEN 1 ELSE -1 END"
+    return {
+        "case_stats_ai": f"AFTER INSERT ON cases BEGIN {inserted} END",
+        "case_stats_ad": f"AFTER DELETE ON cases BEGIN {deleted} END",
+        "case_stats_au": f"AFTER UPDATE OF {columns} ON cases BEGIN {deleted} {inserted} END",
+        #open caseloads move when a link is added or removed, and when a linked case opens or closes.
+        #a case delete is counted before the row goes: with ON DELETE CASCADE the links are removed
+        #after the case, when the link trigger can no longer see its status
+        "detective_open_cases_link_ai":
+            f"AFTER INSERT ON detective_case BEGIN "
+            f"INSERT INTO detective_open_cases (detective_id, open_cases) "
+            f"SELECT new.detective_id, 1 FROM cases c WHERE c.id = new.case_id AND {_is_open('c')} "
+            f"ON CONFLICT (detective_id) DO UPDATE SET open_cases = open_cases + 1; END",
+        "detective_open_cases_link_ad":
+            f"AFTER DELETE ON detective_case BEGIN "
+            f"UPDATE detective_open_cases SET open_cases = open_cases - 1 WHERE detective_id = old.detective_id "
+            f"AND EXISTS (SELECT 1 FROM cases c WHERE c.id = old.case_id AND {_is_open('c')}); END",
+        "detective_open_cases_case_bd":
+            f"BEFORE DELETE ON cases WHEN {_is_open('old')} BEGIN {_bump_detectives('old', -1)} END",
+        "detective_open_cases_case_au":
+            f"AFTER UPDATE OF status ON cases WHEN {_is_open('old')} != {_is_open('new')} BEGIN "
+            f"{_bump_detectives('new', reopened)} END",
+        "detective_open_cases_detective_ad":
+            "AFTER DELETE ON detectives BEGIN DELETE FROM detective_open_cases WHERE detective_id = old.id; END",
+    }
+
+
+def install(conn):
+    #creates the summary tables and their triggers (idempotent); fills the tables the first time.
+    #re-run after a migration rebuilds cases, detective_case or detectives, which drops their triggers
+    existing = {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if not all(table in existing for table in SOURCES):
+        return
+    for ddl in TABLES.values():
+        conn.exec_driver_sql(ddl)
+    for name, body in _triggers().items():
+        conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    if not all(table in existing for table in TABLES):
+        rebuild(conn)
+
+
+def uninstall(conn):
+    for name in _triggers():
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+    for table in TABLES:
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {table}")
+
+
+def rebuild(conn):
+    #recomputes both summaries from scratch (repair after bulk loads with triggers off, etc.)
+    conn.exec_driver_sql("DELETE FROM case_stats")
+    for dimension in DIMENSIONS:
+        bucket = _bucket(dimension, "c")
+        conn.exec_driver_sql(f"INSERT INTO case_stats (dimension, bucket, count) "
+                             f"SELECT '{dimension}', {bucket}, count(*) FROM cases c GROUP BY {bucket}")
+    conn.exec_driver_sql("DELETE FROM detective_open_cases")
+    conn.exec_driver_sql(f"INSERT INTO detective_open_cases (detective_id, open_cases) "
+                         f"SELECT dc.detective_id, count(*) FROM detective_case dc JOIN cases c ON c.id = dc.case_id "
+                         f"WHERE {_is_open('c')} GROUP BY dc.detective_id")
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _install_after_create(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        install(connection)
+
+
+def counts(dimension, limit=None, bind=None):
+    #[(bucket, count)] for one dimension: months in calendar order, everything else largest first
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Unknown dimension: {dimension}")
+    order = "bucket" if dimension == "month" else "count DESC, bucket"
+    with (bind or engine).connect() as conn:
+        rows = conn.execute(text(f"SELECT bucket, count FROM case_stats WHERE dimension = :dimension "
+                                 f"ORDER BY {order} LIMIT :limit"), {"dimension": dimension, "limit": limit or -1})
+        return [tuple(row) for row in rows]
+
+
+def open_cases_by_detective(limit=None, bind=None):
+    #[(detective id, name, open cases)], busiest first
+    with (bind or engine).connect() as conn:
+        rows = conn.execute(text("SELECT d.id, d.name, o.open_cases FROM detective_open_cases o "
+                                 "JOIN detectives d ON d.id = o.detective_id "
+                                 "ORDER BY o.open_cases DESC, d.id LIMIT :limit"), {"limit": limit or -1})
+        return [tuple(row) for row in rows]
+
+
+def refresh(bind=None):
+    with (bind or engine).begin() as conn:
+        rebuild(conn)
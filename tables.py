@@ -0,0 +1,148 @@
+import contextlib
+import csv
+import itertools
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+
+FORMATS = ("grid", "plain", "csv")
+#column widths come from this many leading rows (plus any fixed widths the caller knows), so a listing
+#starts printing without holding the rest of it
+SAMPLE_SIZE = 200
+#longer text is cut to this many characters, ending in "…"
+MAX_WIDTH = 50
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    return str(value).replace("\r", " ").replace("\n", " ")
+
+
+def _numeric(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _layout(headers, sample, widths, max_width):
+    #(width, right-aligned) per column: numbers are right-aligned like tabulate does, text is cut to width
+    layout = []
+    for index, header in enumerate(headers):
+        values = [row[index] for row in sample if row[index] is not None]
+        width = (widths or {}).get(header)
+        if width is None:
+            width = min(max([len(_cell(value)) for value in values], default=0), max_width)
+        layout.append((max(width, len(header)), bool(values) and all(_numeric(value) for value in values)))
+    return layout
+
+
+def _fit(value, width, right):
+    text = _cell(value)
+    #numbers are never cut; one wider than the sample just pushes its row out of line
+    if len(text) > width and not _numeric(value):
+        text = text[:width - 1] + "…"
+    return text.rjust(width) if right else text.ljust(width)
+
+
+def write_table(rows, headers, fmt="grid", out=None, widths=None, sample_size=SAMPLE_SIZE, max_width=MAX_WIDTH):
+    #writes headers and rows (any iterable of sequences, read lazily) as a grid, plain or csv table and
+    #returns how many rows went out. widths ({header: width}) fixes columns whose size is known up front.
+    #stops quietly if the reader goes away (a pager quit, `| head`), closing rows so a generator's query
+    #ends too
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    out = out or sys.stdout
+    source = iter(rows)
+    written = 0
+    try:
+        if fmt == "csv":
+            writer = csv.writer(out, lineterminator="\n")
+            writer.writerow(headers)
+            for row in source:
+                writer.writerow(row)
+                written += 1
+            return written
+
+        sample = list(itertools.islice(source, sample_size))
+        layout = _layout(headers, sample, widths, max_width)
+        if fmt == "plain":
+            out.write("  ".join(_fit(h, w, right) for h, (w, right) in zip(headers, layout)).rstrip() + "\n")
+            for row in itertools.chain(sample, source):
+                out.write("  ".join(_fit(v, w, right) for v, (w, right) in zip(row, layout)).rstrip() + "\n")
+                written += 1
+            return written
+
+        rule = "+" + "+".join("-" * (w + 2) for w, _ in layout) + "+\n"
+        out.write(rule)
+        out.write("| " + " | ".join(_fit(h, w, right) for h, (w, right) in zip(headers, layout)) + " |\n")
+        out.write(rule.replace("-", "="))
+        for row in itertools.chain(sample, source):
+            out.write("| " + " | ".join(_fit(v, w, right) for v, (w, right) in zip(row, layout)) + " |\n")
+            out.write(rule)
+            written += 1
+        return written
+    except BrokenPipeError:
+        if out is sys.stdout:
+            #python would otherwise fail again flushing stdout on exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return written
+    finally:
+        close = getattr(source, "close", None)
+        if close is not None:
+            close()
+
+
+class _Prompter:
+    #the pager when there is no pager program: a screenful at a time, q to stop
+    def __init__(self, out):
+        self.out = out
+        self.lines = 0
+        self.height = max(shutil.get_terminal_size().lines - 1, 5)
+
+    def write(self, text):
+        for line in text.splitlines(keepends=True):
+            if self.lines >= self.height:
+                self.out.flush()
+                if input("-- Enter: more, q: quit -- ").strip().lower() == "q":
+                    raise BrokenPipeError
+                self.lines = 0
+            self.out.write(line)
+            self.lines += line.endswith("\n")
+
+    def flush(self):
+        self.out.flush()
+
+
+@contextlib.contextmanager
+def pager(out=None):
+    #a file to write long output to: $CRIME_PAGER, $PAGER or less when out is a terminal, out itself
+    #otherwise. quitting the pager early surfaces as BrokenPipeError on write, which write_table handles
+    out = out or sys.stdout
+    if not out.isatty():
+        yield out
+        return
+    command = os.environ.get("CRIME_PAGER", os.environ.get("PAGER", "less" if shutil.which("less") else ""))
+    process = None
+    if command.strip():
+        out.flush()
+        #like git: quit at once if it fits on a screen, keep colours, leave the output on screen
+        try:
+            process = subprocess.Popen(shlex.split(command), stdin=subprocess.PIPE, text=True, encoding="utf-8",
+                                       errors="replace", env=dict(os.environ, LESS=os.environ.get("LESS", "FRX")))
+        except OSError:
+            pass
+    if process is None:
+        yield _Prompter(out)
+        return
+    try:
+        yield process.stdin
+    except KeyboardInterrupt:
+        #ctrl-c reaches us as well as the pager; it just means stop
+        pass
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        process.wait()
@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = textwrap.dedent("""
+    import asyncio
+
+    import aio
+    from models import Case, init_db
+
+    init_db()
+
+
+    async def main():
+        await Case.async_find_by_id(1)
+
+
+    async def reconfigured():
+        await Case.async_find_by_id(1)
+        aio.configure()  #replaces the running loop's engine
+        await Case.async_find_by_id(1)
+
+
+    asyncio.run(main())
+    asyncio.run(main())
+    asyncio.run(reconfigured())
+    print("end of script")
+""")
+
+
+def test_asyncio_run_exits(tmp_path):
+    #every loop's aiosqlite connections (each holding a thread) are closed when the loop shuts down
+    env = dict(os.environ, CRIME_DB_URL=f"sqlite:///{tmp_path / 'aio.db'}", PYTHONPATH=ROOT)
+    result = subprocess.run([sys.executable, "-c", SCRIPT], cwd=ROOT, env=env, capture_output=True, text=True,
+                            timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert "end of script" in result.stdout
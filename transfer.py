@@ -0,0 +1,325 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from datetime import date, datetime
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+import geo
+from database import engine
+from models import Case, Suspect, Evidence, Detective, CriminalRecord, detective_case, import_progress, init_db
+
+#parents before children, so foreign keys can be checked against rows already imported
+TABLES = {
+    "cases": Case.__table__,
+    "detectives": Detective.__table__,
+    "suspects": Suspect.__table__,
+    "evidence": Evidence.__table__,
+    "criminal_records": CriminalRecord.__table__,
+    "detective_case": detective_case,
+}
+FORMATS = ("csv", "jsonl")
+CHUNK_SIZE = 5000
+
+
+def _format_for(path, fmt=None):
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}', expected one of: {', '.join(FORMATS)}")
+    return fmt
+
+
+def _table(name):
+    if name not in TABLES:
+        raise ValueError(f"Unknown table '{name}', expected one of: {', '.join(TABLES)}")
+    return TABLES[name]
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+#export
+
+def shard_column(name):
+    #the leading primary key column: ranges of it split a table into pieces that export in key order
+    return _table(name).primary_key.columns.values()[0]
+
+
+def iter_rows(name, chunk_size=CHUNK_SIZE, bind=None, after=None, until=None):
+    #streams a table as dicts through a server-side cursor, chunk_size rows at a time;
+    #after/until limit it to the range (after, until] of the leading key column
+    table = _table(name)
+    stmt = select(table).order_by(*table.primary_key.columns)
+    if after is not None:
+        stmt = stmt.where(shard_column(name) > after)
+    if until is not None:
+        stmt = stmt.where(shard_column(name) <= until)
+    with (bind or engine).connect() as conn:
+        result = conn.execution_options(yield_per=chunk_size).execute(stmt)
+        for partition in result.mappings().partitions():
+            yield from partition
+
+
+def write_rows(out, fmt, columns, rows):
+    #writes rows (without the csv header) to an open file; returns the row count
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(out)
+        for row in rows:
+            writer.writerow(["" if row[c] is None else row[c] for c in columns])
+            count += 1
+    else:
+        for row in rows:
+            out.write(json.dumps({c: row[c] for c in columns}, default=_json_default) + "\n")
+            count += 1
+    return count
+
+
+def export_table(name, path, fmt=None, chunk_size=CHUNK_SIZE, bind=None):
+    #writes a table to a csv or jsonl file; returns the row count
+    fmt = _format_for(path, fmt)
+    columns = [c.name for c in _table(name).columns]
+    with open(path, "w", newline="", encoding="utf-8") as out:
+        if fmt == "csv":
+            csv.writer(out).writerow(columns)
+        return write_rows(out, fmt, columns, iter_rows(name, chunk_size, bind))
+
+
+#import
+
+def _converters(table):
+    #csv gives strings: convert each column to its python type
+    converters = {}
+    for column in table.columns:
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            python_type = str
+        if python_type is date:
+            convert = date.fromisoformat
+        elif python_type in (int, float):
+            convert = python_type
+        else:
+            convert = str
+        converters[column.name] = (convert, column.nullable)
+    return converters
+
+
+def _convert(record, converters):
+    #raises ValueError for values that don't fit their column
+    row = {}
+    for key, value in record.items():
+        if key not in converters:
+            continue
+        convert, nullable = converters[key]
+        if value is None or (value == "" and (convert is not str or nullable)):
+            row[key] = None  #"" is how csv writes NULL
+        elif isinstance(value, str) and convert is not str:
+            row[key] = convert(value)
+        else:
+            row[key] = value
+    return row
+
+
+def _geocode(row):
+    #what the orm does when a case is saved: locate it from its text unless coordinates came with it
+    if row.get("latitude") is None and row.get("longitude") is None and row.get("location"):
+        point = geo.geocode(row["location"])
+        if point is not None:
+            row["latitude"], row["longitude"], row["geo_precision"] = point
+
+
+def read_records(path, fmt=None):
+    #streams raw records (dicts of strings for csv, parsed json for jsonl) out of a file
+    fmt = _format_for(path, fmt)
+    with open(path, newline="", encoding="utf-8") as source:
+        if fmt == "csv":
+            yield from csv.DictReader(source)
+        else:
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _missing_parents(conn, table, rows):
+    #one IN query per foreign key per chunk; returns the indexes of rows pointing at nothing
+    bad = set()
+    for fk in table.foreign_keys:
+        column = fk.parent.name
+        wanted = {row.get(column) for row in rows} - {None}
+        if not wanted:
+            continue
+        parent = fk.column
+        found = set()
+        wanted = list(wanted)
+        for start in range(0, len(wanted), 900):  #stay under sqlite's bound-parameter limit
+            found.update(conn.execute(select(parent).where(parent.in_(wanted[start:start + 900]))).scalars())
+        bad.update(i for i, row in enumerate(rows) if row.get(column) is not None and row[column] not in found)
+    return bad
+
+
+def import_table(name, path, fmt=None, chunk_size=CHUNK_SIZE, resume=True, skip_duplicates=False,
+                 bind=None, progress=None, rejects=None):
+    #loads a csv/jsonl file into a table in chunk_size transactions; rows with unparseable values, foreign
+    #keys pointing at missing parents or constraint violations (a duplicate key, a missing NOT NULL value)
+    #are rejected rather than failing the chunk, and written to rejects (an open file) as json lines.
+    #Returns {"imported", "rejected", "skipped"}; skipped counts rows already imported by an earlier run.
+    #Progress checkpoints advance in the same transaction as each chunk, so an interrupted import resumes
+    #exactly where its last commit left off
+    table = _table(name)
+    bind = bind or engine
+    source = f"{name}:{os.path.abspath(path)}"
+    insert = table.insert().prefix_with("OR IGNORE") if skip_duplicates else table.insert()
+    counts = {"imported": 0, "rejected": 0, "skipped": 0}
+
+    with bind.connect() as conn:
+        done = conn.execute(select(import_progress.c.rows_done).where(import_progress.c.source == source)).scalar()
+    done = done or 0
+    if not resume:
+        done = 0
+    counts["skipped"] = done
+
+    def reject(position, record, reason):
+        counts["rejected"] += 1
+        if rejects is not None:
+            rejects.write(json.dumps({"row": position, "reason": reason, "record": record}, default=_json_default) + "\n")
+
+    def flush(chunk, unconverted, rows_done):
+        with bind.begin() as conn:
+            #the checkpoint goes first: its write opens the transaction the savepoint below nests in
+            conn.execute(import_progress.delete().where(import_progress.c.source == source))
+            conn.execute(import_progress.insert().values(source=source, rows_done=rows_done))
+            bad = _missing_parents(conn, table, [row for _, _, row in chunk])
+            failed = unconverted + [(position, record, "missing parent row")
+                                    for i, (position, record, _) in enumerate(chunk) if i in bad]
+            valid = [entry for i, entry in enumerate(chunk) if i not in bad]
+            inserted = 0
+            try:
+                with conn.begin_nested():
+                    inserted = conn.execute(insert, [row for _, _, row in valid]).rowcount if valid else 0
+            except IntegrityError:
+                #something in the chunk breaks a constraint: insert row by row to find it (a failed
+                #single-row insert undoes only itself)
+                for position, record, row in valid:
+                    try:
+                        inserted += conn.execute(insert, row).rowcount
+                    except IntegrityError as error:
+                        failed.append((position, record, str(error.orig)))
+        #reported once the chunk is committed, so a resumed import does not report its rows twice
+        for position, record, reason in sorted(failed, key=lambda entry: entry[0]):
+            reject(position, record, reason)
+        counts["imported"] += inserted
+        if progress:
+            progress(rows_done, counts)
+
+    converters = _converters(table)
+    #a record without some column inserts NULL there (one without a NOT NULL column is rejected); only
+    #columns with a default are left out, to get it
+    fill = [column.name for column in table.columns if column.default is None and column.server_default is None]
+    chunk, unconverted = [], []
+    position = 0
+    for record in read_records(path, fmt):
+        position += 1
+        if position <= done:
+            continue
+        try:
+            row = dict({column: None for column in fill}, **_convert(record, converters))
+            if table is Case.__table__:
+                _geocode(row)
+            chunk.append((position, record, row))
+        except ValueError as error:
+            unconverted.append((position, record, str(error)))
+        if len(chunk) + len(unconverted) >= chunk_size:
+            flush(chunk, unconverted, position)
+            chunk, unconverted = [], []
+    if chunk or unconverted:
+        flush(chunk, unconverted, position)
+
+    #finished: forget the checkpoint so the same file can be imported again later
+    with bind.begin() as conn:
+        conn.execute(import_progress.delete().where(import_progress.c.source == source))
+    return counts
+
+
+def export_all(directory, fmt="csv", chunk_size=CHUNK_SIZE):
+    os.makedirs(directory, exist_ok=True)
+    return {name: export_table(name, os.path.join(directory, f"{name}.{fmt}"), fmt, chunk_size) for name in TABLES}
+
+
+def import_all(directory, fmt="csv", chunk_size=CHUNK_SIZE, skip_duplicates=False, rejects=None):
+    #imports every table file present in the directory, parents first
+    results = {}
+    for name in TABLES:
+        path = os.path.join(directory, f"{name}.{fmt}")
+        if os.path.exists(path):
+            results[name] = import_table(name, path, fmt, chunk_size, skip_duplicates=skip_duplicates,
+                                         rejects=rejects)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream tables to and from CSV/JSONL files.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    exp = sub.add_parser("export", help="export a table (or 'all' into a directory)")
+    exp.add_argument("table", choices=list(TABLES) + ["all"])
+    exp.add_argument("path")
+    exp.add_argument("--format", choices=FORMATS)
+    exp.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    exp.add_argument("--workers", type=int, default=1, help="export in this many processes (0 = one per core)")
+
+    imp = sub.add_parser("import", help="import a table (or 'all' from a directory)")
+    imp.add_argument("table", choices=list(TABLES) + ["all"])
+    imp.add_argument("path")
+    imp.add_argument("--format", choices=FORMATS)
+    imp.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    imp.add_argument("--restart", action="store_true", help="ignore any saved progress and start from the top")
+    imp.add_argument("--skip-duplicates", action="store_true", help="ignore rows whose key already exists")
+    imp.add_argument("--rejects", metavar="PATH", help="write rejected rows here, one json line each with the reason")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        if args.workers == 1:
+            exporter = sys.modules[__name__]
+            extra = {}
+        else:
+            import parallel
+            exporter = parallel
+            extra = {"workers": args.workers or None}
+        if args.table == "all":
+            for name, count in exporter.export_all(args.path, args.format or "csv", args.chunk_size, **extra).items():
+                print(f"{name}: {count} rows")
+        else:
+            count = exporter.export_table(args.table, args.path, args.format, args.chunk_size, **extra)
+            print(f"{args.table}: {count} rows")
+        return
+
+    init_db()
+    rejects = open(args.rejects, "a", encoding="utf-8") if args.rejects else None
+    try:
+        if args.table == "all":
+            results = import_all(args.path, args.format or "csv", args.chunk_size, args.skip_duplicates, rejects)
+        else:
+            def report(rows_done, counts):
+                print(f"\r{rows_done} rows read", end="", file=sys.stderr, flush=True)
+
+            results = {args.table: import_table(args.table, args.path, args.format, args.chunk_size,
+                                                resume=not args.restart, skip_duplicates=args.skip_duplicates,
+                                                progress=report, rejects=rejects)}
+            print(file=sys.stderr)
+    finally:
+        if rejects is not None:
+            rejects.close()
+    for name, counts in results.items():
+        print(f"{name}: {counts['imported']} imported, {counts['rejected']} rejected, {counts['skipped']} skipped (already imported)")
+
+
+if __name__ == "__main__":
+    main()